@@ -0,0 +1,400 @@
+"""
+Inference backends for the generation loop.
+
+`generate_personas` only needs an object with an async `chat_completion`
+method returning a response shaped like the Hugging Face / OpenAI one
+(`response.choices[0].message.content`, `response.usage`), and for --stream a
+`chat_completion_stream` method returning an async iterator of chunks shaped
+like theirs (`chunk.choices[0].delta.content`, and `chunk.usage` on the last
+one). This module provides the real Hugging Face backend and a local mock that
+returns schema-valid persona JSON with configurable latency, error and
+malformed-output rates, so the pipeline can be tested and benchmarked offline.
+"""
+
+import os
+import json
+import time
+import random
+import asyncio
+import hashlib
+from contextlib import aclosing
+from collections import OrderedDict
+from dataclasses import dataclass
+
+
+# --- Response objects (mirroring the fields of huggingface_hub's ChatCompletionOutput we use) ---
+
+@dataclass
+class ChatMessage:
+    content: str
+    role: str = "assistant"
+
+
+@dataclass
+class ChatChoice:
+    message: ChatMessage
+    index: int = 0
+    finish_reason: str = "stop"
+
+
+@dataclass
+class ChatUsage:
+    prompt_tokens: int
+    completion_tokens: int
+    total_tokens: int
+    prompt_tokens_details: dict | None = None
+
+
+@dataclass
+class ChatCompletion:
+    choices: list[ChatChoice]
+    usage: ChatUsage
+    model: str = ""
+    id: str = ""
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "ChatCompletion":
+        """Builds a response from an OpenAI-style chat completion JSON body."""
+        return cls(
+            choices=[
+                ChatChoice(
+                    message=ChatMessage(**choice["message"]),
+                    index=choice.get("index", 0),
+                    finish_reason=choice.get("finish_reason", "stop"),
+                )
+                for choice in data["choices"]
+            ],
+            usage=ChatUsage(**data["usage"]),
+            model=data.get("model", ""),
+            id=data.get("id", ""),
+        )
+
+
+@dataclass
+class ChatDelta:
+    content: str | None = None
+    role: str | None = None
+
+
+@dataclass
+class ChatStreamChoice:
+    delta: ChatDelta
+    index: int = 0
+    finish_reason: str | None = None
+
+
+@dataclass
+class ChatCompletionChunk:
+    choices: list[ChatStreamChoice]
+    usage: ChatUsage | None = None
+    model: str = ""
+    id: str = ""
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "ChatCompletionChunk":
+        """Builds a chunk from an OpenAI-style chat completion stream event."""
+        return cls(
+            choices=[
+                ChatStreamChoice(
+                    delta=ChatDelta(**choice["delta"]),
+                    index=choice.get("index", 0),
+                    finish_reason=choice.get("finish_reason"),
+                )
+                for choice in data["choices"]
+            ],
+            usage=ChatUsage(**data["usage"]) if data.get("usage") else None,
+            model=data.get("model", ""),
+            id=data.get("id", ""),
+        )
+
+
+def stream_chunks(body: dict, chunk_chars: int | None = None) -> list[dict]:
+    """
+    Splits an OpenAI-style response body into the events of the equivalent stream:
+    the content in pieces of chunk_chars (all at once if None), then a last event
+    with no choices and the usage, as sent with stream_options include_usage.
+    """
+    choice = body["choices"][0]
+    content = choice["message"]["content"] or ""
+    step = chunk_chars or max(1, len(content))
+    pieces = [content[start:start + step] for start in range(0, len(content), step)] or [""]
+    event = lambda choices, usage=None: {"id": body.get("id", ""), "object": "chat.completion.chunk", "model": body.get("model", ""), "choices": choices, "usage": usage}
+    chunks = [event([{"index": 0, "delta": {"content": piece}, "finish_reason": None}]) for piece in pieces]
+    chunks[-1]["choices"][0]["finish_reason"] = choice.get("finish_reason")
+    chunks.append(event([], body.get("usage")))
+    return chunks
+
+
+def completion_to_dict(response) -> dict:
+    """OpenAI-style JSON body of a chat completion response (a ChatCompletion or huggingface_hub's output)."""
+    usage = getattr(response, "usage", None)
+    details = getattr(usage, "prompt_tokens_details", None)
+    cached = details.get("cached_tokens") if isinstance(details, dict) else getattr(details, "cached_tokens", None)
+    prompt_tokens = getattr(usage, "prompt_tokens", 0) or 0
+    completion_tokens = getattr(usage, "completion_tokens", 0) or 0
+    return {
+        "id": getattr(response, "id", "") or "",
+        "model": getattr(response, "model", "") or "",
+        "choices": [
+            {
+                "index": choice.index,
+                "message": {"role": choice.message.role, "content": choice.message.content},
+                "finish_reason": choice.finish_reason,
+            }
+            for choice in response.choices
+        ],
+        "usage": {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+            "prompt_tokens_details": {"cached_tokens": cached or 0},
+        },
+    }
+
+
+class BackendError(Exception):
+    """An API error carrying an HTTP-like status code."""
+
+    def __init__(self, message: str, status_code: int):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+# --- Backends ---
+
+class HFInferenceBackend:
+    """Hugging Face Inference Providers through `AsyncInferenceClient`."""
+
+    def __init__(self, provider: str = "together", api_key: str | None = None, base_url: str | None = None, timeout: float | None = None):
+        # Imported lazily so offline runs (mock backend, benchmarks) do not need the package
+        from huggingface_hub import AsyncInferenceClient
+
+        api_key = api_key or os.environ.get("HF_TOKEN")
+        if base_url:
+            # OpenAI-compatible server, e.g. a local mock_server.py
+            self.name = base_url
+            self.client = AsyncInferenceClient(base_url=base_url, api_key=api_key or "-", timeout=timeout)
+            return
+        if api_key is None:
+            raise ValueError("Missing Hugging Face token. Please set the HF_TOKEN environment variable.")
+        self.name = provider
+        # Without a timeout, a hung call never raises, and never reaches the retry and backoff path
+        self.client = AsyncInferenceClient(provider=provider, api_key=api_key, timeout=timeout)
+
+    async def chat_completion(self, **kwargs):
+        return await self.client.chat_completion(**kwargs)
+
+    async def chat_completion_stream(self, **kwargs):
+        # Closing the stream early (aclose) drops the connection, so the provider stops generating
+        stream = await self.client.chat_completion(stream=True, stream_options={"include_usage": True}, **kwargs)
+        async with aclosing(stream):
+            async for chunk in stream:
+                yield chunk
+
+
+def parse_latency_spec(spec: str):
+    """
+    Parses a latency distribution spec into a sampler taking a random.Random and returning seconds.
+    Supported: "constant:S", "uniform:LO,HI", "exponential:MEAN", "lognormal:MEDIAN,SIGMA".
+    """
+    kind, _, params = spec.partition(":")
+    values = [float(v) for v in params.split(",") if v]
+    if kind == "constant" and len(values) == 1:
+        return lambda rng: values[0]
+    if kind == "uniform" and len(values) == 2:
+        return lambda rng: rng.uniform(values[0], values[1])
+    if kind == "exponential" and len(values) == 1:
+        return lambda rng: rng.expovariate(1 / values[0])
+    if kind == "lognormal" and len(values) == 2:
+        median, sigma = values
+        return lambda rng: median * rng.lognormvariate(0, sigma)
+    raise ValueError(f"Invalid latency spec '{spec}'.")
+
+
+_MOCK_WORDS = (
+    "quiet retired night shift nurse garden city loud weekend baker crypto dog rescue small town "
+    "marathon vinyl teacher budget spreadsheet divorce startup farm church choir bowling league "
+    "podcast late tired sarcastic gentle blunt anime fishing truck coffee rent landlord guitar "
+    "grandkids overtime bilingual chess forum meme typo emoji caps lowercase punctuation voice notes"
+).split()
+
+
+class MockBackend:
+    """
+    Local stand-in for a chat completion provider.
+
+    Each call sleeps for a latency drawn from the configured distribution (plus
+    `prefill_latency` seconds per uncached prompt token and `token_latency`
+    seconds per completion token), then either raises a BackendError (429 or
+    503), returns malformed output, or returns schema-valid persona JSON: a
+    single persona, or a {"personas": [...]} batch when the response format
+    asks for one. A `ramble_rate` share of personas get a background that runs
+    on far past its length limit, like a model ignoring it, and output longer
+    than max_tokens is cut off there. The prompt only feeds the token counts,
+    so the mock costs almost no CPU.
+
+    Streamed calls send the first chunk after the base latency and prefill, then
+    STREAM_CHUNK_CHARS characters every time that many tokens are generated.
+
+    Like real providers, the mock keeps an LRU cache of prompt prefixes in
+    fixed-size blocks and reports cache hits as `cached_tokens`.
+    """
+
+    CACHE_BLOCK_CHARS = 64  # About 16 tokens, a typical KV cache block
+    CACHE_MAX_BLOCKS = 100_000
+    STREAM_CHUNK_CHARS = 32  # About 8 tokens per stream event
+
+    def __init__(
+        self,
+        latency: str = "lognormal:1.5,0.4",
+        error_rate: float = 0.0,
+        malformed_rate: float = 0.0,
+        seed: int | None = None,
+        token_latency: float = 0.0,
+        prefill_latency: float = 0.0,
+        ramble_rate: float = 0.0,
+    ):
+        self.name = "mock"
+        self.latency_spec = latency
+        self._sample_latency = parse_latency_spec(latency)
+        self.token_latency = token_latency
+        self.prefill_latency = prefill_latency
+        self._prefix_cache: OrderedDict[bytes, None] = OrderedDict()
+        self.error_rate = error_rate
+        self.malformed_rate = malformed_rate
+        self.ramble_rate = ramble_rate
+        self.rng = random.Random(seed)
+        self.calls = 0
+
+    @staticmethod
+    def count_tokens(text: str) -> int:
+        """Rough token estimate (about 4 characters per token)."""
+        return max(1, len(text) // 4)
+
+    def sample_latency(self) -> float:
+        return max(0.0, self._sample_latency(self.rng))
+
+    def response_latency(self, body: dict) -> float:
+        """Latency of a response: sampled base latency plus prefill and generation time of its tokens."""
+        return self.first_token_latency(body) + self.token_latency * body["usage"]["completion_tokens"]
+
+    def first_token_latency(self, body: dict) -> float:
+        """Sampled base latency plus prefill time of the uncached prompt tokens."""
+        usage = body["usage"]
+        uncached = usage["prompt_tokens"] - usage["prompt_tokens_details"]["cached_tokens"]
+        return self.sample_latency() + self.prefill_latency * uncached
+
+    def cached_prompt_chars(self, messages: list[dict]) -> int:
+        """
+        Returns how many leading characters of the prompt were already cached, and
+        caches its full blocks. A block only hits if every block before it did.
+        """
+        text = "".join(f"{m.get('role')}:{m.get('content') or ''}\n" for m in messages)
+        block = self.CACHE_BLOCK_CHARS
+        chain = hashlib.blake2b(digest_size=16)
+        cached, hit = 0, True
+        for start in range(0, len(text) - block + 1, block):
+            chain.update(text[start:start + block].encode("utf-8"))
+            key = chain.digest()
+            if hit and key in self._prefix_cache:
+                cached += block
+                self._prefix_cache.move_to_end(key)
+            else:
+                hit = False
+                self._prefix_cache[key] = None
+        while len(self._prefix_cache) > self.CACHE_MAX_BLOCKS:
+            self._prefix_cache.popitem(last=False)
+        return cached
+
+    @staticmethod
+    def requested_batch_size(response_format: dict | None) -> int | None:
+        """Returns the batch size if the response format asks for a {"personas": [...]} array."""
+        try:
+            return response_format["json_schema"]["schema"]["properties"]["personas"]["minItems"]
+        except (KeyError, TypeError):
+            return None
+
+    def fake_persona(self) -> dict:
+        rng = self.rng
+        words = lambda n: " ".join(rng.choice(_MOCK_WORDS) for _ in range(n))
+        if self.ramble_rate and rng.random() < self.ramble_rate:
+            background = f"{words(400)}."
+        else:
+            background = f"{words(18)} {rng.random():.6f}."[:300]
+        return {
+            "name": f"Mock {rng.choice(_MOCK_WORDS).title()} {rng.randrange(10**6)}",
+            "username": rng.choice([None, f"mock_{rng.randrange(10**6)}"]),
+            "age": rng.randint(19, 75),
+            "traits": rng.sample(_MOCK_WORDS, rng.randint(3, 6)),
+            "background": background,
+            "chatting_style": f"{words(8)} {rng.random():.6f}."[:120],
+        }
+
+    def completion_content(self, response_format: dict | None = None) -> str:
+        """Returns the assistant message content for one call (valid or malformed)."""
+        batch_size = self.requested_batch_size(response_format)
+        items = [self.fake_persona() for _ in range(batch_size or 1)]
+        malformed = self.rng.random() < self.malformed_rate
+        if malformed and self.rng.random() < 0.5:
+            # A schema violation in one item, like real models produce
+            del self.rng.choice(items)["age"]
+            malformed = False
+        content = json.dumps(items[0] if batch_size is None else {"personas": items}, ensure_ascii=False)
+        if malformed:
+            # Truncated JSON
+            return content[: self.rng.randrange(1, len(content))]
+        return content
+
+    def maybe_fail(self):
+        if self.rng.random() < self.error_rate:
+            status = self.rng.choice([429, 503])
+            raise BackendError(f"Mock provider error {status}", status_code=status)
+
+    def completion_body(self, messages: list[dict], model: str, response_format: dict | None = None, max_tokens: int | None = None, **kwargs) -> dict:
+        """Builds an OpenAI-style response body for a request."""
+        self.calls += 1
+        content = self.completion_content(response_format)
+        finish_reason = "stop"
+        if max_tokens is not None and self.count_tokens(content) > max_tokens:
+            content, finish_reason = content[:4 * max_tokens], "length"
+        prompt_tokens = sum(self.count_tokens(m.get("content") or "") for m in messages)
+        cached_tokens = min(prompt_tokens, self.cached_prompt_chars(messages) // 4)
+        completion_tokens = self.count_tokens(content)
+        return {
+            "id": f"mock-{self.calls}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": finish_reason}],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+                "prompt_tokens_details": {"cached_tokens": cached_tokens},
+            },
+        }
+
+    async def chat_completion(self, *, messages: list[dict], model: str = "mock", response_format: dict | None = None, **kwargs) -> ChatCompletion:
+        body = self.completion_body(messages, model, response_format, **kwargs)
+        await asyncio.sleep(self.response_latency(body))
+        self.maybe_fail()
+        return ChatCompletion.from_dict(body)
+
+    async def chat_completion_stream(self, *, messages: list[dict], model: str = "mock", response_format: dict | None = None, **kwargs):
+        body = self.completion_body(messages, model, response_format, **kwargs)
+        await asyncio.sleep(self.first_token_latency(body))
+        self.maybe_fail()
+        for chunk in stream_chunks(body, self.STREAM_CHUNK_CHARS):
+            if self.token_latency and chunk["choices"]:
+                await asyncio.sleep(self.token_latency * self.count_tokens(chunk["choices"][0]["delta"]["content"]))
+            yield ChatCompletionChunk.from_dict(chunk)
+
+
+def make_backend(name: str, **options):
+    """Creates a backend by name ("hf" or "mock"), ignoring options that are None."""
+    options = {key: value for key, value in options.items() if value is not None}
+    if name == "hf":
+        return HFInferenceBackend(**options)
+    if name == "mock":
+        return MockBackend(**options)
+    raise ValueError(f"Unknown backend '{name}'.")
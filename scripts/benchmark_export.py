@@ -0,0 +1,160 @@
+#!/usr/bin/env -S uv run --script
+#
+# /// script
+# requires-python = ">=3.12"
+# dependencies = [
+#   "pyarrow"
+# ]
+# ///
+"""
+Size and load-time benchmark of the columnar export in export.uv.py against JSONL.
+
+Exports a processed JSONL file (or a synthetic one built from the mock backend's
+fake personas) and reports, per format, the on-disk size and the time to:
+  - load everything (json.loads per line, pq.read_table, or a memory-mapped Arrow read),
+  - load two columns only (age, model),
+  - load the personas aged 60 and over (Parquet skips row groups using the age statistics).
+Run from the repository root:
+
+    ./scripts/benchmark_export.py --n 200000
+    ./scripts/benchmark_export.py --input data/processed/processed_personas.jsonl
+"""
+
+import os
+import json
+import time
+import argparse
+import tempfile
+import statistics
+import importlib.util
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from backends import MockBackend
+
+
+def load_export_module():
+    """Imports export.uv.py (its name is not a valid module name)."""
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "export.uv.py")
+    spec = importlib.util.spec_from_file_location("export", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def write_synthetic_jsonl(path, n, seed):
+    """Writes n fake processed personas, sorted into a few models."""
+    backend = MockBackend(seed=seed)
+    models = ["Qwen3-235B-A22B-Instruct-2507", "Llama-3.3-70B-Instruct", "gpt-oss-120b"]
+    with open(path, 'w', encoding='utf-8') as f:
+        for i in range(n):
+            persona = backend.fake_persona()
+            persona["model"] = models[i % len(models)]
+            persona["id"] = f"{i:032x}"
+            f.write(json.dumps(persona, ensure_ascii=False) + '\n')
+
+
+def timed(fn, repeat):
+    """Returns the median wall time of fn() over `repeat` runs, and its last result."""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times), result
+
+
+def load_jsonl(path, columns=None, min_age=None):
+    rows = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            persona = json.loads(line)
+            if min_age is not None and (persona.get("age") or 0) < min_age:
+                continue
+            rows.append({c: persona.get(c) for c in columns} if columns else persona)
+    return len(rows)
+
+
+def load_arrow(directory, columns=None, min_age=None):
+    tables = []
+    for name in sorted(os.listdir(directory)):
+        with pa.memory_map(os.path.join(directory, name)) as source:
+            table = pa.ipc.open_file(source).read_all()
+        if columns:
+            table = table.select(columns)
+        tables.append(table)
+    table = pa.concat_tables(tables)
+    if min_age is not None:
+        table = table.filter(pc.field("age") >= min_age)
+    return table.num_rows
+
+
+def load_parquet(directory, columns=None, min_age=None):
+    filters = [("age", ">=", min_age)] if min_age is not None else None
+    return pq.read_table(directory, columns=columns, filters=filters).num_rows
+
+
+def directory_size(directory):
+    return sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark Parquet / Arrow IPC export against JSONL.")
+    parser.add_argument("--input", type=str, default=None, help="Processed .jsonl file. Defaults to a synthetic file of --n personas.")
+    parser.add_argument("--n", type=int, default=100_000, help="Synthetic personas to generate when --input is not given.")
+    parser.add_argument("--shard_max_bytes", type=int, default=None, help="Parquet shard size bound (defaults to export.uv.py's).")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per measurement (the median is reported).")
+    parser.add_argument("--min_age", type=int, default=60, help="Age filter for the filtered load.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=str, default=None, help="Optional path for a JSON report.")
+    args = parser.parse_args()
+
+    export = load_export_module()
+    with tempfile.TemporaryDirectory() as workdir:
+        jsonl_path = args.input
+        if jsonl_path is None:
+            jsonl_path = os.path.join(workdir, "personas.jsonl")
+            write_synthetic_jsonl(jsonl_path, args.n, args.seed)
+
+        export_dir = os.path.join(workdir, "export")
+        export_seconds, summary = timed(
+            lambda: export.export_personas(jsonl_path, export_dir, ("parquet", "arrow"), args.shard_max_bytes or export.SHARD_MAX_BYTES),
+            1,
+        )
+        print(f"Benchmarking {summary['rows']} personas ({len(summary['shards'])} shard(s), export took {export_seconds:.1f}s)\n")
+
+        loaders = {
+            "jsonl": (lambda **kw: load_jsonl(jsonl_path, **kw), os.path.getsize(jsonl_path)),
+            "parquet": (lambda **kw: load_parquet(os.path.join(export_dir, "parquet"), **kw), directory_size(os.path.join(export_dir, "parquet"))),
+            "arrow": (lambda **kw: load_arrow(os.path.join(export_dir, "arrow"), **kw), directory_size(os.path.join(export_dir, "arrow"))),
+        }
+        header = f"{'format':>8} {'size MB':>8} {'ratio':>6} {'full load':>10} {'2 columns':>10} {f'age>={args.min_age}':>10}"
+        print(header)
+        print("-" * len(header))
+        results = []
+        jsonl_size = loaders["jsonl"][1]
+        for name, (load, size) in loaders.items():
+            full, rows = timed(lambda: load(), args.repeat)
+            columns, _ = timed(lambda: load(columns=["age", "model"]), args.repeat)
+            filtered, filtered_rows = timed(lambda: load(min_age=args.min_age), args.repeat)
+            results.append({
+                "format": name,
+                "bytes": size,
+                "rows": rows,
+                "full_load_s": round(full, 4),
+                "columns_load_s": round(columns, 4),
+                "filtered_load_s": round(filtered, 4),
+                "filtered_rows": filtered_rows,
+            })
+            print(f"{name:>8} {size / 1e6:>8.1f} {size / jsonl_size:>6.2f} {full:>9.3f}s {columns:>9.3f}s {filtered:>9.3f}s")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"config": vars(args), "results": results}, f, indent=2)
+        print(f"\nReport saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
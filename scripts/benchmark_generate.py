@@ -0,0 +1,177 @@
+#!/usr/bin/env -S uv run --script
+#
+# /// script
+# requires-python = ">=3.12"
+# dependencies = [
+#   "numpy",
+#   "pydantic"
+# ]
+# ///
+"""
+Throughput benchmark for the generation loop in generate.uv.py.
+
+Runs the real `main()` scheduler against the mock backend at several concurrency
+levels (plus the adaptive limiter) and batch sizes, and reports, for each run:
+  - personas/sec, and efficiency against the ideal concurrency / mean latency,
+  - input tokens, prefix-cached input share and wall-clock time per persona
+    (to compare batch sizes and prompt layouts),
+  - scheduler overhead: CPU time spent per persona outside the simulated API calls,
+    and event-loop lag (observed call time minus sampled latency),
+  - request latency p50/p99/p99.9 as seen by generate_one_persona.
+No tokens are spent. Run from the repository root:
+
+    ./scripts/benchmark_generate.py --levels 1 8 32 128 --n 2000
+    ./scripts/benchmark_generate.py --levels 32 --batch_sizes 1 4 8 --no_adaptive
+    ./scripts/benchmark_generate.py --levels 32 --prompt_layouts legacy prefix --no_adaptive
+"""
+
+import os
+import io
+import json
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+import contextlib
+import importlib.util
+
+from backends import ChatCompletion, MockBackend
+from concurrency import percentile
+
+
+def load_generate_module():
+    """Imports generate.uv.py (its name is not a valid module name)."""
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "generate.uv.py")
+    spec = importlib.util.spec_from_file_location("generate", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+class TimedMockBackend(MockBackend):
+    """MockBackend that records sampled vs observed latency for every call."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.observed: list[float] = []
+        self.lag: list[float] = []
+        self.prompt_tokens = 0
+        self.cached_tokens = 0
+        self.completion_tokens = 0
+
+    async def chat_completion(self, *, messages, model="mock", response_format=None, **kwargs):
+        body = self.completion_body(messages, model, response_format, **kwargs)
+        latency = self.response_latency(body)
+        start = time.perf_counter()
+        await asyncio.sleep(latency)
+        elapsed = time.perf_counter() - start
+        self.observed.append(elapsed)
+        self.lag.append(max(0.0, elapsed - latency))
+        self.maybe_fail()
+        self.prompt_tokens += body["usage"]["prompt_tokens"]
+        self.cached_tokens += body["usage"]["prompt_tokens_details"]["cached_tokens"]
+        self.completion_tokens += body["usage"]["completion_tokens"]
+        return ChatCompletion.from_dict(body)
+
+
+def run_level(generate, level: int | None, batch_size: int, layout: str, args) -> dict:
+    """Runs one benchmark; level=None uses the adaptive limiter starting at args.adaptive_start."""
+    backend = TimedMockBackend(args.latency, args.error_rate, args.malformed_rate, args.seed, args.token_latency, args.prefill_latency)
+    random.seed(args.seed)
+
+    generate.TARGET_N = args.n
+    generate.SEED = args.seed
+    generate.BATCH_SIZE = batch_size
+    generate.PROMPT_LAYOUT = layout
+    generate.STATS_EVERY = 10 ** 9
+    generate.RETRY_BASE_DELAY = args.retry_base_delay
+    generate.NOVELTY_THRESHOLD = None if args.no_novelty else generate.NOVELTY_THRESHOLD
+    generate.METRICS_DIR = None
+    if level is None:
+        generate.CONCURRENCY, generate.MIN_CONCURRENCY, generate.MAX_CONCURRENCY = args.adaptive_start, 1, args.adaptive_max
+    else:
+        generate.CONCURRENCY = generate.MIN_CONCURRENCY = generate.MAX_CONCURRENCY = level
+
+    with tempfile.TemporaryDirectory() as output_dir, contextlib.redirect_stdout(io.StringIO()):
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+        asyncio.run(generate.main(backend, output_dir=output_dir))
+        wall, cpu = time.perf_counter() - wall_start, time.process_time() - cpu_start
+
+    mean_latency = sum(backend.observed) / len(backend.observed)
+    throughput = args.n / wall
+    result = {
+        "concurrency": "adaptive" if level is None else level,
+        "batch_size": batch_size,
+        "prompt_layout": layout,
+        "personas": args.n,
+        "requests": backend.calls,
+        "wall_seconds": round(wall, 3),
+        "personas_per_sec": round(throughput, 2),
+        "input_tokens_per_persona": round(backend.prompt_tokens / args.n, 1),
+        "cached_input_share": round(backend.cached_tokens / backend.prompt_tokens, 3) if backend.prompt_tokens else 0.0,
+        "output_tokens_per_persona": round(backend.completion_tokens / args.n, 1),
+        "cpu_us_per_persona": round(1e6 * cpu / args.n, 1),
+        "loop_lag_p99_ms": round(1000 * percentile(backend.lag, 99), 2),
+        "latency_p50_s": round(percentile(backend.observed, 50), 3),
+        "latency_p99_s": round(percentile(backend.observed, 99), 3),
+        "latency_p999_s": round(percentile(backend.observed, 99.9), 3),
+    }
+    if level is not None:
+        # Little's law: with `level` requests always in flight, the best case is level / mean latency requests/sec
+        ideal = level / mean_latency * (args.n / backend.calls)
+        result["efficiency"] = round(throughput / ideal, 3)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the persona generation loop against a mock backend.")
+    parser.add_argument("--levels", type=int, nargs="+", default=[1, 8, 32, 128], help="Fixed concurrency levels to benchmark.")
+    parser.add_argument("--n", type=int, default=1000, help="Personas to generate per run.")
+    parser.add_argument("--batch_sizes", type=int, nargs="+", default=[1], help="Personas per API call to benchmark.")
+    parser.add_argument("--latency", type=str, default="lognormal:0.2,0.5", help="Mock latency distribution (see backends.parse_latency_spec).")
+    parser.add_argument("--prompt_layouts", nargs="+", choices=["prefix", "legacy"], default=["prefix"], help="Prompt layouts to benchmark.")
+    parser.add_argument("--token_latency", type=float, default=0.0005, help="Mock seconds per completion token.")
+    parser.add_argument("--prefill_latency", type=float, default=0.0001, help="Mock seconds per uncached prompt token.")
+    parser.add_argument("--error_rate", type=float, default=0.0)
+    parser.add_argument("--malformed_rate", type=float, default=0.0)
+    parser.add_argument("--retry_base_delay", type=float, default=0.05, help="Backoff base in seconds, scaled down to match the mock latency.")
+    parser.add_argument("--no_adaptive", action="store_true", help="Skip the adaptive limiter run.")
+    parser.add_argument("--adaptive_start", type=int, default=20)
+    parser.add_argument("--adaptive_max", type=int, default=256)
+    parser.add_argument("--no_novelty", action="store_true", help="Disable the novelty gate.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=str, default=None, help="Optional path for a JSON report.")
+    args = parser.parse_args()
+
+    generate = load_generate_module()
+    levels = list(args.levels) + ([] if args.no_adaptive else [None])
+
+    print(f"Benchmarking {args.n} personas per run, mock latency {args.latency}, error rate {args.error_rate}, malformed rate {args.malformed_rate}\n")
+    header = (
+        f"{'concurrency':>11} {'batch':>5} {'layout':>6} {'personas/s':>10} {'efficiency':>10} {'in tok/p':>8} {'cached':>6} {'s/p':>7} "
+        f"{'cpu us/p':>9} {'lag p99':>9} {'p50':>7} {'p99':>7} {'p99.9':>7}"
+    )
+    print(header)
+    print("-" * len(header))
+    results = []
+    for layout in args.prompt_layouts:
+        for batch_size in args.batch_sizes:
+            for level in levels:
+                result = run_level(generate, level, batch_size, layout, args)
+                results.append(result)
+                print(
+                    f"{result['concurrency']:>11} {batch_size:>5} {layout:>6} {result['personas_per_sec']:>10.2f} {result.get('efficiency', float('nan')):>10.3f} "
+                    f"{result['input_tokens_per_persona']:>8.0f} {result['cached_input_share']:>6.0%} {result['wall_seconds'] / args.n:>7.4f} "
+                    f"{result['cpu_us_per_persona']:>9.1f} {result['loop_lag_p99_ms']:>7.2f}ms "
+                    f"{result['latency_p50_s']:>6.3f}s {result['latency_p99_s']:>6.3f}s {result['latency_p999_s']:>6.3f}s"
+                )
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"config": vars(args), "results": results}, f, indent=2)
+        print(f"\nReport saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
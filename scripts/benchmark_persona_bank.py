@@ -0,0 +1,166 @@
+#!/usr/bin/env -S uv run --script
+#
+# /// script
+# requires-python = ">=3.12"
+# dependencies = [
+#   "numpy",
+#   "pyarrow"
+# ]
+# ///
+"""
+Startup, memory and query benchmark of the indexed persona bank (persona_bank.py)
+against scanning the processed JSONL.
+
+Indexes a processed JSONL file (or a synthetic one built from the mock backend's
+fake personas, as in benchmark_export.py), then, in a fresh process so startup
+and memory are measured cold, reports the time to open the bank, the resident
+memory it adds (private, and mapped file pages), the latency of lookups by id
+and of filtered (and weighted) samples of 16 personas, and the same filtered
+sample done by a full scan. Run from the repository root:
+
+    ./scripts/benchmark_persona_bank.py --n 1000000
+    ./scripts/benchmark_persona_bank.py --input data/processed/processed_personas.jsonl
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import resource
+import tempfile
+import subprocess
+
+import numpy as np
+
+from benchmark_export import write_synthetic_jsonl
+from persona_bank import PersonaBank, build_index, normalize_trait
+
+SAMPLE_SIZE = 16  # Personas per sample
+
+
+def rss_mb():
+    """
+    Resident memory of this process in MB: private (heap and arrays) and file-backed
+    (pages of the memory-mapped JSONL and index, shared with the page cache and
+    reclaimable). Linux only; elsewhere, the peak resident size as private memory.
+    """
+    try:
+        with open("/proc/self/status", encoding="utf-8") as f:
+            status = dict(line.split(":", 1) for line in f)
+        return {kind: int(status[f"Rss{kind.title()}"].split()[0]) / 1024 for kind in ("anon", "file")}
+    except OSError:
+        return {"anon": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, "file": 0.0}
+
+
+def per_call(fn, calls):
+    """Mean wall time of fn(i) over `calls` calls."""
+    start = time.perf_counter()
+    for i in range(calls):
+        fn(i)
+    return (time.perf_counter() - start) / calls
+
+
+def scan_sample(path, k, traits, age, seed):
+    """The baseline: parse every line, filter, then sample."""
+    matching = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            persona = json.loads(line)
+            if age[0] <= (persona.get("age") or -1) <= age[1] and set(traits) <= {normalize_trait(t) for t in persona.get("traits") or ()}:
+                matching.append(persona)
+    return random.Random(seed).sample(matching, min(k, len(matching)))
+
+
+def run_queries(path, calls, seed):
+    """Measured in a fresh process: open the bank, then time lookups and samples."""
+    rng = random.Random(seed)
+    baseline_rss = rss_mb()
+    added_rss = lambda: {kind: mb - baseline_rss[kind] for kind, mb in rss_mb().items()}
+    start = time.perf_counter()
+    bank = PersonaBank(path)
+    open_seconds = time.perf_counter() - start
+
+    common = list(bank.trait_counts())
+    traits = common[:1]
+    age = (30, 45)
+    rows = [rng.randrange(len(bank)) for _ in range(calls)]
+    ids = [bank[row]["id"] for row in rows[:calls]]
+    weights = np.asarray(bank.ages, dtype=np.float64).clip(0)  # e.g. favoring older personas
+
+    queries = {
+        "get by row": lambda i: bank[rows[i]],
+        "get by id": lambda i: bank.get(ids[i]),
+        f"sample, trait '{traits[0]}' + age {age[0]}-{age[1]}": lambda i: bank.sample(SAMPLE_SIZE, traits=traits, age=age, seed=i),
+        f"sample, 2 traits": lambda i: bank.sample(SAMPLE_SIZE, traits=common[1:3], seed=i),
+        f"sample, age {age[0]}-{age[1]}": lambda i: bank.sample(SAMPLE_SIZE, age=age, seed=i),
+        f"sample, model '{bank.models[0]}'": lambda i: bank.sample(SAMPLE_SIZE, model=bank.models[0], seed=i),
+        "weighted sample, all": lambda i: bank.sample(SAMPLE_SIZE, weights=weights, seed=i),
+    }
+    latencies, rss = {}, {}
+    for name, fn in queries.items():
+        latencies[name] = per_call(fn, calls if name.startswith("get") else max(1, calls // 20))
+        if name == "get by id":
+            rss["after lookups"] = added_rss()
+    rss["after samples"] = added_rss()
+    start = time.perf_counter()
+    scan_sample(path, SAMPLE_SIZE, traits, age, seed)
+    latencies[f"full scan, trait '{traits[0]}' + age {age[0]}-{age[1]}"] = time.perf_counter() - start
+    return {
+        "rows": len(bank),
+        "open_s": open_seconds,
+        "rss_mb": rss,
+        "latency_s": latencies,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the indexed persona bank against scanning the JSONL.")
+    parser.add_argument("--input", type=str, default=None, help="Processed .jsonl file. Defaults to a synthetic file of --n personas.")
+    parser.add_argument("--n", type=int, default=200_000, help="Synthetic personas to generate when --input is not given.")
+    parser.add_argument("--calls", type=int, default=2000, help="Lookups per measurement (samples use a twentieth).")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=str, default=None, help="Optional path for a JSON report.")
+    parser.add_argument("--query_only", type=str, default=None, help=argparse.SUPPRESS)  # Internal: the measuring subprocess
+    args = parser.parse_args()
+
+    if args.query_only:
+        print(json.dumps(run_queries(args.query_only, args.calls, args.seed)))
+        return
+
+    with tempfile.TemporaryDirectory() as workdir:
+        jsonl_path = args.input
+        if jsonl_path is None:
+            jsonl_path = os.path.join(workdir, "personas.jsonl")
+            start = time.perf_counter()
+            write_synthetic_jsonl(jsonl_path, args.n, args.seed)
+            print(f"Generated {args.n} synthetic personas in {time.perf_counter() - start:.1f}s")
+
+        start = time.perf_counter()
+        builder = build_index(jsonl_path)
+        build_seconds = time.perf_counter() - start
+        index_bytes = sum(entry.stat().st_size for entry in os.scandir(builder.directory))
+        print(f"Indexed {len(builder)} personas ({os.path.getsize(jsonl_path) / 1e6:.0f} MB) in {build_seconds:.1f}s; index: {index_bytes / 1e6:.0f} MB")
+
+        command = [sys.executable, os.path.abspath(__file__), "--query_only", jsonl_path, "--calls", str(args.calls), "--seed", str(args.seed)]
+        result = json.loads(subprocess.run(command, check=True, capture_output=True, text=True).stdout)
+
+    print(f"Open: {result['open_s'] * 1000:.1f} ms")
+    for when, mb in result["rss_mb"].items():
+        print(f"Resident memory added {when}: {mb['anon']:.1f} MB private, {mb['file']:.1f} MB of mapped file pages")
+    print()
+    width = max(len(name) for name in result["latency_s"])
+    print(f"{'query':<{width}} {'latency':>10}")
+    print("-" * (width + 11))
+    for name, seconds in result["latency_s"].items():
+        print(f"{name:<{width}} {seconds * 1000:>8.3f}ms")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"config": vars(args), "build_s": build_seconds, "index_bytes": index_bytes, **result}, f, indent=2)
+        print(f"\nReport saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
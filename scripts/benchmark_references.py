@@ -0,0 +1,130 @@
+#!/usr/bin/env -S uv run --script
+#
+# /// script
+# requires-python = ">=3.12"
+# dependencies = [
+#   "numpy"
+# ]
+# ///
+"""
+Diversity and cost benchmark for reference selection (references.py).
+
+Streams a persona corpus through a ReferencePool, as the generation loop does,
+and every --window personas picks a reference set with each strategy:
+  - random:  a seed anchor plus random personas among the 20 most recent (the old behavior),
+  - diverse: a seed anchor plus farthest-point picks over the MinHash sketches.
+For each, it reports the mean and worst pairwise similarity within the sets
+(estimated Jaccard over 128-permutation signatures, lower is more diverse), the
+time per selection, and the memory held by the pool. Without --input, the
+corpus is built from the building blocks in data/seed, so personas sharing a
+profession or life context share text, like real near-themes. Run from the
+repository root:
+
+    ./scripts/benchmark_references.py --n 20000
+    ./scripts/benchmark_references.py --input data/processed/processed_personas.jsonl
+
+To compare the diversity of generated output itself, run generate.uv.py with
+--reference_selection random and diverse and compare the novelty gate
+rejection rates and process.uv.py near-duplicate reports of the two runs.
+"""
+
+import json
+import time
+import random
+import argparse
+import statistics
+
+import numpy as np
+
+from references import ReferencePool, mean_pairwise_similarity
+from sampling import BlueprintPlanner
+from similarity import MinHasher
+
+
+def synthetic_corpus(n, seed):
+    """Personas whose text is assembled from the seed building blocks."""
+    with open("data/seed/persona_components.json", "r") as f:
+        components = json.load(f)
+    with open("data/seed/first_names.json", "r") as f:
+        first_names = json.load(f)
+    with open("data/seed/last_names.json", "r") as f:
+        last_names = json.load(f)
+    planner = BlueprintPlanner(components, first_names, last_names, seed=seed)
+    for i in range(n):
+        blocks = planner[i]
+        yield {
+            "name": blocks["name"],
+            "age": blocks["age"],
+            "traits": blocks["traits"],
+            "background": f"{blocks['profession']}, {blocks['age']}, currently {blocks['life_context']}.",
+            "chatting_style": blocks["chat_quirk"],
+        }
+
+
+def load_corpus(path, n):
+    with open(path, "r", encoding="utf-8") as f:
+        for i, line in enumerate(f):
+            if i >= n:
+                break
+            yield json.loads(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark diversity-aware reference selection against random selection.")
+    parser.add_argument("--input", type=str, default=None, help="Persona JSONL corpus. Defaults to a synthetic corpus built from data/seed.")
+    parser.add_argument("--n", type=int, default=20_000, help="Personas to stream through the pool.")
+    parser.add_argument("--window", type=int, default=50, help="Personas between two selections (RESET_EVERY).")
+    parser.add_argument("--k", type=int, default=3, help="References per selection (NUM_REFERENCES).")
+    parser.add_argument("--capacity", type=int, default=64, help="Ring buffer size of the pool.")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    with open("data/seed/personas.jsonl", "r") as f:
+        seed_personas = [json.loads(line) for line in f]
+    corpus = load_corpus(args.input, args.n) if args.input else synthetic_corpus(args.n, args.seed)
+
+    rng = random.Random(args.seed)
+    pool = ReferencePool(seed_personas, capacity=args.capacity)
+    judge = MinHasher(num_perm=128)
+    results = {name: {"mean": [], "max": [], "seconds": []} for name in ("random", "diverse")}
+    add_seconds, added = 0.0, 0
+
+    for i, persona in enumerate(corpus, start=1):
+        start = time.perf_counter()
+        pool.add(persona)
+        add_seconds += time.perf_counter() - start
+        added += 1
+        if i % args.window:
+            continue
+        for name in results:
+            start = time.perf_counter()
+            if name == "diverse":
+                references = pool.diverse(args.k, rng=rng)
+            else:
+                recent = pool.recent(20)
+                references = [rng.choice(seed_personas)] + rng.sample(recent, min(len(recent), args.k - 1))
+            results[name]["seconds"].append(time.perf_counter() - start)
+            # Score the generated references only: the anchor is the same kind of pick for both
+            generated = references[1:]
+            results[name]["mean"].append(mean_pairwise_similarity(judge, generated))
+            signatures = np.vstack([judge.persona_signature(p) for p in generated])
+            pairwise = (signatures[:, None, :] == signatures[None, :, :]).mean(axis=2)
+            results[name]["max"].append(float(pairwise[np.triu_indices(len(generated), k=1)].max()) if len(generated) > 1 else 0.0)
+
+    selections = len(results["random"]["mean"])
+    pool_bytes = pool._signatures.nbytes + pool._seed_signatures.nbytes
+    print(f"{added} personas streamed, {selections} selections of {args.k} references, pool capacity {args.capacity} "
+          f"({pool_bytes / 1024:.0f} KiB of sketches, {1e6 * add_seconds / max(added, 1):.0f} us per add)\n")
+    header = f"{'strategy':>8} {'mean sim':>9} {'worst pair':>10} {'identical':>9} {'us/select':>10}"
+    print(header)
+    print("-" * len(header))
+    for name, values in results.items():
+        identical = sum(1 for value in values["max"] if value >= 0.99) / max(selections, 1)
+        print(
+            f"{name:>8} {statistics.fmean(values['mean']):>9.3f} {statistics.fmean(values['max']):>10.3f} "
+            f"{identical:>9.1%} {1e6 * statistics.fmean(values['seconds']):>10.0f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+#!/usr/bin/env -S uv run --script
+#
+# /// script
+# requires-python = ">=3.12"
+# dependencies = []
+# ///
+"""
+Tail latency benchmark for multi-provider routing (router.py).
+
+Sends the same stream of requests, at a fixed concurrency, to local stand-in
+providers (MockBackend instances with different latency and error profiles):
+each provider alone, the router without hedging, and the router with hedging.
+For each run it reports throughput, latency p50/p95/p99 as seen by the caller,
+failed requests, and the extra provider calls and tokens hedging cost. No
+tokens are spent. Run from the repository root:
+
+    ./scripts/benchmark_router.py
+    ./scripts/benchmark_router.py --providers fast=lognormal:0.05,0.3 slow=lognormal:0.2,0.3 --n 2000
+
+Latencies are in seconds; the defaults are scaled down (about 1/20 of real
+providers) so a run takes seconds.
+"""
+
+import time
+import asyncio
+import argparse
+
+from backends import make_backend
+from concurrency import percentile
+from router import ProviderRoute, Router, parse_route_spec
+
+DEFAULT_PROVIDERS = [
+    "steady=lognormal:0.07,0.25",       # Slower median, tight tail
+    "fast_tail=lognormal:0.05,0.9",     # Fast median, heavy tail (queueing spikes)
+    "flaky=lognormal:0.06,0.4@0.03",    # Occasionally throttles (429/503)
+]
+MESSAGES = [{"role": "user", "content": "Generate a persona. " * 50}]
+
+
+def make_routes(specs: list[str], seed: int) -> list[ProviderRoute]:
+    routes = []
+    for i, (name, spec) in enumerate(map(parse_route_spec, specs)):
+        latency, _, error_rate = spec.partition("@")
+        backend = make_backend("mock", latency=latency, error_rate=float(error_rate) if error_rate else 0.0, seed=seed + i)
+        routes.append(ProviderRoute(name, backend))
+    return routes
+
+
+async def run(backend, n: int, concurrency: int) -> dict:
+    """Sends n requests, at most `concurrency` at a time. Returns throughput, latencies and failures."""
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, failures = [], 0
+
+    async def one():
+        nonlocal failures
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                await backend.chat_completion(messages=MESSAGES, model="mock", max_tokens=512)
+            except Exception:
+                failures += 1
+                return
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(n)))
+    elapsed = time.perf_counter() - start
+    return {"rps": n / elapsed, "latencies": latencies, "failures": failures}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark routing and hedging across stand-in providers.")
+    parser.add_argument("--providers", nargs="+", default=DEFAULT_PROVIDERS, metavar="NAME=LATENCY[@ERROR_RATE]")
+    parser.add_argument("--n", type=int, default=3000, help="Requests per run.")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--hedge_quantile", type=float, default=95)
+    parser.add_argument("--hedge_budget", type=float, default=0.1)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    runs = [(route.name, route.backend) for route in make_routes(args.providers, args.seed)]
+    routers = {}
+    for hedge in (False, True):
+        name = "router+hedge" if hedge else "router"
+        routers[name] = Router(make_routes(args.providers, args.seed), hedge=hedge, hedge_quantile=args.hedge_quantile, hedge_budget=args.hedge_budget, seed=args.seed)
+        runs.append((name, routers[name]))
+
+    print(f"{args.n} requests per run at concurrency {args.concurrency}\n")
+    header = f"{'run':<14} {'req/s':>7} {'p50':>7} {'p95':>7} {'p99':>7} {'failed':>6} {'extra calls':>11}"
+    print(header)
+    print("-" * len(header))
+    for name, backend in runs:
+        result = asyncio.run(run(backend, args.n, args.concurrency))
+        latencies = result["latencies"]
+        extra = "-"
+        if isinstance(backend, Router):
+            extra = f"+{(sum(route.calls for route in backend.routes) - backend.requests) / backend.requests:.1%}"
+        print(
+            f"{name:<14} {result['rps']:>7.0f} {percentile(latencies, 50):>6.3f}s {percentile(latencies, 95):>6.3f}s "
+            f"{percentile(latencies, 99):>6.3f}s {result['failures']:>6} {extra:>11}"
+        )
+
+    for name, router in routers.items():
+        print(f"\n{name}:\n{router.report()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+"""
+Adaptive concurrency control for the generation loop.
+
+Instead of a fixed semaphore, the number of in-flight requests is governed by an
+AIMD (additive increase, multiplicative decrease) limit with a latency check:
+  - every healthy response grows the limit by 1/limit (about +1 per round trip),
+  - a 429, 5xx overload or timeout, or a latency gradient above tolerance
+    (median of the last few responses vs. a slow long-term average), shrinks
+    it multiplicatively (at most once per cooldown).
+Retries wait outside the slot, with exponential backoff and full jitter, so a
+throttled provider does not also cost us idle slots.
+"""
+
+import math
+import time
+import random
+import asyncio
+from collections import deque
+from contextlib import asynccontextmanager
+
+OVERLOAD_STATUS_CODES = {429, 502, 503, 504}
+
+
+def is_overload_error(error: BaseException) -> bool:
+    """Returns True for errors that signal the provider is overloaded or rate limiting."""
+    if isinstance(error, (TimeoutError, asyncio.TimeoutError)):
+        return True
+    if any(cls.__name__ == "TimeoutException" for cls in type(error).__mro__):
+        return True  # httpx timeouts (the HF client's transport), matched by name so httpx stays optional
+    response = getattr(error, "response", None)
+    status = getattr(response, "status_code", None) or getattr(error, "status_code", None) or getattr(error, "status", None)
+    if status in OVERLOAD_STATUS_CODES:
+        return True
+    message = str(error).lower()
+    return "429" in message or "rate limit" in message or "too many requests" in message or "timed out" in message
+
+
+def backoff_delay(attempt: int, base: float = 1.0, cap: float = 60.0) -> float:
+    """Exponential backoff with full jitter: uniform in [0, min(cap, base * 2**attempt)]."""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+def percentile(values, q: float) -> float:
+    """Nearest-rank percentile of a sequence (q in [0, 100])."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(0, math.ceil(q / 100 * len(ordered)) - 1)
+    return ordered[rank]
+
+
+class AdaptiveConcurrencyLimiter:
+    """AIMD limit on the number of concurrent requests."""
+
+    def __init__(
+        self,
+        initial_limit: int = 20,
+        min_limit: int = 1,
+        max_limit: int = 128,
+        decrease_factor: float = 0.7,
+        latency_tolerance: float = 1.5,
+        window: int = 500,
+        short_window: int = 20,
+    ):
+        self.limit = float(initial_limit)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.decrease_factor = decrease_factor
+        self.latency_tolerance = latency_tolerance  # Short-term latency above tolerance * long-term counts as congestion
+        self.in_flight = 0
+        self.backing_off = 0  # Tasks currently sleeping before a retry (they hold no slot)
+        self.successes = 0
+        self.overloads = 0
+        self.errors = 0
+        self.latencies: deque[float] = deque(maxlen=window)
+        self._recent: deque[float] = deque(maxlen=short_window)
+        self.long_term_latency = 0.0
+        self._last_decrease = 0.0
+        self._condition = asyncio.Condition()
+
+    @property
+    def current_limit(self) -> int:
+        return max(self.min_limit, int(self.limit))
+
+    @asynccontextmanager
+    async def slot(self):
+        """Holds one concurrency slot for the duration of a request and records its outcome."""
+        async with self._condition:
+            await self._condition.wait_for(lambda: self.in_flight < self.current_limit)
+            self.in_flight += 1
+        start = time.monotonic()
+        try:
+            yield
+        except Exception as e:
+            self._on_error(e)
+            raise
+        else:
+            self._on_success(time.monotonic() - start)
+        finally:
+            async with self._condition:
+                self.in_flight -= 1
+                self._condition.notify_all()
+
+    async def backoff(self, attempt: int, base: float = 1.0, cap: float = 60.0):
+        """Sleeps before a retry without holding a slot."""
+        self.backing_off += 1
+        try:
+            await asyncio.sleep(backoff_delay(attempt, base, cap))
+        finally:
+            self.backing_off -= 1
+
+    def _on_success(self, latency: float):
+        self.successes += 1
+        self.latencies.append(latency)
+        self._recent.append(latency)
+        if len(self._recent) < self._recent.maxlen:
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            return
+
+        # Compare the short-term median with a slow average of it: a single slow
+        # response is noise, a sustained rise means the provider is queueing us.
+        short_term = percentile(self._recent, 50)
+        if not self.long_term_latency:
+            self.long_term_latency = short_term
+        self.long_term_latency += 0.01 * (short_term - self.long_term_latency)
+        if short_term > self.latency_tolerance * self.long_term_latency:
+            self._decrease()
+        else:
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+
+    def _on_error(self, error: Exception):
+        if is_overload_error(error):
+            self.overloads += 1
+            self._decrease()
+        else:
+            self.errors += 1
+
+    def _decrease(self):
+        # Requests in flight when congestion started tend to fail together; only
+        # react once per typical round trip so the limit does not collapse to the floor.
+        now = time.monotonic()
+        cooldown = percentile(self.latencies, 50) if self.latencies else 1.0
+        if now - self._last_decrease < cooldown:
+            return
+        self._last_decrease = now
+        self.limit = max(self.min_limit, self.limit * self.decrease_factor)
+
+    def stats(self) -> str:
+        return (
+            f"concurrency limit {self.current_limit} ({self.in_flight} in flight, {self.backing_off} backing off), "
+            f"latency p50 {percentile(self.latencies, 50):.2f}s / p99 {percentile(self.latencies, 99):.2f}s, "
+            f"{self.overloads} overloads, {self.errors} other errors"
+        )
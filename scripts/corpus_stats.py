@@ -0,0 +1,751 @@
+#!/usr/bin/env -S uv run --script
+#
+# /// script
+# requires-python = ">=3.12"
+# dependencies = [
+#   "numpy"
+# ]
+# ///
+"""
+Corpus statistics and distribution-drift checks for persona files.
+
+One streaming pass over a processed (or raw) JSONL file, parsed in newline-aligned
+chunks by a process pool and aggregated with NumPy, produces a JSON report of:
+  - field distributions: ages and age bands, traits per persona, text lengths
+    (and how many break the prompt's limits), usernames, models,
+  - trait diversity (entropy, effective number of traits, share of traits outside
+    persona_components.json) and the co-occurrence matrix of the component traits,
+  - repetition: distinct word trigrams of `background`, the most repeated ones, and
+    opening-phrase collapse (the most common first words of `background` and
+    `chatting_style`),
+  - chi-square drift against persona_components.json for traits, professions and
+    age bands, overall and per checkpoint window, with flagged windows (a trailing
+    window under half the window size is reported but not checked).
+
+Professions are not a field of a persona: they are attributed from the first
+profession name found in the words of the background (see profession_aliases), and the report
+gives the share that could be attributed. Traits are compared with their expected
+share under the blueprint sampler (6 distinct traits drawn by weight), estimated
+by simulation, since drawing without replacement flattens the weights. Age bands are
+compared with the ages the profession weights and age ranges imply.
+
+DriftMonitor runs the same window checks on the personas accepted during
+generation, so generate.uv.py can reset its references as soon as the output
+drifts (--drift_reset). Run from the repository root:
+
+    ./scripts/corpus_stats.py data/processed/processed_personas.jsonl --window 1000
+"""
+
+import os
+import re
+import json
+import math
+import time
+import hashlib
+import argparse
+import functools
+from collections import Counter, deque
+from itertools import chain
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+
+import numpy as np
+
+from sampling import AliasTable
+
+COMPONENTS_PATH = "data/seed/persona_components.json"
+NUM_WORKERS = os.cpu_count() or 1  # Processes parsing raw chunks
+CHUNK_BYTES = 4 * 1024 * 1024      # Bytes per work item (split on line boundaries)
+WINDOW = 1000            # Personas per checkpoint window of the report
+AGE_BAND_EDGES = (18, 25, 35, 45, 55, 65, 76)  # Age bands [edge, next edge) compared with the components' age ranges
+FIELD_MAX_CHARS = {"background": 300, "chatting_style": 120}  # The prompt's length limits
+OPENING_WORDS = 3        # Words forming an opening phrase
+TRIGRAM_SKETCH_BITS = 20  # 2^bits hashed counters estimate how often the most repeated trigrams occur
+TRAIT_DRAWS = 6          # Traits drawn per blueprint (BlueprintPlanner's num_traits)
+TRAIT_SIMULATIONS = 100_000  # Simulated blueprints behind the expected trait shares
+MIN_EXPECTED = 5.0       # Chi-square cells expected to hold fewer observations are pooled
+TOP_K = 20               # Entries in the report's top lists
+
+# Drift thresholds, applied to every window (report flags and DriftMonitor)
+MAX_OPENING_SHARE = 0.2      # Share of a window's backgrounds or chatting styles starting with the same words
+MIN_DISTINCT_TRIGRAMS = 0.5  # Distinct word trigrams / all word trigrams of a window's backgrounds
+DRIFT_ALPHA = 1e-3           # A distribution drifts if its chi-square p-value is below this...
+MAX_CRAMERS_V = 0.3          # ...and its effect size (Cramér's V against the components) is above this
+
+SEPARATOR = "\x00"  # Joins the texts of a chunk for one regex pass
+TOKEN_RE = re.compile(r"[a-z0-9]+(?:['-][a-z0-9]+)*|\x00")
+MIX = (np.uint64(0x9E3779B97F4A7C15), np.uint64(0xC2B2AE3D27D4EB4F), np.uint64(0x165667B19E3779F9))
+
+
+def normalize_trait(trait: str) -> str:
+    return " ".join(trait.lower().split())
+
+
+def word_hashes(words) -> np.ndarray:
+    return np.asarray([int.from_bytes(hashlib.blake2b(w.encode("utf-8"), digest_size=8).digest(), "little") for w in words], dtype=np.uint64)
+
+
+def phrase_hashes(a: np.ndarray, b: np.ndarray, c: np.ndarray) -> np.ndarray:
+    """Order-sensitive 64-bit hashes of three-word phrases from their word hashes."""
+    with np.errstate(over="ignore"):
+        h = a * MIX[0] ^ b * MIX[1] ^ c * MIX[2]
+    return h ^ (h >> np.uint64(31))
+
+
+def profession_aliases(professions: list[str]) -> dict[str, int]:
+    """
+    Phrases attributing a background to a profession: every ' / '-separated name
+    without its parenthesized part ('Truck / Delivery Driver' -> 'truck', 'delivery
+    driver'), plus the last word of multi-word names when no other profession ends
+    with it ('registered nurse' -> 'nurse'; 'manager' is shared, so left out).
+    """
+    aliases, heads = {}, {}
+    for code, profession in enumerate(professions):
+        for name in re.sub(r"\(.*?\)", "", profession).split(" / "):
+            name = name.strip().lower()
+            if name:
+                aliases.setdefault(name, code)
+                if " " in name:
+                    heads.setdefault(name.rsplit(" ", 1)[1], set()).add(code)
+    for head, codes in heads.items():
+        if len(codes) == 1:
+            aliases.setdefault(head, codes.pop())
+    return aliases
+
+
+def chi2_sf(x: float, dof: int) -> float:
+    """Chi-square survival function (p-value), by the Wilson-Hilferty normal approximation."""
+    if dof <= 0:
+        return 1.0
+    z = ((x / dof) ** (1 / 3) - (1 - 2 / (9 * dof))) / math.sqrt(2 / (9 * dof))
+    return 0.5 * math.erfc(z / math.sqrt(2))
+
+
+def chi_square(observed: np.ndarray, expected_p: np.ndarray) -> dict:
+    """
+    Goodness of fit of observed counts to expected probabilities. Cells expected to
+    hold fewer than MIN_EXPECTED observations are pooled into one. Reports the
+    statistic, degrees of freedom, p-value, Cramér's V (effect size, 0 to 1) and the
+    total variation distance between the observed and expected shares.
+    """
+    n = int(observed.sum())
+    if n == 0:
+        return {"n": 0}
+    expected = expected_p * n
+    pool = expected < MIN_EXPECTED
+    while pool.any() and not pool.all() and expected[pool].sum() < MIN_EXPECTED:
+        pool[np.argmin(np.where(pool, np.inf, expected))] = True
+    cells_o = np.append(observed[~pool], observed[pool].sum()) if pool.any() else observed
+    cells_e = np.append(expected[~pool], expected[pool].sum()) if pool.any() else expected
+    keep = cells_e > 0
+    chi2 = float((((cells_o - cells_e) ** 2)[keep] / cells_e[keep]).sum())
+    dof = int(keep.sum()) - 1
+    return {
+        "n": n,
+        "chi2": round(chi2, 2),
+        "dof": dof,
+        "p_value": chi2_sf(chi2, dof),
+        "cramers_v": round(math.sqrt(chi2 / (n * dof)), 4) if dof > 0 else 0.0,
+        "tvd": round(0.5 * float(np.abs(observed / n - expected_p).sum()), 4),
+    }
+
+
+class ComponentVocabulary:
+    """persona_components.json compiled for matching personas and for their expected distributions."""
+
+    def __init__(self, components: dict):
+        self.components = components
+        self.traits = [normalize_trait(item["value"]) for item in components["traits"]]
+        self.trait_codes = {trait: code for code, trait in enumerate(self.traits)}
+        self.professions = [item["value"] for item in components["professions"]]
+        self.profession_weights = np.asarray([item["weight"] for item in components["professions"]], dtype=np.float64)
+        self.min_ages = np.asarray([item.get("min_age", 19) for item in components["professions"]], dtype=np.int64)
+        self.max_ages = np.asarray([item.get("max_age", 75) for item in components["professions"]], dtype=np.int64)
+        # Aliases are matched as phrase hashes of their (up to 3) words, one sorted table per phrase length
+        self.alias_tables = {}
+        by_length = {}
+        for alias, code in profession_aliases(self.professions).items():
+            words = TOKEN_RE.findall(alias)[:3]
+            padded = np.concatenate([word_hashes(words), np.zeros(3 - len(words), dtype=np.uint64)])
+            by_length.setdefault(len(words), []).append((phrase_hashes(*padded[:, None]), code))
+        for length, entries in by_length.items():
+            hashes = np.concatenate([h for h, _ in entries])
+            order = np.argsort(hashes)
+            self.alias_tables[length] = (hashes[order], np.asarray([c for _, c in entries], dtype=np.int16)[order])
+
+    @classmethod
+    def load(cls, path: str = COMPONENTS_PATH) -> "ComponentVocabulary":
+        with open(path, "r", encoding="utf-8") as f:
+            return cls(json.load(f))
+
+    @functools.cached_property
+    def expected_traits(self) -> np.ndarray:
+        """Expected share of each component trait among the component traits of personas."""
+        table = AliasTable(self.components["traits"])
+        rng = np.random.default_rng(0)
+        counts = np.zeros(len(self.traits), dtype=np.int64)
+        for _ in range(TRAIT_SIMULATIONS // 10_000):
+            counts += np.bincount(table.sample_without_replacement(rng, 10_000, TRAIT_DRAWS).ravel(), minlength=len(self.traits))
+        return counts / counts.sum()
+
+    @functools.cached_property
+    def expected_professions(self) -> np.ndarray:
+        return self.profession_weights / self.profession_weights.sum()
+
+    @functools.cached_property
+    def expected_age_bands(self) -> np.ndarray:
+        """Share of each age band when the profession is drawn by weight and the age uniformly in its range."""
+        edges = np.asarray(AGE_BAND_EDGES)
+        lo, hi = self.min_ages[:, None], self.max_ages[:, None] + 1
+        overlap = np.clip(np.minimum(hi, edges[1:]) - np.maximum(lo, edges[:-1]), 0, None)
+        probabilities = (self.expected_professions[:, None] * overlap / (hi - lo)).sum(axis=0)
+        return probabilities / probabilities.sum()
+
+
+@dataclass
+class Batch:
+    """Per-persona features of consecutive personas (ragged fields as CSR arrays) plus chunk-level counters."""
+    ages: np.ndarray             # int16, -1 if missing
+    professions: np.ndarray      # int16 profession code, -1 if none was found
+    trait_indptr: np.ndarray     # Component traits of persona i: trait_codes[trait_indptr[i]:trait_indptr[i + 1]]
+    trait_codes: np.ndarray
+    openings: np.ndarray         # uint64 hash of the first OPENING_WORDS words of `background`
+    style_openings: np.ndarray   # ... and of `chatting_style`
+    trigram_indptr: np.ndarray   # Word trigram hashes of the background of persona i, same layout
+    trigrams: np.ndarray
+    # Only used for the overall statistics, not sliced into windows
+    traits_per_persona: np.ndarray = None
+    background_chars: np.ndarray = None
+    style_chars: np.ndarray = None
+    missing_usernames: int = 0
+    trait_counts: Counter = field(default_factory=Counter)
+    models: Counter = field(default_factory=Counter)
+    examples: dict = field(default_factory=dict)  # Phrase hash -> text, for the phrases most repeated in the chunk
+
+    def __len__(self) -> int:
+        return len(self.ages)
+
+    def window(self, start: int, end: int) -> "Batch":
+        """Personas [start, end) (per-persona fields only)."""
+        t0, t1 = self.trait_indptr[start], self.trait_indptr[end]
+        g0, g1 = self.trigram_indptr[start], self.trigram_indptr[end]
+        return Batch(
+            self.ages[start:end], self.professions[start:end],
+            self.trait_indptr[start:end + 1] - t0, self.trait_codes[t0:t1],
+            self.openings[start:end], self.style_openings[start:end],
+            self.trigram_indptr[start:end + 1] - g0, self.trigrams[g0:g1],
+        )
+
+    @staticmethod
+    def concat(batches: list["Batch"]) -> "Batch":
+        """Joins consecutive batches (per-persona fields only)."""
+        if len(batches) == 1:
+            return batches[0]
+
+        def indptr(name):
+            parts, offset = [np.zeros(1, dtype=np.int64)], 0
+            for b in batches:
+                parts.append(getattr(b, name)[1:] + offset)
+                offset += getattr(b, name)[-1]
+            return np.concatenate(parts)
+
+        join = lambda name: np.concatenate([getattr(b, name) for b in batches])
+        return Batch(
+            join("ages"), join("professions"), indptr("trait_indptr"), join("trait_codes"),
+            join("openings"), join("style_openings"), indptr("trigram_indptr"), join("trigrams"),
+        )
+
+
+class _Ids(dict):
+    """Word -> id map assigning the next id to unseen words (lets map() do the lookups in C)."""
+
+    def __missing__(self, word: str) -> int:
+        self[word] = len(self)
+        return self[word]
+
+
+class _Normalized(dict):
+    """Memo of normalize_trait (traits repeat a lot)."""
+
+    def __missing__(self, trait: str) -> str:
+        self[trait] = normalize_trait(trait)
+        return self[trait]
+
+
+def tokenize(texts: list[str], ids: _Ids) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Word ids of lowercased texts in one regex pass over their concatenation. Returns
+    the flat ids and the CSR indptr (the words of text i are ids[indptr[i]:indptr[i + 1]]).
+    """
+    joined = SEPARATOR.join(texts)
+    if joined.count(SEPARATOR) != len(texts) - 1:
+        joined = SEPARATOR.join(t.replace(SEPARATOR, " ") for t in texts)
+    tokens = TOKEN_RE.findall(joined + SEPARATOR) if texts else []
+    flat = np.fromiter(map(ids.__getitem__, tokens), dtype=np.int64, count=len(tokens))
+    separators = np.flatnonzero(flat == ids[SEPARATOR])
+    indptr = np.zeros(len(texts) + 1, dtype=np.int64)
+    indptr[1:] = separators - np.arange(len(separators))
+    return flat[flat != ids[SEPARATOR]], indptr
+
+
+def first_words(words: np.ndarray, indptr: np.ndarray) -> np.ndarray:
+    """The first OPENING_WORDS word ids of every text, padded with the empty word (id 0)."""
+    positions = indptr[:-1, None] + np.arange(OPENING_WORDS)
+    valid = positions < indptr[1:, None]
+    return np.where(valid, words[np.minimum(positions, len(words) - 1)], 0) if len(words) else np.zeros(positions.shape, dtype=np.int64)
+
+
+def find_professions(word_hashes_: np.ndarray, indptr: np.ndarray, vocabulary: ComponentVocabulary) -> np.ndarray:
+    """Profession code of the first alias in each text (the longest one at that word), -1 if none."""
+    n, total = len(indptr) - 1, len(word_hashes_)
+    professions = np.full(n, -1, dtype=np.int16)
+    if not total:
+        return professions
+    text_of = np.repeat(np.arange(n), np.diff(indptr))
+    padded = np.append(word_hashes_, np.zeros(2, dtype=np.uint64))
+    positions = np.arange(total)
+    found_positions, found_codes, found_lengths = [], [], []
+    for length, (table, codes) in vocabulary.alias_tables.items():
+        # Phrases of `length` words that stay within their text
+        valid = positions[positions + length <= indptr[text_of + 1]]
+        parts = [padded[valid + k] if k < length else np.zeros(len(valid), dtype=np.uint64) for k in range(3)]
+        slots = np.minimum(np.searchsorted(table, phrase_hashes(*parts)), len(table) - 1)
+        hit = table[slots] == phrase_hashes(*parts)
+        found_positions.append(valid[hit])
+        found_codes.append(codes[slots[hit]])
+        found_lengths.append(np.full(hit.sum(), length))
+    found_positions = np.concatenate(found_positions)
+    if len(found_positions):
+        # Earliest word first, then the longest alias at that word
+        order = np.lexsort((-np.concatenate(found_lengths), found_positions))
+        texts = text_of[found_positions[order]]
+        first_texts, first = np.unique(texts, return_index=True)
+        professions[first_texts] = np.concatenate(found_codes)[order[first]]
+    return professions
+
+
+def featurize(personas: list[dict], vocabulary: ComponentVocabulary) -> Batch:
+    """
+    Extracts the features of a list of personas. Texts are processed column-wise (one
+    regex pass per field over the whole list) and everything after is NumPy.
+    """
+    n = len(personas)
+    text = lambda name: [p.get(name).lower() if isinstance(p.get(name), str) else "" for p in personas]
+    backgrounds, styles = text("background"), text("chatting_style")
+    ages = np.fromiter((a if isinstance(a, int) and 0 <= a < 32768 else -1 for a in (p.get("age") for p in personas)), dtype=np.int16, count=n)
+
+    normalized = _Normalized()
+    trait_sets = [
+        {normalized[t] for t in traits if isinstance(t, str)} if isinstance(traits := p.get("traits"), list) else set()
+        for p in personas
+    ]
+    traits_per_persona = np.fromiter(map(len, trait_sets), dtype=np.int16, count=n)
+    flat_traits = list(chain.from_iterable(trait_sets))
+    codes = np.fromiter((vocabulary.trait_codes.get(t, -1) for t in flat_traits), dtype=np.int16, count=len(flat_traits))
+    rows = np.repeat(np.arange(n), traits_per_persona)
+    trait_indptr = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows[codes >= 0], minlength=n), out=trait_indptr[1:])
+
+    ids = _Ids({"": 0, SEPARATOR: 1})
+    words, word_indptr = tokenize(backgrounds, ids)
+    style_words, style_indptr = tokenize(styles, ids)
+    vocabulary_words = list(ids)
+    hashes = word_hashes(vocabulary_words)
+    hashes[0] = 0
+    phrase = lambda triples: phrase_hashes(hashes[triples[..., 0]], hashes[triples[..., 1]], hashes[triples[..., 2]])
+    openings, style_openings = first_words(words, word_indptr), first_words(style_words, style_indptr)
+    professions = find_professions(hashes[words], word_indptr, vocabulary)
+
+    # Trigrams start at every word but the last two of each background
+    counts = np.maximum(np.diff(word_indptr) - 2, 0)
+    trigram_indptr = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(counts, out=trigram_indptr[1:])
+    trigram_starts = np.repeat(word_indptr[:-1], counts) + (np.arange(trigram_indptr[-1]) - np.repeat(trigram_indptr[:-1], counts))
+    triples = np.stack([words[trigram_starts], words[trigram_starts + 1], words[trigram_starts + 2]], axis=-1)
+    trigrams = phrase(triples)
+    opening_hashes, style_hashes = phrase(openings), phrase(style_openings)
+
+    examples = {}
+    for hashed, phrases in ((trigrams, triples), (opening_hashes, openings), (style_hashes, style_openings)):
+        if len(hashed):
+            unique, first, repeats = np.unique(hashed, return_index=True, return_counts=True)
+            for j in np.argsort(-repeats)[:2 * TOP_K]:
+                examples[int(unique[j])] = " ".join(vocabulary_words[w] for w in phrases[first[j]] if w)
+
+    return Batch(
+        ages, professions, trait_indptr, codes[codes >= 0],
+        opening_hashes, style_hashes, trigram_indptr, trigrams,
+        traits_per_persona,
+        np.fromiter(map(len, backgrounds), dtype=np.int32, count=n), np.fromiter(map(len, styles), dtype=np.int32, count=n),
+        sum(not p.get("username") for p in personas),
+        Counter(flat_traits), Counter(p.get("model") or "" for p in personas), examples,
+    )
+
+
+def top_share(hashes: np.ndarray) -> tuple[float, int]:
+    """Share of the most common value, and that value."""
+    if not len(hashes):
+        return 0.0, 0
+    unique, counts = np.unique(hashes, return_counts=True)
+    j = int(np.argmax(counts))
+    return counts[j] / len(hashes), int(unique[j])
+
+
+def window_metrics(batch: Batch, vocabulary: ComponentVocabulary) -> dict:
+    """Repetition and drift metrics of a window of personas."""
+    ages = batch.ages.astype(np.int64)
+    banded = ages[(ages >= AGE_BAND_EDGES[0]) & (ages < AGE_BAND_EDGES[-1])]
+    opening_share, opening = top_share(batch.openings)
+    style_share, style_opening = top_share(batch.style_openings)
+    return {
+        "n": len(batch),
+        "mean_age": round(float(ages[ages >= 0].mean()), 2) if (ages >= 0).any() else None,
+        "distinct_trigrams": round(len(np.unique(batch.trigrams)) / len(batch.trigrams), 4) if len(batch.trigrams) else None,
+        "top_opening_share": round(opening_share, 4),
+        "top_style_opening_share": round(style_share, 4),
+        "_top_openings": (opening, style_opening),
+        "traits": chi_square(np.bincount(batch.trait_codes, minlength=len(vocabulary.traits)), vocabulary.expected_traits),
+        "professions": chi_square(
+            np.bincount(batch.professions[batch.professions >= 0], minlength=len(vocabulary.professions)), vocabulary.expected_professions
+        ),
+        "age_bands": chi_square(np.histogram(banded, bins=AGE_BAND_EDGES)[0], vocabulary.expected_age_bands),
+    }
+
+
+def drift_reasons(metrics: dict) -> list[str]:
+    """Which thresholds a window's metrics break (empty if none)."""
+    reasons = []
+    if metrics["top_opening_share"] > MAX_OPENING_SHARE:
+        reasons.append(f"{metrics['top_opening_share']:.0%} of backgrounds open alike")
+    if metrics["top_style_opening_share"] > MAX_OPENING_SHARE:
+        reasons.append(f"{metrics['top_style_opening_share']:.0%} of chatting styles open alike")
+    if metrics["distinct_trigrams"] is not None and metrics["distinct_trigrams"] < MIN_DISTINCT_TRIGRAMS:
+        reasons.append(f"only {metrics['distinct_trigrams']:.0%} distinct background trigrams")
+    for name in ("traits", "professions", "age_bands"):
+        test = metrics[name]
+        if test.get("dof") and test["p_value"] < DRIFT_ALPHA and test["cramers_v"] > MAX_CRAMERS_V:
+            reasons.append(f"{name.replace('_', ' ')} drift from the components (V={test['cramers_v']:.2f}, p={test['p_value']:.1e})")
+    return reasons
+
+
+class CorpusStats:
+    """Accumulates Batches, in file order, into the overall and per-window statistics."""
+
+    def __init__(self, vocabulary: ComponentVocabulary, window: int = WINDOW):
+        self.vocabulary = vocabulary
+        self.window = window
+        k = len(vocabulary.traits)
+        self.n = 0
+        self.age_counts = np.zeros(128, dtype=np.int64)
+        self.missing_ages = 0
+        self.profession_counts = np.zeros(len(vocabulary.professions), dtype=np.int64)
+        self.ages_outside_profession = 0
+        self.trait_cooccurrence = np.zeros((k, k), dtype=np.int64)
+        self.traits_per_persona = np.zeros(32, dtype=np.int64)
+        self.length_counts = {name: np.zeros(4097, dtype=np.int64) for name in FIELD_MAX_CHARS}
+        self.missing_usernames = 0
+        self.trait_counts = Counter()
+        self.models = Counter()
+        self.trigram_sketch = np.zeros(1 << TRIGRAM_SKETCH_BITS, dtype=np.int64)
+        self.total_trigrams = 0
+        self.openings, self.style_openings = [], []
+        self.examples = {}
+        self.pending: list[Batch] = []
+        self.pending_n = 0
+        self.windows = []
+
+    def add(self, batch: Batch):
+        n = len(batch)
+        self.n += n
+        ages = batch.ages.astype(np.int64)
+        known = ages >= 0
+        self.missing_ages += int((~known).sum())
+        self.age_counts += np.bincount(np.clip(ages[known], 0, 127), minlength=128)
+        attributed = batch.professions >= 0
+        codes = batch.professions[attributed].astype(np.int64)
+        self.profession_counts += np.bincount(codes, minlength=len(self.profession_counts))
+        attributed_ages = ages[attributed]
+        self.ages_outside_profession += int((known[attributed] & (
+            (attributed_ages < self.vocabulary.min_ages[codes]) | (attributed_ages > self.vocabulary.max_ages[codes])
+        )).sum())
+
+        # Co-occurrence of component traits: X^T X over the persona x trait incidence matrix
+        incidence = np.zeros((n, len(self.vocabulary.traits)), dtype=np.float32)
+        incidence[np.repeat(np.arange(n), np.diff(batch.trait_indptr)), batch.trait_codes] = 1
+        self.trait_cooccurrence += (incidence.T @ incidence).astype(np.int64)
+
+        self.traits_per_persona += np.bincount(np.clip(batch.traits_per_persona, 0, 31), minlength=32)
+        for name, chars in (("background", batch.background_chars), ("chatting_style", batch.style_chars)):
+            self.length_counts[name] += np.bincount(np.clip(chars, 0, 4096), minlength=4097)
+        self.missing_usernames += batch.missing_usernames
+        self.trait_counts.update(batch.trait_counts)
+        self.models.update(batch.models)
+        mask = np.uint64((1 << TRIGRAM_SKETCH_BITS) - 1)
+        self.trigram_sketch += np.bincount((batch.trigrams & mask).astype(np.int64), minlength=len(self.trigram_sketch))
+        self.total_trigrams += len(batch.trigrams)
+        self.openings.append(batch.openings)
+        self.style_openings.append(batch.style_openings)
+        self.examples.update(batch.examples)
+
+        self.pending.append(batch)
+        self.pending_n += n
+        while self.pending_n >= self.window:
+            self._close_window(self.window)
+
+    def _close_window(self, size: int):
+        joined = Batch.concat(self.pending)
+        start = len(self.windows) * self.window
+        metrics = window_metrics(joined.window(0, size), self.vocabulary)
+        openings = metrics.pop("_top_openings")
+        metrics = {"start": start, **metrics, "top_opening": self.examples.get(openings[0]), "top_style_opening": self.examples.get(openings[1])}
+        # A short trailing window cannot be judged (one persona is always "100% alike"): None means not checked
+        metrics["drift"] = drift_reasons(metrics) if size >= self.window // 2 else None
+        self.windows.append(metrics)
+        self.pending = [joined.window(size, len(joined))] if size < len(joined) else []
+        self.pending_n = len(joined) - size
+
+    def _openings_report(self, chunks: list[np.ndarray]) -> dict:
+        hashes = np.concatenate(chunks) if chunks else np.empty(0, dtype=np.uint64)
+        if not len(hashes):
+            return {}
+        unique, counts = np.unique(hashes, return_counts=True)
+        order = np.argsort(-counts)[:TOP_K]
+        shares = counts / counts.sum()
+        return {
+            "distinct": len(unique),
+            "normalized_entropy": round(float(-(shares * np.log(shares)).sum() / math.log(len(hashes))) if len(hashes) > 1 else 1.0, 4),
+            "top": [{"opening": self.examples.get(int(unique[j])), "count": int(counts[j]), "share": round(float(shares[j]), 4)} for j in order],
+        }
+
+    def report(self) -> dict:
+        """The full report (closes the last, partial window)."""
+        if self.pending_n:
+            self._close_window(self.pending_n)
+        vocabulary = self.vocabulary
+        ages = np.arange(128)
+        age_total = self.age_counts.sum()
+        percentile = lambda counts, q: int(np.searchsorted(np.cumsum(counts), q * counts.sum())) if counts.sum() else None
+
+        trait_total = sum(self.trait_counts.values())
+        shares = np.asarray(sorted(self.trait_counts.values(), reverse=True), dtype=np.float64) / max(trait_total, 1)
+        entropy = float(-(shares * np.log(shares)).sum()) if trait_total else 0.0
+        trait_totals = np.diag(self.trait_cooccurrence)  # Personas with each component trait
+        component_mentions = int(trait_totals.sum())
+
+        # Trait pairs seen together more often than chance (lift), among pairs with enough support
+        i, j = np.triu_indices(len(trait_totals), k=1)
+        together = self.trait_cooccurrence[i, j]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            lift = together * self.n / (trait_totals[i].astype(np.float64) * trait_totals[j])
+        supported = np.flatnonzero(together >= max(10, self.n // 1000))
+        best = supported[np.argsort(-lift[supported])[:TOP_K]]
+
+        sketch_top = np.argsort(-self.trigram_sketch)[:TOP_K]
+        sketch_text = {h & ((1 << TRIGRAM_SKETCH_BITS) - 1): text for h, text in self.examples.items()}
+
+        windows = self.windows
+        ratios = [w["distinct_trigrams"] for w in windows if w["distinct_trigrams"] is not None]
+        attributed = int(self.profession_counts.sum())
+        return {
+            "personas": self.n,
+            "fields": {
+                "age": {
+                    "missing": self.missing_ages,
+                    "mean": round(float((ages * self.age_counts).sum() / age_total), 2) if age_total else None,
+                    "percentiles": {str(q): percentile(self.age_counts, q / 100) for q in (5, 25, 50, 75, 95)},
+                    "bands": {f"{lo}-{hi - 1}": int(self.age_counts[lo:hi].sum()) for lo, hi in zip(AGE_BAND_EDGES, AGE_BAND_EDGES[1:])},
+                    "outside_bands": int(age_total - self.age_counts[AGE_BAND_EDGES[0]:AGE_BAND_EDGES[-1]].sum()),
+                    "outside_profession_range": self.ages_outside_profession,
+                    "histogram": {str(a): int(c) for a, c in enumerate(self.age_counts) if c},
+                },
+                "traits_per_persona": {str(k): int(c) for k, c in enumerate(self.traits_per_persona) if c},
+                "length": {
+                    name: {
+                        "p50": percentile(counts, 0.5),
+                        "p95": percentile(counts, 0.95),
+                        "max": int(np.flatnonzero(counts).max()) if counts.any() else None,
+                        "over_limit": int(counts[FIELD_MAX_CHARS[name] + 1:].sum()),
+                    }
+                    for name, counts in self.length_counts.items()
+                },
+                "missing_username": self.missing_usernames,
+                "models": dict(self.models.most_common()),
+            },
+            "traits": {
+                "distinct": len(self.trait_counts),
+                "entropy": round(entropy, 4),
+                "effective_number": round(math.exp(entropy), 1),
+                "component_share": round(component_mentions / trait_total, 4) if trait_total else None,
+                "top": dict(self.trait_counts.most_common(TOP_K)),
+                "top_outside_components": dict([(t, c) for t, c in self.trait_counts.most_common() if t not in vocabulary.trait_codes][:TOP_K]),
+                "top_pairs_by_lift": [
+                    {"pair": [vocabulary.traits[i[p]], vocabulary.traits[j[p]]], "count": int(together[p]), "lift": round(float(lift[p]), 2)} for p in best
+                ],
+                "cooccurrence": {"traits": vocabulary.traits, "matrix": self.trait_cooccurrence.tolist()},
+            },
+            "repetition": {
+                "mean_window_distinct_trigrams": round(float(np.mean(ratios)), 4) if ratios else None,
+                "top_trigrams": [
+                    {"trigram": sketch_text.get(int(b)), "count": int(self.trigram_sketch[b]), "share": round(self.trigram_sketch[b] / max(self.total_trigrams, 1), 5)}
+                    for b in sketch_top if self.trigram_sketch[b]
+                ],
+                "background_openings": self._openings_report(self.openings),
+                "chatting_style_openings": self._openings_report(self.style_openings),
+            },
+            "drift": {
+                "professions_attributed": round(attributed / self.n, 4) if self.n else None,
+                "traits": chi_square(trait_totals, vocabulary.expected_traits),
+                "professions": chi_square(self.profession_counts, vocabulary.expected_professions),
+                "age_bands": chi_square(
+                    np.asarray([self.age_counts[lo:hi].sum() for lo, hi in zip(AGE_BAND_EDGES, AGE_BAND_EDGES[1:])]), vocabulary.expected_age_bands
+                ),
+                "top_professions": {vocabulary.professions[c]: int(self.profession_counts[c]) for c in np.argsort(-self.profession_counts)[:TOP_K]},
+                "flagged_windows": [w["start"] for w in windows if w["drift"]],
+            },
+            "windows": windows,
+            "thresholds": {
+                "max_opening_share": MAX_OPENING_SHARE, "min_distinct_trigrams": MIN_DISTINCT_TRIGRAMS,
+                "drift_alpha": DRIFT_ALPHA, "max_cramers_v": MAX_CRAMERS_V,
+            },
+        }
+
+
+class DriftMonitor:
+    """
+    Checks the personas accepted during a generation run for drift: every
+    `check_every` personas, the last `window` of them go through window_metrics and
+    drift_reasons. After a detection the window starts over, so two detections are
+    at least `window` personas apart.
+    """
+
+    def __init__(self, vocabulary: ComponentVocabulary, window: int = 200, check_every: int = 50):
+        self.vocabulary = vocabulary
+        self.window = window
+        self.check_every = check_every
+        self.recent = deque(maxlen=window)
+        self.since_check = 0
+        self.checks = 0
+        self.detections = 0
+        self.last_metrics = None
+
+    def seed(self, personas: list[dict]):
+        """Fills the window with already accepted personas (e.g. of a resumed run) without checking them."""
+        self.recent.extend(personas[-self.window:])
+
+    def add(self, persona: dict) -> list[str]:
+        """Records an accepted persona. Returns the drift reasons if this triggered a check that found drift."""
+        self.recent.append(persona)
+        self.since_check += 1
+        if len(self.recent) < self.window or self.since_check < self.check_every:
+            return []
+        self.since_check = 0
+        self.checks += 1
+        self.last_metrics = window_metrics(featurize(list(self.recent), self.vocabulary), self.vocabulary)
+        reasons = drift_reasons(self.last_metrics)
+        if reasons:
+            self.detections += 1
+            self.recent.clear()
+        return reasons
+
+    def summary(self) -> str:
+        line = f"Drift monitor: {self.detections} detection(s) in {self.checks} check(s) of the last {self.window} personas"
+        if self.last_metrics is not None:
+            m = self.last_metrics
+            line += f"; last window: top opening {m['top_opening_share']:.0%}"
+            if m["traits"].get("dof"):
+                line += f", trait V={m['traits']['cramers_v']:.2f}"
+            if m["distinct_trigrams"] is not None:
+                line += f", {m['distinct_trigrams']:.0%} distinct trigrams"
+        return line
+
+
+def iter_chunks(path: str, chunk_bytes: int):
+    """Yields (start, end) byte ranges of about chunk_bytes, ending on line boundaries."""
+    size = os.path.getsize(path)
+    with open(path, "rb") as f:
+        start = 0
+        while start < size:
+            f.seek(min(start + chunk_bytes, size))
+            f.readline()
+            end = min(f.tell(), size)
+            yield start, end
+            start = end
+
+
+@functools.lru_cache(maxsize=None)
+def _vocabulary(components_path: str) -> ComponentVocabulary:
+    # One vocabulary per worker process
+    return ComponentVocabulary.load(components_path)
+
+
+def featurize_chunk(path: str, start: int, end: int, components_path: str) -> tuple[Batch, int]:
+    """Worker: featurizes the personas in bytes [start, end) of a file. Returns them and the number of malformed lines."""
+    with open(path, "rb") as f:
+        f.seek(start)
+        data = f.read(end - start)
+    personas, bad_lines = [], 0
+    for line in data.splitlines():
+        if not line.strip():
+            continue
+        try:
+            persona = json.loads(line)
+        except ValueError:
+            bad_lines += 1
+            continue
+        if isinstance(persona, dict):
+            personas.append(persona)
+        else:
+            bad_lines += 1
+    return featurize(personas, _vocabulary(components_path)), bad_lines
+
+
+def analyze(path: str, window: int = WINDOW, components_path: str = COMPONENTS_PATH, workers: int = NUM_WORKERS) -> dict:
+    """Computes the report of a JSONL persona file in one pass."""
+    stats = CorpusStats(_vocabulary(components_path), window)
+    bad_lines = 0
+    tasks = [(path, start, end, components_path) for start, end in iter_chunks(path, CHUNK_BYTES)]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for task in tasks:
+            pending.append(pool.submit(featurize_chunk, *task))
+            if len(pending) >= 2 * workers:
+                batch, bad = pending.popleft().result()
+                stats.add(batch)
+                bad_lines += bad
+        while pending:
+            batch, bad = pending.popleft().result()
+            stats.add(batch)
+            bad_lines += bad
+    report = stats.report()
+    report["malformed_lines"] = bad_lines
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Corpus statistics and drift report of a persona JSONL file.")
+    parser.add_argument("path", help="Processed (or raw) persona JSONL file.")
+    parser.add_argument("--window", type=int, default=WINDOW, help="Personas per checkpoint window.")
+    parser.add_argument("--components", type=str, default=COMPONENTS_PATH, help="persona_components.json to compare against.")
+    parser.add_argument("--workers", type=int, default=NUM_WORKERS, help="Parsing processes.")
+    parser.add_argument("--output", type=str, default=None, help="Report path (default: next to the input, as <name>.stats.json).")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    report = analyze(args.path, args.window, args.components, args.workers)
+    elapsed = time.perf_counter() - start
+    output = args.output or os.path.splitext(args.path)[0] + ".stats.json"
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+    fields, traits, repetition, drift = report["fields"], report["traits"], report["repetition"], report["drift"]
+    fmt = lambda test: f"V={test['cramers_v']:.3f}, p={test['p_value']:.1e}" if test.get("dof") else "n/a"
+    share = lambda value: f"{value:.0%}" if value is not None else "n/a"
+    print(f"📊 {report['personas']} personas in {elapsed:.1f}s ({report['malformed_lines']} malformed lines skipped)")
+    print(f"Age: mean {fields['age']['mean']}, median {fields['age']['percentiles']['50']}, {fields['age']['outside_profession_range']} outside their profession's range")
+    print(f"Traits: {traits['distinct']} distinct, effective number {traits['effective_number']}, {share(traits['component_share'])} from the components")
+    print(f"Repetition: {repetition['mean_window_distinct_trigrams']} distinct trigrams per window; most common background opening: "
+          f"{repetition['background_openings']['top'][0] if repetition['background_openings'] else None}")
+    print(f"Drift against the components: traits {fmt(drift['traits'])}, professions {fmt(drift['professions'])} "
+          f"({share(drift['professions_attributed'])} attributed), age bands {fmt(drift['age_bands'])}")
+    print(f"⚠️ {len(drift['flagged_windows'])} of {len(report['windows'])} windows flagged" if drift["flagged_windows"] else f"✅ No window of {args.window} flagged")
+    print(f"Report saved to {output}")
@@ -0,0 +1,221 @@
+#!/usr/bin/env -S uv run --script
+#
+# /// script
+# requires-python = ">=3.12"
+# dependencies = [
+#   "pyarrow"
+# ]
+# ///
+"""
+Columnar export of a processed persona file.
+
+Streams a processed JSONL file into size-bounded Parquet shards under
+`<output_dir>/parquet/` (zstd, with `model` dictionary-encoded, `traits` as a
+list column and row-group statistics on `age`, so readers can skip row groups
+by age), and optionally into Arrow IPC files with the same row ranges under
+`<output_dir>/arrow/`, which can be memory-mapped and read without copying or
+parsing. `shards.json` lists the shards with their rows, sizes and age ranges:
+
+    ./scripts/export.uv.py
+    ./scripts/export.uv.py --input data/processed/processed_personas.jsonl --formats parquet arrow
+"""
+
+import os
+import json
+import glob
+import time
+import argparse
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+PROCESSED_DATA_DIR = "data/processed"
+EXPORT_DIR = "data/export"
+
+SHARD_MAX_BYTES = 256 * 1024 * 1024  # A new Parquet shard is started once the current one reaches this size
+ROW_GROUP_ROWS = 50_000              # Rows per Parquet row group (and per Arrow record batch)
+PARQUET_COMPRESSION = "zstd"
+
+PERSONA_SCHEMA = pa.schema([
+    pa.field("id", pa.string()),
+    pa.field("name", pa.string()),
+    pa.field("username", pa.string()),
+    pa.field("age", pa.int16()),
+    pa.field("traits", pa.list_(pa.string())),
+    pa.field("background", pa.string()),
+    pa.field("chatting_style", pa.string()),
+    pa.field("model", pa.dictionary(pa.int32(), pa.string())),
+])
+
+
+def get_latest_processed_file(processed_dir=PROCESSED_DATA_DIR):
+    """Finds the most recently created .jsonl file in the processed directory."""
+    list_of_files = glob.glob(os.path.join(processed_dir, '*.jsonl'))
+    if not list_of_files:
+        return None
+    return max(list_of_files, key=os.path.getctime)
+
+
+def iter_record_batches(jsonl_path, batch_rows=ROW_GROUP_ROWS):
+    """
+    Yields record batches of up to batch_rows personas, parsed from the JSONL file.
+    The `model` dictionary only ever grows, so every batch's dictionary extends the
+    previous one (Arrow IPC files accept dictionary deltas but not replacements).
+    """
+    fields = [field for field in PERSONA_SCHEMA if field.name != "model"]
+    plain_schema = pa.schema(fields)
+    models = {}  # Model name -> dictionary index
+    rows, model_indices = [], []
+
+    def make_batch():
+        model = pa.DictionaryArray.from_arrays(pa.array(model_indices, type=pa.int32()), pa.array(list(models), type=pa.string()))
+        plain = pa.RecordBatch.from_pylist(rows, schema=plain_schema)
+        return pa.RecordBatch.from_arrays(plain.columns + [model], schema=PERSONA_SCHEMA)
+
+    with open(jsonl_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            persona = json.loads(line)
+            rows.append({field.name: persona.get(field.name) for field in fields})
+            model = persona.get("model")
+            model_indices.append(None if model is None else models.setdefault(model, len(models)))
+            if len(rows) == batch_rows:
+                yield make_batch()
+                rows, model_indices = [], []
+    if rows:
+        yield make_batch()
+
+
+class ShardWriter:
+    """
+    Writes record batches to numbered shards, one Parquet row group per batch,
+    starting a new shard when the Parquet file reaches shard_max_bytes. With
+    `arrow`, every shard also gets an Arrow IPC file holding the same rows.
+    """
+
+    def __init__(self, output_dir, shard_max_bytes=SHARD_MAX_BYTES, parquet=True, arrow=False):
+        if not (parquet or arrow):
+            raise ValueError("At least one of parquet and arrow must be enabled.")
+        self.output_dir = output_dir
+        self.shard_max_bytes = shard_max_bytes
+        self.parquet = parquet
+        self.arrow = arrow
+        self.shards = []  # One summary dict per finished shard
+        self._shard = None
+
+    def _open_shard(self):
+        index = len(self.shards)
+        shard = {"index": index, "rows": 0, "files": {}, "age_min": None, "age_max": None}
+        if self.parquet:
+            path = os.path.join(self.output_dir, "parquet", f"part-{index:05d}.parquet")
+            shard["parquet_sink"] = pa.OSFile(path, 'wb')
+            shard["parquet_writer"] = pq.ParquetWriter(
+                shard["parquet_sink"],
+                PERSONA_SCHEMA,
+                compression=PARQUET_COMPRESSION,
+                write_statistics=["age"],
+            )
+            shard["files"]["parquet"] = path
+        if self.arrow:
+            path = os.path.join(self.output_dir, "arrow", f"part-{index:05d}.arrow")
+            shard["arrow_sink"] = pa.OSFile(path, 'wb')
+            shard["arrow_writer"] = pa.ipc.new_file(
+                shard["arrow_sink"], PERSONA_SCHEMA, options=pa.ipc.IpcWriteOptions(emit_dictionary_deltas=True)
+            )
+            shard["files"]["arrow"] = path
+        self._shard = shard
+
+    def _close_shard(self):
+        shard = self._shard
+        for kind in ("parquet", "arrow"):
+            if f"{kind}_writer" in shard:
+                shard.pop(f"{kind}_writer").close()
+                shard.pop(f"{kind}_sink").close()
+        shard["bytes"] = {kind: os.path.getsize(path) for kind, path in shard["files"].items()}
+        self.shards.append(shard)
+        self._shard = None
+
+    def write(self, batch):
+        if self._shard is None:
+            self._open_shard()
+        shard = self._shard
+        if self.parquet:
+            shard["parquet_writer"].write_batch(batch, row_group_size=batch.num_rows)
+        if self.arrow:
+            shard["arrow_writer"].write_batch(batch)
+        shard["rows"] += batch.num_rows
+        ages = pc.min_max(batch.column("age")).as_py()
+        if ages["min"] is not None:
+            shard["age_min"] = ages["min"] if shard["age_min"] is None else min(shard["age_min"], ages["min"])
+            shard["age_max"] = ages["max"] if shard["age_max"] is None else max(shard["age_max"], ages["max"])
+        # Without Parquet, bound the shards by the Arrow file size instead
+        size = shard["parquet_sink"].tell() if self.parquet else shard["arrow_sink"].tell()
+        if size >= self.shard_max_bytes:
+            self._close_shard()
+
+    def close(self):
+        if self._shard is not None:
+            self._close_shard()
+
+
+def export_personas(jsonl_path, output_dir, formats=("parquet",), shard_max_bytes=SHARD_MAX_BYTES, row_group_rows=ROW_GROUP_ROWS):
+    """Exports a processed JSONL file to shards in output_dir. Returns the shard summaries."""
+    for kind in formats:
+        os.makedirs(os.path.join(output_dir, kind), exist_ok=True)
+        for stale in glob.glob(os.path.join(output_dir, kind, "part-*")):
+            os.remove(stale)
+
+    writer = ShardWriter(output_dir, shard_max_bytes, parquet="parquet" in formats, arrow="arrow" in formats)
+    try:
+        for batch in iter_record_batches(jsonl_path, row_group_rows):
+            writer.write(batch)
+    finally:
+        writer.close()
+
+    summary = {
+        "source": os.path.basename(jsonl_path),
+        "rows": sum(shard["rows"] for shard in writer.shards),
+        "shards": [
+            {
+                "files": {kind: os.path.relpath(path, output_dir) for kind, path in shard["files"].items()},
+                "rows": shard["rows"],
+                "bytes": shard["bytes"],
+                "age_min": shard["age_min"],
+                "age_max": shard["age_max"],
+            }
+            for shard in writer.shards
+        ],
+    }
+    with open(os.path.join(output_dir, "shards.json"), 'w', encoding='utf-8') as f:
+        json.dump(summary, f, indent=2)
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export a processed persona file to Parquet / Arrow IPC shards.")
+    parser.add_argument("--input", type=str, default=None, help="Processed .jsonl file. Defaults to the latest file in 'data/processed'.")
+    parser.add_argument("--output_dir", type=str, default=None, help="Directory for the shards. Defaults to 'data/export/<input name>'.")
+    parser.add_argument("--formats", nargs="+", choices=["parquet", "arrow"], default=["parquet"])
+    parser.add_argument("--shard_max_bytes", type=int, default=SHARD_MAX_BYTES)
+    parser.add_argument("--row_group_rows", type=int, default=ROW_GROUP_ROWS)
+    args = parser.parse_args()
+
+    input_path = args.input or get_latest_processed_file()
+    if not input_path or not os.path.exists(input_path):
+        print("No processed file found. Run process.uv.py first or pass --input.")
+        return
+    output_dir = args.output_dir or os.path.join(EXPORT_DIR, os.path.splitext(os.path.basename(input_path))[0])
+
+    print(f"Exporting '{input_path}' to {' and '.join(args.formats)} shards in '{output_dir}'...")
+    start = time.perf_counter()
+    summary = export_personas(input_path, output_dir, args.formats, args.shard_max_bytes, args.row_group_rows)
+    print(f"✅ Exported {summary['rows']} personas to {len(summary['shards'])} shard(s) in {time.perf_counter() - start:.1f}s")
+    for kind in args.formats:
+        total = sum(shard["bytes"][kind] for shard in summary["shards"])
+        print(f"   {kind}: {total / 1e6:.1f} MB (JSONL: {os.path.getsize(input_path) / 1e6:.1f} MB)")
+
+
+if __name__ == "__main__":
+    main()
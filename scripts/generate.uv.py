@@ -4,38 +4,88 @@
 # requires-python = ">=3.12"
 # dependencies = [
 #   "huggingface-hub>=0.23",
+#   "numpy",
 #   "pydantic"
 # ]
 # ///
 
 import os
+import sys
 import json
 import time
 import random
 import asyncio
-from typing import List, Set
-from huggingface_hub import AsyncInferenceClient
+import argparse
+import subprocess
+from typing import Dict, List
+from contextlib import aclosing
+from dataclasses import dataclass, field
 from pydantic import BaseModel
 
+from backends import ChatUsage, make_backend
+from concurrency import AdaptiveConcurrencyLimiter, is_overload_error
+from corpus_stats import ComponentVocabulary, DriftMonitor
+from jsonl_writer import AsyncJsonlWriter
+from prompts import PromptBuilder
+from references import ReferencePool
+from response_cache import CACHE_MODES, CacheMiss, CachedBackend, ResponseCache
+from router import ProviderRoute, Router, parse_route_spec
+from sampling import BlueprintPlanner
+from similarity import NoveltyGate
+from streaming import PersonaStreamParser, StreamViolation
+from telemetry import RequestMetrics, Telemetry
+from work_queue import Lease, WorkQueue, default_worker_id
+
 # --- Configuration ---
 TARGET_N = 5000    # Target number of unique personas to generate
 MODEL_NAME = "Qwen/Qwen3-235B-A22B-Instruct-2507"  #  "zai-org/GLM-4.5-Air-FP8"  # "moonshotai/Kimi-K2-Instruct" # Or any other compatible model
-CONCURRENCY = 20      # Max number of parallel requests.
-CHECKPOINT_EVERY = 50  # Save progress to the file after this many successful generations.
-RESET_EVERY = 50      # Reset to seed personas every X generations to prevent drift.
+CONCURRENCY = 20      # Initial number of parallel requests; adapted at runtime between the bounds below.
+MIN_CONCURRENCY = 1
+MAX_CONCURRENCY = 128
+MAX_RETRIES = 5       # Retries per request on API errors, with exponential backoff and jitter
+RETRY_BASE_DELAY = 1.0  # Seconds; the backoff ceiling doubles with every attempt...
+RETRY_MAX_DELAY = 60.0  # ...up to this many seconds
+REQUEST_TIMEOUT = 120.0  # Seconds before an API call to the "hf" backend fails as a timeout (and is retried with backoff); None waits forever
+STATS_EVERY = 15      # Log concurrency, latency and throughput every X seconds
+CHECKPOINT_EVERY = 50  # fsync the output file and report progress after this many successful generations.
+RESET_EVERY = 50      # Re-draw the reference personas every X generations (anchored on a seed persona) to prevent drift.
+DRIFT_RESET = False   # Reset the references to seeds as soon as the recent output drifts (corpus_stats.DriftMonitor). Replaces the legacy layout's fixed RESET_EVERY resets; the prefix layout keeps rotating its window references on them
+DRIFT_WINDOW = 200    # With DRIFT_RESET, the last X accepted personas are checked for drift every CHECKPOINT_EVERY
 NUM_REFERENCES = 3    # Number of seed personas to use as references for each generation
-
-# Ensure the Hugging Face token is available
-if "HF_TOKEN" not in os.environ:
-    raise ValueError("Missing Hugging Face token. Please set the HF_TOKEN environment variable.")
-
-# Use the Asynchronous client for parallel execution.
-# The provider can be changed to "huggingface", "anyscale", etc.
-client = AsyncInferenceClient(
-    provider="together",
-    # provider="fireworks-ai",
-    api_key=os.environ.get("HF_TOKEN")
-)
+REFERENCE_POOL_SIZE = 64  # Recent personas kept (with small MinHash sketches) to choose references from
+REFERENCE_SELECTION = "diverse"  # "diverse": farthest-point picks over the sketches; "random": random recent personas
+BATCH_SIZE = 1        # Personas requested per API call; larger batches amortize the shared prompt tokens
+SEED = None           # Seed for building-block sampling and reference selection; set an int for a reproducible run
+STRATIFY = False      # Match profession, life context and quirk counts to their weights exactly in every blueprint chunk
+BLUEPRINT_CHUNK = 10_000  # Blueprints planned at once. With STRATIFY, runs (or shards) smaller than this use their target as the chunk, so the blueprints actually drawn are the stratified ones; the target is fixed for a run, so resumes keep the same chunks
+PROMPT_LAYOUT = "prefix"  # "prefix": stable content first so providers can reuse their prefix cache; "legacy": the original prompt
+NOVELTY_THRESHOLD = 0.8  # Reject personas whose background/chatting_style is this similar (estimated Jaccard) to an accepted one. Set to None to disable.
+NOVELTY_WINDOW = 200_000  # The novelty gate compares against this many most recent personas, at about 3.5 KB each (~0.7 GB when full); older near-duplicates are left to process.uv.py. None keeps every persona (memory grows with the run)
+FIELD_MAX_CHARS = {"background": 300, "chatting_style": 120}  # Length limits given in the prompt; longer personas are invalid. Set to {} to disable.
+STREAM = False        # Stream completions and validate them as they arrive, closing the stream at the first schema or length violation
+
+PROVIDER = "together"  # Inference provider for the "hf" backend, e.g. "fireworks-ai"
+PROVIDERS = []        # Route requests across several providers, as "name" or "name=model id" (e.g. ["together", "fireworks-ai"]); empty uses PROVIDER alone
+HEDGE = False         # With several providers, re-send a request to a second provider once the first is slower than its HEDGE_QUANTILE latency
+HEDGE_QUANTILE = 95   # Latency percentile of the chosen provider after which a request is hedged
+HEDGE_BUDGET = 0.1    # At most this fraction of requests is hedged
+
+METRICS_DIR = "data/metrics"  # Per-request metrics JSONL is written here (one file per output file). Set to None to disable.
+METRICS_PORT = None   # Serve Prometheus-style metrics on http://127.0.0.1:<port>/metrics during the run
+INPUT_PRICE = None    # USD per million input tokens, for the cost line of the run report
+CACHED_INPUT_PRICE = None  # USD per million prefix-cached input tokens (defaults to INPUT_PRICE)
+OUTPUT_PRICE = None   # USD per million output tokens
+
+RESPONSE_CACHE = None  # "record", "replay" or "read_through" to put the on-disk response cache in front of the backend (see response_cache.py)
+RESPONSE_CACHE_PATH = "data/cache/responses.sqlite"
+RESPONSE_CACHE_MAX_BYTES = 2 * 1024 ** 3  # Least recently used responses are evicted beyond this size
+REPLAY_MAX_MISSES = 20  # Abort a replay after this many cache misses in a row: the run no longer matches the recording
+
+DETERMINISTIC = False  # Make the requests and output a function of SEED and the responses alone (implied by record and replay)
+REFERENCE_LAG = 256    # Deterministic runs: a window's references are picked once every blueprint this far before its start is committed
+
+SHARD_LEASE_SECONDS = 120.0  # A shard whose worker has not renewed its lease for this long is reclaimed by another worker
+SHARD_POLL_SECONDS = 5.0     # How often an idle worker checks for reclaimable shards while others are still running
 
 # --- Pydantic Models for Data Structure ---
 
@@ -61,6 +111,29 @@ response_format = {
     },
 }
 
+def batch_response_format(batch_size: int) -> dict:
+    """Structured output format for a batch: an object holding an array of exactly `batch_size` personas."""
+    return {
+        "type": "json_schema",
+        "json_schema": {
+            "name": "PersonaBatch",
+            "schema": {
+                "type": "object",
+                "properties": {
+                    "personas": {
+                        "type": "array",
+                        "items": Persona.model_json_schema(),
+                        "minItems": batch_size,
+                        "maxItems": batch_size,
+                    },
+                },
+                "required": ["personas"],
+                "additionalProperties": False,
+            },
+            "strict": True,
+        },
+    }
+
 # --- Data Loading and Helper Functions ---
 
 # Load persona components from the seed data
@@ -86,175 +159,748 @@ usernames = []
 with open("data/seed/usernames.json", "r") as f:
     usernames = json.load(f)
 
-def generate_random_name():
-    first_name = random.choice(first_names)
-    last_name = random.choice(last_names)
-    return f"{first_name} {last_name}"
-
-def weighted_choice(component_list):
-    """Selects one dictionary item from a list of {'value': ..., 'weight': ...} objects."""
-    weights = [item['weight'] for item in component_list]
-    return random.choices(component_list, weights=weights, k=1)[0]
-
-def weighted_sample(component_list, k):
-    """Selects k unique items from a list of weighted objects."""
-    values = [item['value'] for item in component_list]
-    weights = [item['weight'] for item in component_list]
-    return random.choices(values, weights=weights, k=k)
-
-def save_to_jsonl(data: dict, filepath: str):
-    """Appends a dictionary as a new line in a JSONL file."""
-    with open(filepath, "a", encoding="utf-8") as f:
-        f.write(json.dumps(data, ensure_ascii=False) + "\n")
+def load_existing_personas(filepath: str) -> List[dict]:
+    """
+    Reads the personas already written to a raw JSONL file so a run can be resumed.
+    A trailing partial line (left by a crash mid-write) is truncated away.
+    """
+    personas = []
+    valid_bytes = 0
+    with open(filepath, "rb") as f:
+        for line in f:
+            if not line.endswith(b"\n"):
+                break
+            valid_bytes += len(line)
+            try:
+                personas.append(json.loads(line))
+            except json.JSONDecodeError as e:
+                print(f"⚠️ Skipping unreadable line in {filepath}: {e}")
+
+    if valid_bytes < os.path.getsize(filepath):
+        print(f"⚠️ Truncating a partially written record at the end of {filepath}.")
+        with open(filepath, "r+b") as f:
+            f.truncate(valid_bytes)
+    return personas
+
+def load_items(content: str, batch_size: int) -> list:
+    """Decodes a model response into the list of raw persona items it holds."""
+    data = json.loads(content)
+    if batch_size == 1 and isinstance(data, dict) and "personas" not in data:
+        return [data]
+    items = data["personas"] if isinstance(data, dict) else data
+    if not isinstance(items, list):
+        raise ValueError("Expected a 'personas' array.")
+    return items
+
+def validate_items(items: list, batch_size: int) -> tuple[List[Persona], int]:
+    """
+    Validates each item on its own so one bad item does not discard the rest of a batch.
+    Returns the valid personas and the number of invalid (or missing) items.
+    """
+    personas, invalid = [], 0
+    for item in items[:batch_size]:
+        try:
+            persona = Persona(**item)
+            for field_name, limit in FIELD_MAX_CHARS.items():
+                if len(getattr(persona, field_name)) > limit:
+                    raise ValueError(f"'{field_name}' is longer than {limit} characters")
+            personas.append(persona)
+        except Exception as e:
+            invalid += 1
+            print(f"⚠️ Invalid persona in response: {e}")
+    return personas, invalid + max(0, batch_size - len(items))
+
+def parse_personas(content: str, batch_size: int) -> tuple[List[Persona], int]:
+    """Parses a model response into personas. Returns the valid personas and the number of invalid items."""
+    return validate_items(load_items(content, batch_size), batch_size)
+
+def cached_prompt_tokens(usage) -> int:
+    """Prompt tokens served from the provider's prefix cache, when the provider reports them."""
+    details = getattr(usage, "prompt_tokens_details", None)
+    if isinstance(details, dict):
+        return details.get("cached_tokens") or 0
+    return getattr(details, "cached_tokens", None) or 0
+
+@dataclass
+class UsageStats:
+    """Token usage, prompt prefix sharing and wall-clock time per accepted persona."""
+    requests: int = 0
+    prompt_tokens: int = 0
+    cached_tokens: int = 0
+    completion_tokens: int = 0
+    shared_prefix_chars: int = 0
+    prompt_chars: int = 0
+    personas_returned: int = 0
+    invalid_items: int = 0
+    started: float = field(default_factory=time.monotonic)
+
+    def record(self, usage, prompt, returned: int, invalid: int):
+        self.requests += 1
+        self.personas_returned += returned
+        self.invalid_items += invalid
+        self.shared_prefix_chars += prompt.shared_prefix_chars
+        self.prompt_chars += prompt.total_chars
+        if usage is not None:
+            self.prompt_tokens += usage.prompt_tokens or 0
+            self.completion_tokens += usage.completion_tokens or 0
+            self.cached_tokens += cached_prompt_tokens(usage)
+
+    def summary(self, accepted: int) -> str:
+        per_persona = lambda value: value / accepted if accepted else 0.0
+        share = lambda part, whole: part / whole if whole else 0.0
+        elapsed = time.monotonic() - self.started
+        return (
+            f"{self.requests} requests, {self.personas_returned} valid personas returned ({self.invalid_items} invalid items); "
+            f"shared prompt prefix {share(self.shared_prefix_chars, self.prompt_chars):.0%}, "
+            f"cached input tokens {share(self.cached_tokens, self.prompt_tokens):.0%}; "
+            f"per accepted persona: {per_persona(self.prompt_tokens):.0f} input tokens, "
+            f"{per_persona(self.completion_tokens):.0f} output tokens, {per_persona(elapsed):.3f}s wall-clock"
+        )
+
+def select_window_references(persona_pool: ReferencePool, rng=random) -> List[dict]:
+    """
+    Picks the reference personas shared by a whole RESET_EVERY window: one seed persona
+    as an anti-drift anchor, plus recently generated ones (only seeds before any exist),
+    chosen to be as different from each other as possible.
+    """
+    if not persona_pool.num_generated:
+        return rng.sample(seed_personas, min(len(seed_personas), NUM_REFERENCES))
+    if REFERENCE_SELECTION == "diverse":
+        return persona_pool.diverse(NUM_REFERENCES, rng=rng)
+    recent = persona_pool.recent(20)
+    anchor = rng.sample(seed_personas, 1)
+    return anchor + rng.sample(recent, min(len(recent), NUM_REFERENCES - 1))
+
+def select_legacy_references(persona_pool: ReferencePool, current_iteration: int, batch_size: int) -> List[dict]:
+    """Original per-request selection: random recent personas, or seeds on a RESET_EVERY boundary."""
+    last_iteration = current_iteration + batch_size - 1
+    if not DRIFT_RESET and RESET_EVERY > 0 and last_iteration // RESET_EVERY > (max(current_iteration, 1) - 1) // RESET_EVERY:
+        print(f"--- 🔄 Iteration {current_iteration}: Resetting reference pool to seeds to prevent drift ---")
+        return random.sample(seed_personas, min(len(seed_personas), NUM_REFERENCES))
+    dynamic_reference_pool = persona_pool.recent(20, include_seeds=True)
+    return random.sample(dynamic_reference_pool, min(len(dynamic_reference_pool), NUM_REFERENCES))
+
+def is_novel(novelty_gate: NoveltyGate, persona: dict) -> bool:
+    """Checks a persona against the novelty gate (which then remembers it), logging rejections."""
+    match = novelty_gate.check(persona)
+    if match:
+        print(f"🔁 Rejected '{persona['name']}': too similar to '{match[0]}' (similarity {match[1]:.2f}). Retrying with another task.")
+    return not match
+
+async def read_stream(backend, request: dict, parser: PersonaStreamParser, metrics: RequestMetrics):
+    """
+    Feeds a streamed completion to the parser as it arrives, closing the stream at the
+    first violation. Returns the usage reported at the end of the stream (None if it
+    was closed early), the violation if any, and whether the stream was closed early.
+    """
+    usage = None
+    async with aclosing(backend.chat_completion_stream(**request)) as stream:
+        async for chunk in stream:
+            usage = getattr(chunk, "usage", None) or usage
+            content = chunk.choices[0].delta.content if chunk.choices else None
+            if not content:
+                continue
+            parse_start = time.perf_counter()
+            try:
+                parser.feed(content)
+            except StreamViolation as e:
+                return None, e, True
+            finally:
+                metrics.parse_seconds += time.perf_counter() - parse_start
+    try:
+        parser.finish()
+    except StreamViolation as e:
+        return usage, e, False
+    return usage, None, False
 
 # --- Main Generation Logic (Parallelized) ---
 
-async def generate_one_persona(
-    semaphore: asyncio.Semaphore,
-    reference_personas: List[dict]
-) -> Persona | None:
-    """Generates a single new persona using the LLM."""
-    async with semaphore:
+async def generate_personas(
+    backend,
+    limiter: AdaptiveConcurrencyLimiter,
+    reference_personas: List[dict],
+    batch_blocks: List[dict],
+    usage_stats: UsageStats | None = None,
+    prompt_builder: PromptBuilder | None = None,
+    seed: int | None = None,
+) -> tuple[List[Persona], RequestMetrics]:
+    """
+    Generates one new persona per building-block set (blueprint) with a single LLM call.
+    Items that fail validation are dropped individually; near-duplicates are rejected
+    by the caller when it commits the personas. A `seed` is passed on to the provider
+    for reproducible sampling. With STREAM, the output is validated as it arrives and
+    the stream is closed at the first violation, keeping the personas completed
+    before it. Returns the personas and the request's metrics, which the caller
+    completes with how many were committed and hands to telemetry.
+    """
+    batch_size = len(batch_blocks)
+    prompt = (prompt_builder or PromptBuilder(PROMPT_LAYOUT)).build(reference_personas, batch_blocks)
+    metrics = RequestMetrics(batch_size)
+    request = dict(
+        messages=prompt.messages,
+        model=MODEL_NAME,
+        response_format=response_format if batch_size == 1 else batch_response_format(batch_size),
+        max_tokens=512 * batch_size,
+        temperature=0.8,
+        **({"seed": seed} if seed is not None else {}),
+    )
+
+    # Only the API call holds a concurrency slot; retries back off outside of it
+    for attempt in range(MAX_RETRIES + 1):
+        metrics.attempts += 1
+        wait_start = time.monotonic()
         try:
-            # --- Tactic 1: Constrain inputs before the prompt ---
-            # 1. Pick the profession FIRST. This returns the full dictionary.
-            profession_data = weighted_choice(components['professions'])
-            profession = profession_data['value'] # Extract the string value
-
-            # 2. Determine the valid age range based on the profession's metadata
-            min_age_for_job = profession_data.get('min_age', 19)
-            max_age_for_job = profession_data.get('max_age', 75)
-            age = random.randint(min_age_for_job, max_age_for_job)
-
-            # 3. Select other components and immediately extract their 'value'
-            # This is the key change to fix the logic for these variables.
-            life_context = weighted_choice(components['life_contexts'])['value']
-            chat_quirk = weighted_choice(components['chatting_quirks'])['value']
-
-            num_traits = 6
-            # weighted_sample already returns a list of strings, so it's fine.
-            selected_traits = list(set(weighted_sample(components['traits'], k=num_traits)))
-
-
-            # --- Tactic 2: Use an improved prompt to force reconciliation ---
-            instruction = (
-                "Here are some examples of personas we have already generated. AVOID repeating their themes or being too similar:\n"
-                + "\n".join([json.dumps(p, ensure_ascii=False) for p in reference_personas]) +
-                f"\n\n---\n"
-                f"Your task is to generate a NEW, unique, and believable persona. You must creatively synthesize the following building blocks into a single, coherent character. Don't just list the components; make them feel like a real person.\n\n"
-                f"**BUILDING BLOCKS TO SYNTHESIZE:**\n"
-                f"- **Profession:** {profession}\n"
-                f"- **Core Demographics:** They are {age} years old.\n"
-                f"- **Life Context:** They are currently {life_context}.\n"
-                f"- **Personality Profile:** Their character should reflect these traits: {', '.join(selected_traits)}.\n"
-                f"- **Chat Style Challenge:** Their base communication style is: \"{chat_quirk}\"\n\n"
-                f"---"
-                f"**JSON OUTPUT TASK:**\n"
-                f"Create a single JSON object for a persona named '{generate_random_name()}'. "
-                f"Follow these rules for the JSON fields:\n"
-                f"- **traits:** Choose 3-6 adjectives from the list above that best fit the final, integrated character you imagined.\n"
-                f"- **background:** A short, specific 1-2 sentence story (≤300 chars) that **synthesizes** the profession, age, and life context into a believable narrative.\n"
-                f"- **chatting_style:** A brief description (≤120 chars) of their texting style. **Crucially, explain HOW a {age}-year-old {profession} would adapt or interpret the '{chat_quirk}'**. For example, would they use it ironically, incorrectly, or perfectly? Make it fit their character.\n"
-                f"The final output must be only the strict JSON object, with no extra text."
-            )
-
-            messages = [
-                {"role": "system", "content": "You are a creative persona generator. You will create and output only a single, structured persona JSON object, following the provided schema strictly. Do not add any extra text or explanation."},
-                {"role": "user", "content": instruction}
-            ]
-
-            response = await client.chat_completion(
-                messages=messages,
-                model=MODEL_NAME,
-                response_format=response_format,
-                max_tokens=512,
-                temperature=0.8,
-            )
-
-            persona_data = json.loads(response.choices[0].message.content)
-            return Persona(**persona_data)
-
+            async with limiter.slot():
+                call_start = time.monotonic()
+                metrics.queue_wait += call_start - wait_start
+                if STREAM:
+                    parser = PersonaStreamParser(response_format["json_schema"]["schema"], batch_size, FIELD_MAX_CHARS)
+                    metrics.parse_seconds = 0.0
+                    usage, violation, aborted = await read_stream(backend, request, parser, metrics)
+                else:
+                    response = await backend.chat_completion(**request)
+                    usage = getattr(response, "usage", None)
+            metrics.api_latency = time.monotonic() - call_start
+            break
+        except CacheMiss as e:
+            # Replaying: the recorded run never got a response to this request either
+            print(f"⚠️ {e} Counting it as a failed request, like in the recorded run.")
+            metrics.record_error(e, False)
+            metrics.outcome = "cache_miss"
+            return [], metrics
         except Exception as e:
-            # This is where your error was being printed.
-            print(f"⚠️ Error generating a persona: {e}. Retrying with another task.")
-            await asyncio.sleep(2) # Prevent rapid-fire failures
-            return None
-
-
-async def main():
-    # This pool will grow with new generations and is used for reference selection
-    persona_pool = seed_personas.copy()
+            overload = is_overload_error(e)
+            metrics.record_error(e, overload)
+            if attempt == MAX_RETRIES:
+                print(f"⚠️ Error generating personas: {e}. Giving up after {MAX_RETRIES} retries; retrying with another task.")
+                metrics.outcome = "gave_up"
+                return [], metrics
+            kind = "Provider overloaded" if overload else "Error generating personas"
+            print(f"⚠️ {kind}: {e}. Retry {attempt + 1}/{MAX_RETRIES} after backoff.")
+            backoff_start = time.monotonic()
+            await limiter.backoff(attempt, base=RETRY_BASE_DELAY, cap=RETRY_MAX_DELAY)
+            metrics.backoff += time.monotonic() - backoff_start
+
+    if usage is not None:
+        metrics.prompt_tokens = usage.prompt_tokens or 0
+        metrics.completion_tokens = usage.completion_tokens or 0
+        metrics.cached_tokens = cached_prompt_tokens(usage)
+    if STREAM:
+        validate_start = time.perf_counter()
+        personas, invalid = validate_items(parser.items, batch_size)
+        metrics.validate_seconds = time.perf_counter() - validate_start
+        if violation is not None:
+            # Malformed output is not a load problem, so the replacement task starts right away
+            if aborted:
+                # A closed stream reports no usage, but its tokens are billed: estimate them (about 4 characters per token)
+                # and report the estimate as its usage, so the cost summary counts them too
+                usage = ChatUsage(prompt.total_chars // 4, parser.chars // 4, prompt.total_chars // 4 + parser.chars // 4)
+                metrics.prompt_tokens, metrics.completion_tokens = usage.prompt_tokens, usage.completion_tokens
+            metrics.outcome = "aborted" if aborted else "parse_error"
+            metrics.errors.append(f"{'abort' if aborted else 'parse'}:{violation.code}")
+            metrics.rejection_seconds = metrics.api_latency
+            metrics.wasted_tokens = round(metrics.completion_tokens * (parser.chars - parser.items_end) / max(parser.chars, 1))
+            kept = f" Kept {len(personas)} personas." if personas else ""
+            if aborted:
+                print(f"✂️ Aborted the stream after {metrics.api_latency:.2f}s and ~{metrics.completion_tokens} output tokens: {violation}{kept} Retrying with another task.")
+            else:
+                print(f"⚠️ Invalid persona output: {violation}{kept} Retrying with another task.")
+    else:
+        parse_start = time.perf_counter()
+        try:
+            items = load_items(response.choices[0].message.content, batch_size)
+            metrics.parse_seconds = time.perf_counter() - parse_start
+            personas, invalid = validate_items(items, batch_size)
+            metrics.validate_seconds = time.perf_counter() - parse_start - metrics.parse_seconds
+        except Exception as e:
+            # Malformed output is not a load problem, so the replacement task starts right away
+            metrics.parse_seconds = time.perf_counter() - parse_start
+            metrics.outcome = "parse_error"
+            metrics.errors.append(f"parse:{type(e).__name__}")
+            metrics.rejection_seconds = metrics.api_latency + metrics.parse_seconds
+            metrics.wasted_tokens = metrics.completion_tokens
+            personas, invalid = [], batch_size
+            print(f"⚠️ Invalid persona output: {e}. Retrying with another task.")
+    metrics.returned, metrics.invalid = len(personas), invalid
+    if usage_stats is not None:
+        usage_stats.record(usage, prompt, len(personas), invalid)
+
+    return personas, metrics
+
+
+async def main(backend, resume_from: str | None = None, output_dir: str = "data/raw", lease: Lease | None = None) -> int:
+    """
+    Generates personas until TARGET_N are written to the output file, and returns how
+    many it holds. `backend` is anything with an async `chat_completion` method (see
+    backends.py). With a shard `lease`, it is renewed as the run goes, and the run
+    stops early if another worker took the shard over.
+
+    With DETERMINISTIC, every request and the output are a function of SEED and the
+    responses alone, so a recorded run can be replayed exactly from the response
+    cache: each request takes BATCH_SIZE blueprints, results are committed (novelty
+    check, reference pool, output file) in launch order rather than as they
+    complete, and the references of each window are picked, from their own RNG,
+    once every blueprint REFERENCE_LAG before the window's start is committed.
+    """
+    # Seeds plus a fixed-size buffer of recent generations, used for reference selection
+    persona_pool = ReferencePool(seed_personas, capacity=REFERENCE_POOL_SIZE)
+    router = backend.backend if isinstance(backend, CachedBackend) else backend
 
     if not seed_personas:
         print("⚠️ No seed personas loaded. Cannot proceed with few-shot prompting.")
-        return
+        return 0
 
-    timestamp = int(time.time())
-    output_filename = f"data/raw/data_{MODEL_NAME.split('/')[-1]}_{timestamp}.jsonl"
-    os.makedirs(os.path.dirname(output_filename), exist_ok=True)
+    successful_generations = 0
+    if resume_from:
+        output_filename = resume_from
+        existing_personas = load_existing_personas(output_filename)
+        successful_generations = len(existing_personas)
+        persona_pool.extend(existing_personas)
+        print(f"\nResuming from {output_filename}: {successful_generations} personas already generated.")
+    else:
+        timestamp = int(time.time())
+        output_filename = os.path.join(output_dir, f"data_{MODEL_NAME.split('/')[-1]}_{timestamp}.jsonl")
+        existing_personas = []
+    os.makedirs(os.path.dirname(output_filename) or ".", exist_ok=True)
 
     print(f"\nStarting persona generation. Target: {TARGET_N} personas.")
-    print(f"Concurrency: {CONCURRENCY}, Checkpoint: {CHECKPOINT_EVERY}, Anti-Drift Reset: {RESET_EVERY}")
+    print(f"Concurrency: {CONCURRENCY} (adaptive, {MIN_CONCURRENCY}-{MAX_CONCURRENCY}), Checkpoint: {CHECKPOINT_EVERY}, Anti-Drift Reset: {RESET_EVERY}, Prompt layout: {PROMPT_LAYOUT}")
+    if DETERMINISTIC:
+        print(f"Deterministic run (seed {SEED}): results are committed in launch order.")
+    if DRIFT_RESET:
+        print(f"Drift-triggered resets: the last {DRIFT_WINDOW} personas are checked every {CHECKPOINT_EVERY} (see corpus_stats.py).")
+    if STREAM:
+        print(f"Streaming completions: output is validated as it arrives and aborted at the first violation (length limits {FIELD_MAX_CHARS or 'off'}).")
+    if isinstance(backend, CachedBackend):
+        print(f"Response cache: {backend.mode} ({backend.cache.path}, {len(backend.cache)} responses)")
     print(f"Output will be saved to: {output_filename}")
 
-    semaphore = asyncio.Semaphore(CONCURRENCY)
-    tasks: Set[asyncio.Task] = set()
-    results_buffer: List[Persona] = []
-    successful_generations = 0
-
-    while successful_generations < TARGET_N:
-        # Launch new tasks if we have capacity
-        while len(tasks) < CONCURRENCY and successful_generations + len(tasks) < TARGET_N:
-            current_iteration = successful_generations + len(tasks)
-            # Determine which pool of examples to use for this task
-            if RESET_EVERY > 0 and current_iteration > 0 and current_iteration % RESET_EVERY == 0:
-                reference_pool = random.sample(seed_personas, min(len(seed_personas), NUM_REFERENCES))
-                print(f"--- 🔄 Iteration {current_iteration}: Resetting reference pool to seeds to prevent drift ---")
-            else:
-                lookback_range = min(len(persona_pool), 20)
-                dynamic_reference_pool = persona_pool[-lookback_range:]
-                reference_pool = random.sample(dynamic_reference_pool, min(len(dynamic_reference_pool), NUM_REFERENCES))
-
-            task = asyncio.create_task(
-                generate_one_persona(semaphore, reference_pool)
-            )
-            tasks.add(task)
-
-        # Wait for the next task to complete
-        done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
-
-        for future in done:
-            result = await future
-            tasks.remove(future) # Remove the completed task from the active set
-
-            if result:
-                successful_generations += 1
-                # Add the new persona to the dynamic pool for future generations
-                persona_dict = result.model_dump()
-                persona_pool.append(persona_dict)
-                results_buffer.append(persona_dict)
-
-                print(f"✅ ({successful_generations}/{TARGET_N}) Generated: {result.name}")
-
-                # Checkpoint logic
-                if successful_generations > 0 and successful_generations % CHECKPOINT_EVERY == 0 and results_buffer:
-                    print(f"\n--- CHECKPOINT: Saving {len(results_buffer)} personas to {output_filename}... ---")
-                    for p_dict in results_buffer:
-                        save_to_jsonl(p_dict, output_filename)
-                    results_buffer.clear()
-                    print("--- ✅ CHECKPOINT Complete. ---\n")
-
-    # Final save for any remaining items in the buffer
-    if results_buffer:
-        print(f"\n--- FINAL SAVE: Saving {len(results_buffer)} remaining personas to file... ---")
-        for p_dict in results_buffer:
-            save_to_jsonl(p_dict, output_filename)
-        print("--- ✅ FINAL SAVE Complete. ---")
+    novelty_gate = None
+    if NOVELTY_THRESHOLD is not None:
+        novelty_gate = NoveltyGate(threshold=NOVELTY_THRESHOLD, window=NOVELTY_WINDOW)
+        novelty_gate.seed(seed_personas)
+        novelty_gate.seed(existing_personas)
+    drift_monitor = None
+    if DRIFT_RESET:
+        drift_monitor = DriftMonitor(ComponentVocabulary(components), window=DRIFT_WINDOW, check_every=CHECKPOINT_EVERY)
+        drift_monitor.seed(existing_personas)
+    drift_reset_pending = False
+    del existing_personas  # Only needed to seed the pool and the novelty gate
+
+    # Every accepted persona is queued to the writer right away; it is appended
+    # to the output file in batches and fsynced every CHECKPOINT_EVERY records.
+    writer = AsyncJsonlWriter(output_filename, fsync_every=CHECKPOINT_EVERY)
+    await writer.start()
+
+    limiter = AdaptiveConcurrencyLimiter(
+        initial_limit=CONCURRENCY,
+        min_limit=MIN_CONCURRENCY,
+        max_limit=MAX_CONCURRENCY,
+    )
+    usage_stats = UsageStats()
+    prompt_builder = PromptBuilder(PROMPT_LAYOUT)
+
+    metrics_path = None
+    if METRICS_DIR is not None:
+        os.makedirs(METRICS_DIR, exist_ok=True)
+        metrics_name = os.path.splitext(os.path.basename(output_filename))[0]
+        if lease is not None:
+            # Shard files are named alike in every run
+            metrics_name = f"{os.path.basename(os.path.normpath(lease.queue.run_dir))}_{metrics_name}"
+        metrics_path = os.path.join(METRICS_DIR, metrics_name + ".metrics.jsonl")
+    telemetry = Telemetry(metrics_path, METRICS_PORT)
+    await telemetry.start()
+    if metrics_path:
+        print(f"Per-request metrics will be saved to: {metrics_path}")
+    if METRICS_PORT is not None:
+        print(f"Serving Prometheus metrics on http://127.0.0.1:{METRICS_PORT}/metrics")
+
+    # All building blocks come from a seeded, vectorized plan; each task takes the next blueprints
+    if SEED is not None:
+        random.seed(SEED)
+    planner = BlueprintPlanner(
+        components, first_names, last_names,
+        seed=SEED, stratify=STRATIFY, chunk_size=min(BLUEPRINT_CHUNK, TARGET_N) if STRATIFY else BLUEPRINT_CHUNK,
+    )
+    next_blueprint = successful_generations
+    print(f"Blueprint seed: {planner.seed}{' (stratified)' if STRATIFY else ''}")
+    reference_window = None
+    reference_pool = []
+    reference_rng = random.Random(SEED) if DETERMINISTIC else random
+    window_references: Dict[int, List[dict]] = {}  # Deterministic runs: references picked ahead for the next windows
+    next_window = next_blueprint // RESET_EVERY if RESET_EVERY > 0 else 0
+    committed_blueprints = next_blueprint
+    tasks: Dict[asyncio.Task, tuple[int, int]] = {}  # Running task -> (launch number, number of personas it requested)
+    finished: Dict[int, tuple[int, List[Persona], RequestMetrics]] = {}  # Launch number -> (personas requested, results, metrics) not committed yet
+    launches = next_commit = 0
+    requested = lambda: sum(size for _, size in tasks.values()) + sum(size for size, _, _ in finished.values())
+
+    def select_due_windows():
+        """Deterministic runs: picks the references of every window whose commit point was reached."""
+        nonlocal next_window
+        if RESET_EVERY <= 0:
+            window_references.setdefault(0, select_window_references(persona_pool, reference_rng))
+            return
+        while next_window * RESET_EVERY - REFERENCE_LAG <= committed_blueprints:
+            window_references[next_window] = select_window_references(persona_pool, reference_rng)
+            next_window += 1
+
+    if DETERMINISTIC:
+        select_due_windows()
+    run_start = time.monotonic()
+    run_start_count = successful_generations
+    last_stats = run_start
+
+    try:
+        while successful_generations < TARGET_N:
+            loop_start = time.perf_counter()
+            # Launch new tasks if we have capacity
+            # Tasks sleeping in a retry backoff hold no slot, so they do not count against the limit
+            while len(tasks) < limiter.current_limit + limiter.backing_off and successful_generations + requested() < TARGET_N:
+                current_iteration = successful_generations + requested()
+                # Determine which pool of examples to use for this task
+                if DETERMINISTIC:
+                    # Full batches keep every request's blueprints independent of timing; surplus personas are dropped at commit
+                    batch_size = BATCH_SIZE
+                    window = next_blueprint // RESET_EVERY if RESET_EVERY > 0 else 0
+                    if window != reference_window:
+                        if window not in window_references:
+                            break  # Its references are picked once earlier requests are committed
+                        reference_window = window
+                        reference_pool = window_references.pop(window)
+                        print(f"--- 🔄 Blueprint {next_blueprint}: New reference window, {len(reference_pool)} references ---")
+                elif PROMPT_LAYOUT == "legacy":
+                    batch_size = min(BATCH_SIZE, TARGET_N - current_iteration)
+                    if drift_reset_pending:
+                        drift_reset_pending = False
+                        print(f"--- 🔄 Iteration {current_iteration}: Resetting reference pool to seeds after drift ---")
+                        reference_pool = random.sample(seed_personas, min(len(seed_personas), NUM_REFERENCES))
+                    else:
+                        reference_pool = select_legacy_references(persona_pool, current_iteration, batch_size)
+                else:
+                    batch_size = min(BATCH_SIZE, TARGET_N - current_iteration)
+                    # The reference block is part of the cached prompt prefix, so it only
+                    # changes once per RESET_EVERY window, or right away after drift
+                    window = current_iteration // RESET_EVERY if RESET_EVERY > 0 else 0
+                    if drift_reset_pending:
+                        drift_reset_pending = False
+                        reference_window = window
+                        reference_pool = random.sample(seed_personas, min(len(seed_personas), NUM_REFERENCES))
+                        print(f"--- 🔄 Iteration {current_iteration}: Drift reset, {len(reference_pool)} seed references until the next window ---")
+                    elif window != reference_window:
+                        reference_window = window
+                        reference_pool = select_window_references(persona_pool)
+                        print(f"--- 🔄 Iteration {current_iteration}: New reference window, {len(reference_pool)} references ---")
+
+                batch_blocks = [planner[next_blueprint + i] for i in range(batch_size)]
+                next_blueprint += batch_size
+                task = asyncio.create_task(generate_personas(
+                    backend, limiter, reference_pool, batch_blocks, usage_stats, prompt_builder,
+                    seed=(SEED * 1_000_003 + launches) % (1 << 31) if DETERMINISTIC else None,
+                ))
+                tasks[task] = (launches, batch_size)
+                launches += 1
+
+            # Wait for the next task to complete
+            loop_seconds = time.perf_counter() - loop_start
+            done, pending = await asyncio.wait(tasks, timeout=STATS_EVERY, return_when=asyncio.FIRST_COMPLETED)
+            loop_start = time.perf_counter()
+
+            for future in done:
+                launch, size = tasks.pop(future)  # Remove the completed task from the active set
+                results, metrics = await future
+                finished[launch] = (size, results, metrics)
+
+            # The lease is checked before anything is written: after a stall past it, the shard may belong to another worker
+            if lease is not None and not await lease.keep_alive(successful_generations):
+                print(f"⚠️ Lost the lease on shard {lease.shard.shard_id} to another worker. Stopping so only one worker writes its file.")
+                break
+
+            # Results are committed as they complete, or strictly in launch order in deterministic runs
+            while finished:
+                launch = next_commit if DETERMINISTIC else next(iter(finished))
+                if launch not in finished:
+                    break
+                size, results, metrics = finished.pop(launch)
+                next_commit, committed_blueprints = launch + 1, committed_blueprints + size
+
+                for result in results:
+                    if successful_generations >= TARGET_N:
+                        metrics.dropped += 1  # Only full deterministic batches can overshoot the target
+                        continue
+                    persona_dict = result.model_dump()
+                    # Near-duplicates are rejected here, so the gate only holds personas that are written
+                    if novelty_gate is not None and not is_novel(novelty_gate, persona_dict):
+                        metrics.rejected += 1
+                        continue
+                    metrics.accepted += 1
+                    successful_generations += 1
+                    # Add the new persona to the dynamic pool for future generations
+                    persona_pool.add(persona_dict)
+                    writer.write(persona_dict)
+                    if drift_monitor is not None and (reasons := drift_monitor.add(persona_dict)):
+                        drift_reset_pending = True
+                        print(f"--- ⚠️ Drift in the last {DRIFT_WINDOW} personas: {'; '.join(reasons)}. Resetting references to seeds. ---")
+
+                    print(f"✅ ({successful_generations}/{TARGET_N}) Generated: {result.name}")
+
+                    if successful_generations % CHECKPOINT_EVERY == 0:
+                        print(f"\n--- CHECKPOINT: {writer.records_written} personas written to {output_filename} in {writer.batches_written} batches. ---")
+                        if novelty_gate is not None:
+                            print(f"--- {novelty_gate.summary()} ---")
+                        if drift_monitor is not None:
+                            print(f"--- {drift_monitor.summary()} ---")
+                        print(f"--- Usage: {usage_stats.summary(successful_generations - run_start_count)} ---")
+                        print()
+                # Recorded once committed, so the accepted count matches the written output
+                telemetry.record(metrics)
+                if DETERMINISTIC:
+                    select_due_windows()
+
+            if isinstance(backend, CachedBackend) and backend.mode == "replay" and backend.consecutive_misses > REPLAY_MAX_MISSES:
+                raise RuntimeError(
+                    f"{backend.consecutive_misses} cache misses in a row: this run's requests no longer match the recording "
+                    "(different seed, settings, prompts or code?). Use --cache read_through to fill the gaps."
+                )
+
+            now = time.monotonic()
+            snapshot = now - last_stats >= STATS_EVERY
+            if snapshot:
+                last_stats = now
+                rate = (successful_generations - run_start_count) / (now - run_start)
+                print(f"--- 📈 {rate:.2f} personas/sec, {limiter.stats()} ---")
+                if isinstance(router, Router):
+                    print(f"--- 🔀 {router.summary()} ---")
+            telemetry.record_scheduler(limiter, len(tasks), successful_generations, loop_seconds + time.perf_counter() - loop_start, snapshot)
+    finally:
+        # Runs on success, errors and Ctrl-C alike: nothing accepted is ever lost
+        for task in tasks:
+            task.cancel()
+        for _, results, metrics in finished.values():
+            metrics.dropped = len(results)  # Finished but never committed (target reached or lease lost)
+            telemetry.record(metrics)
+        await writer.close()
+        await telemetry.close()
 
     print("\n-----------------------------------------")
     print(f"✅ Target of {TARGET_N} attempted. {successful_generations} personas successfully generated.")
+    elapsed = time.monotonic() - run_start
+    print(f"Throughput: {(successful_generations - run_start_count) / elapsed:.2f} personas/sec, final {limiter.stats()}")
+    print(f"Batch size {BATCH_SIZE}: {usage_stats.summary(successful_generations - run_start_count)}")
+    if novelty_gate is not None:
+        print(novelty_gate.summary())
+    if drift_monitor is not None:
+        print(drift_monitor.summary())
+    print(telemetry.report(successful_generations - run_start_count, INPUT_PRICE, OUTPUT_PRICE, CACHED_INPUT_PRICE))
+    if isinstance(router, Router):
+        print(router.report(INPUT_PRICE, OUTPUT_PRICE))
+    if isinstance(backend, CachedBackend):
+        print(backend.summary())
     print(f"Final data saved in {output_filename}")
+    if metrics_path:
+        print(f"Per-request metrics saved in {metrics_path}")
     print("-----------------------------------------")
+    return successful_generations
+
+async def run_worker(backend, queue: WorkQueue, worker_id: str):
+    """
+    Worker of a sharded run: claims shards one at a time and generates each into its
+    own file, resuming it if a previous worker stopped partway. Once no shard is left
+    to claim, it waits for the running ones to finish, so that a shard whose worker
+    crashed is picked up when its lease expires.
+    """
+    global TARGET_N, SEED
+    while True:
+        shard = queue.claim(worker_id)
+        if shard is None:
+            wait = queue.next_expiry()
+            if wait is None:
+                break
+            print(f"⏳ Worker {worker_id}: no shard to claim ({queue.summary()}). Checking again shortly.")
+            await asyncio.sleep(min(wait + 1, SHARD_POLL_SECONDS))
+            continue
+
+        print(f"\n📦 Worker {worker_id} claimed shard {shard.shard_id}: {shard.target} personas, seed {shard.seed} (attempt {shard.attempts}).")
+        TARGET_N, SEED = shard.target, shard.seed
+        open(shard.path, "a").close()
+        lease = Lease(queue, shard, worker_id)
+        generated = 0
+        try:
+            generated = await main(backend, resume_from=shard.path, lease=lease)
+        finally:
+            lease.finish(generated)
+    print(f"🏁 Worker {worker_id} done: {queue.summary()}")
+
+def spawn_workers(num_workers: int, run_dir: str) -> int:
+    """
+    Starts num_workers local worker processes of this script on a sharded run and
+    waits for them. Each has its own event loop, backend and output files. Returns
+    the number of workers that failed.
+    """
+    processes = []
+    for i in range(num_workers):
+        argv = [sys.executable, sys.argv[0], *sys.argv[1:], "--run_dir", run_dir, "--workers", "1"]
+        if METRICS_PORT is not None:
+            argv += ["--metrics_port", str(METRICS_PORT + i)]
+        processes.append(subprocess.Popen(argv))
+    print(f"🚀 Started {num_workers} worker processes on {run_dir}")
+    try:
+        codes = [process.wait() for process in processes]
+    except KeyboardInterrupt:
+        # Ctrl-C reaches the workers too; let them hand their shards back
+        codes = [process.wait() for process in processes]
+    return sum(1 for code in codes if code != 0)
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    parser = argparse.ArgumentParser(description="Generate synthetic personas with an LLM.")
+    parser.add_argument(
+        "--resume",
+        type=str,
+        default=None,
+        metavar="FILE",
+        help="Existing raw .jsonl file to continue. Already generated personas count toward the target and new ones are appended to it."
+    )
+    parser.add_argument(
+        "--batch_size",
+        type=int,
+        default=BATCH_SIZE,
+        help="Personas requested per API call."
+    )
+    parser.add_argument(
+        "--seed",
+        type=int,
+        default=SEED,
+        help="Seed for a reproducible run (building blocks, names and reference selection)."
+    )
+    parser.add_argument(
+        "--stratify",
+        action="store_true",
+        default=STRATIFY,
+        help="Match component counts to their target weights exactly instead of sampling them independently."
+    )
+    parser.add_argument(
+        "--prompt_layout",
+        choices=["prefix", "legacy"],
+        default=PROMPT_LAYOUT,
+        help="'prefix' puts stable content first for provider prefix caching; 'legacy' is the original prompt, for comparison."
+    )
+    parser.add_argument(
+        "--reference_selection",
+        choices=["diverse", "random"],
+        default=REFERENCE_SELECTION,
+        help="How references are picked from the recent personas: 'diverse' (farthest-point over MinHash sketches) or 'random'."
+    )
+    parser.add_argument(
+        "--backend",
+        choices=["hf", "mock"],
+        default="hf",
+        help="Inference backend. 'mock' returns fake personas locally, for testing and benchmarking without an API key."
+    )
+    parser.add_argument(
+        "--provider",
+        type=str,
+        default=PROVIDER,
+        help="Inference provider used by the 'hf' backend."
+    )
+    parser.add_argument(
+        "--providers",
+        nargs="+",
+        default=PROVIDERS,
+        metavar="NAME[=MODEL]",
+        help="Route requests across these providers of the 'hf' backend, weighted by their live latency and error rate. A model id can be given per provider."
+    )
+    parser.add_argument(
+        "--hedge",
+        action="store_true",
+        default=HEDGE,
+        help=f"With several providers, send a duplicate request to a second provider when the first is slower than its p{HEDGE_QUANTILE} latency, and cancel the loser."
+    )
+    parser.add_argument(
+        "--base_url",
+        type=str,
+        default=None,
+        help="OpenAI-compatible endpoint for the 'hf' backend instead of a provider (e.g. a local mock_server.py)."
+    )
+    parser.add_argument("--request_timeout", type=float, default=REQUEST_TIMEOUT, help="Seconds before an API call to the 'hf' backend times out and is retried.")
+    parser.add_argument("--mock_latency", type=str, default=None, help="Latency distribution of the mock backend, e.g. 'lognormal:1.5,0.4'.")
+    parser.add_argument("--mock_error_rate", type=float, default=None, help="Fraction of mock calls failing with a 429 or 503.")
+    parser.add_argument("--mock_malformed_rate", type=float, default=None, help="Fraction of mock calls returning malformed JSON.")
+    parser.add_argument("--mock_token_latency", type=float, default=None, help="Extra seconds per completion token for the mock backend.")
+    parser.add_argument("--mock_prefill_latency", type=float, default=None, help="Extra seconds per uncached prompt token for the mock backend.")
+    parser.add_argument("--mock_ramble_rate", type=float, default=None, help="Fraction of mock personas whose background runs on far past its length limit.")
+    parser.add_argument("--mock_providers", nargs="+", default=None, metavar="NAME=LATENCY[@ERROR_RATE]", help="Route across several mock providers, e.g. 'fast=lognormal:1,0.3' 'flaky=lognormal:2,0.8@0.05'.")
+    parser.add_argument("--metrics_port", type=int, default=METRICS_PORT, help="Serve Prometheus-style metrics on this local port during the run.")
+    parser.add_argument("--target_n", type=int, default=TARGET_N, help="Number of personas to generate.")
+    parser.add_argument("--shards", type=int, default=None, help="Start a sharded run: split the target into this many shards, each with its own seed and output file, in a new directory under data/raw.")
+    parser.add_argument("--run_dir", type=str, default=None, help="Join an existing sharded run (e.g. from another machine sharing the directory).")
+    parser.add_argument("--workers", type=int, default=1, help="Local worker processes for a sharded run.")
+    parser.add_argument("--worker_id", type=str, default=None, help="Name of this worker in the shard queue (default: host-pid).")
+    parser.add_argument("--cache", choices=CACHE_MODES, default=RESPONSE_CACHE, help="Put the on-disk response cache in front of the backend: 'record' stores every response, 'replay' serves only cached ones, 'read_through' calls the backend on misses.")
+    parser.add_argument("--cache_path", type=str, default=RESPONSE_CACHE_PATH, help="SQLite file of the response cache.")
+    parser.add_argument("--deterministic", action="store_true", default=DETERMINISTIC, help="Make the requests and output depend only on --seed and the responses (implied by --cache record/replay).")
+    parser.add_argument("--drift_reset", action="store_true", default=DRIFT_RESET, help="Reset the references to seeds as soon as the recent personas drift (opening-phrase collapse, repetition, or trait, profession and age distributions far from the components). In the legacy layout this replaces the fixed RESET_EVERY resets; in the prefix layout it comes on top of the RESET_EVERY reference windows, which keep rotating.")
+    parser.add_argument("--drift_window", type=int, default=DRIFT_WINDOW, help="Recent personas checked for drift with --drift_reset.")
+    parser.add_argument("--stream", action="store_true", default=STREAM, help="Stream completions, validate them as they arrive, and abort a stream as soon as its output breaks the schema or a length limit.")
+    args = parser.parse_args()
+    if args.resume and (args.shards or args.run_dir):
+        parser.error("--resume cannot be combined with a sharded run; rerun with --run_dir to resume one.")
+    deterministic = args.deterministic or args.cache in ("record", "replay")
+    if deterministic and (args.seed is None or args.prompt_layout == "legacy"):
+        parser.error("Deterministic runs (--deterministic, --cache record/replay) need --seed and the 'prefix' prompt layout.")
+    if deterministic and args.drift_reset:
+        parser.error("--drift_reset cannot be combined with deterministic runs: when a reset reaches the next request depends on timing.")
+    if args.stream and args.hedge:
+        parser.error("--hedge cannot be combined with --stream: a stream that was read from cannot be raced by another provider.")
+
+    mock_options = dict(
+        malformed_rate=args.mock_malformed_rate, token_latency=args.mock_token_latency,
+        prefill_latency=args.mock_prefill_latency, ramble_rate=args.mock_ramble_rate,
+    )
+    routes = []
+    if args.backend == "hf" and args.providers:
+        routes = [ProviderRoute(name, make_backend("hf", provider=name, timeout=args.request_timeout), model) for name, model in map(parse_route_spec, args.providers)]
+    elif args.backend == "mock" and args.mock_providers:
+        for name, spec in map(parse_route_spec, args.mock_providers):
+            latency, _, error_rate = (spec or "").partition("@")
+            mock = make_backend("mock", latency=latency or args.mock_latency, error_rate=float(error_rate) if error_rate else args.mock_error_rate, **mock_options)
+            routes.append(ProviderRoute(name, mock))
+
+    if args.cache == "replay":
+        backend = None  # A replay never reaches a provider, so it needs no API key
+    elif routes:
+        backend = Router(routes, hedge=args.hedge, hedge_quantile=HEDGE_QUANTILE, hedge_budget=HEDGE_BUDGET, seed=args.seed)
+    elif args.backend == "hf":
+        backend = make_backend("hf", provider=args.provider, base_url=args.base_url, timeout=args.request_timeout)
+    else:
+        backend = make_backend("mock", latency=args.mock_latency, error_rate=args.mock_error_rate, **mock_options)
+    if args.cache:
+        backend = CachedBackend(backend, ResponseCache(args.cache_path, RESPONSE_CACHE_MAX_BYTES), args.cache)
+
+    BATCH_SIZE = args.batch_size
+    PROMPT_LAYOUT = args.prompt_layout
+    REFERENCE_SELECTION = args.reference_selection
+    SEED = args.seed
+    STRATIFY = args.stratify
+    METRICS_PORT = args.metrics_port
+    TARGET_N = args.target_n
+    DETERMINISTIC = deterministic
+    STREAM = args.stream
+    DRIFT_RESET = args.drift_reset
+    DRIFT_WINDOW = args.drift_window
+
+    if args.shards or args.run_dir:
+        run_dir = args.run_dir or os.path.join("data/raw", f"data_{MODEL_NAME.split('/')[-1]}_{int(time.time())}")
+        if not args.shards and not os.path.exists(os.path.join(run_dir, "queue.sqlite")):
+            parser.error(f"'{run_dir}' holds no sharded run. Start one with --shards.")
+        queue = WorkQueue(run_dir, lease_seconds=SHARD_LEASE_SECONDS)
+        if args.shards:
+            run_seed = queue.create(TARGET_N, args.shards, SEED)
+            if not args.run_dir:
+                print(f"Sharded run in {run_dir}: {TARGET_N} personas in {args.shards} shards, run seed {run_seed}. Join it from other machines with --run_dir {run_dir}")
+        if args.workers > 1:
+            failed = spawn_workers(args.workers, run_dir)
+            print(f"Sharded run in {run_dir}: {queue.summary()}" + (f", {failed} worker(s) failed" if failed else ""))
+            sys.exit(1 if failed else 0)
+        asyncio.run(run_worker(backend, queue, args.worker_id or default_worker_id()))
+    else:
+        asyncio.run(main(backend, resume_from=args.resume))
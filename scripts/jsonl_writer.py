@@ -0,0 +1,108 @@
+"""
+Background JSONL writer for the asyncio generation loop.
+
+Records are queued without blocking the event loop and appended by a single
+writer task through one open file handle. Whatever has queued up since the
+last write goes out as one batch in a worker thread, and the file is fsynced
+every `fsync_every` records or `fsync_interval` seconds (also while no new
+records arrive), so a crash loses at most the records written since the last
+fsync (and nothing at all on a plain Ctrl-C, which drains the queue).
+"""
+
+import os
+import json
+import time
+import asyncio
+
+_STOP = object()
+
+
+class AsyncJsonlWriter:
+    """Appends dicts to a JSONL file from a dedicated background task."""
+
+    def __init__(self, filepath: str, fsync_every: int = 50, fsync_interval: float = 5.0):
+        self.filepath = filepath
+        self.fsync_every = fsync_every          # fsync after this many records...
+        self.fsync_interval = fsync_interval    # ...or after this many seconds, whichever comes first
+        self.records_written = 0
+        self.batches_written = 0
+        self._unsynced = 0
+        self._last_fsync = time.monotonic()
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._file = None
+        self._task: asyncio.Task | None = None
+        self._closing = False
+
+    async def start(self):
+        self._file = open(self.filepath, "a", encoding="utf-8")
+        self._closing = False
+        self._task = asyncio.create_task(self._run())
+
+    def write(self, record: dict):
+        """Queues a record for writing. Never blocks."""
+        if self._closing:
+            raise RuntimeError("Writer has already been closed.")
+        if self._task is None:
+            raise RuntimeError("Writer has not been started.")
+        if self._task.done():
+            # Surface a failed writer (e.g. disk full) instead of silently queueing forever
+            self._task.result()
+            raise RuntimeError("Writer has already been closed.")
+        self._queue.put_nowait(record)
+
+    async def close(self):
+        """Writes every queued record, fsyncs and closes the file."""
+        if self._task is None:
+            return
+        self._closing = True
+        if not self._task.done():
+            self._queue.put_nowait(_STOP)
+        try:
+            await self._task
+        finally:
+            self._task = None
+            await asyncio.to_thread(self._close_file)
+
+    async def _run(self):
+        stopping = False
+        while not stopping:
+            if self._unsynced:
+                # Records are waiting for an fsync: sync them once the interval is up, even if nothing new arrives
+                remaining = self.fsync_interval - (time.monotonic() - self._last_fsync)
+                try:
+                    batch = [await asyncio.wait_for(self._queue.get(), max(remaining, 0.0))]
+                except asyncio.TimeoutError:
+                    await asyncio.to_thread(self._fsync)
+                    continue
+            else:
+                batch = [await self._queue.get()]
+            while not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            stop = next((i for i, record in enumerate(batch) if record is _STOP), None)
+            if stop is not None:
+                del batch[stop:]
+                stopping = True
+            if batch:
+                await asyncio.to_thread(self._write_batch, batch)
+
+    def _write_batch(self, batch: list[dict]):
+        self._file.write("".join(json.dumps(record, ensure_ascii=False) + "\n" for record in batch))
+        self._file.flush()
+        self.records_written += len(batch)
+        self.batches_written += 1
+        self._unsynced += len(batch)
+        if self._unsynced >= self.fsync_every or time.monotonic() - self._last_fsync >= self.fsync_interval:
+            self._fsync()
+
+    def _fsync(self):
+        os.fsync(self._file.fileno())
+        self._unsynced = 0
+        self._last_fsync = time.monotonic()
+
+    def _close_file(self):
+        if self._file is None:
+            return
+        self._file.flush()
+        self._fsync()
+        self._file.close()
+        self._file = None
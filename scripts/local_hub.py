@@ -0,0 +1,100 @@
+"""
+Local stand-in for the parts of the Hugging Face Hub the uploader uses.
+
+Blobs are stored content-addressed under `<root>/blobs/<sha256>` (like LFS
+objects, an upload of content the hub already has is skipped), and every
+commit writes the full file tree of the repo to `<root>/repos/<repo>/commits/`.
+It can throttle uploads to a given bandwidth and fail after a number of blob
+uploads, so delta uploads and resume can be tested offline:
+
+    python scripts/upload_to_hf.py SPB-2508 --shard_dir data/export/processed_personas --local_hub /tmp/hub
+"""
+
+import os
+import json
+import time
+import shutil
+import hashlib
+import threading
+
+
+class LocalHub:
+    def __init__(self, root: str, bandwidth: float | None = None, fail_after: int | None = None):
+        self.root = root
+        self.bandwidth = bandwidth  # Simulated upload speed in bytes/sec (None for unthrottled)
+        self.fail_after = fail_after  # Raise ConnectionError on the blob upload after this many
+        self.blobs_uploaded = 0
+        self.bytes_uploaded = 0
+        self._lock = threading.Lock()
+        os.makedirs(os.path.join(root, "blobs"), exist_ok=True)
+
+    def _repo_dir(self, repo_id: str) -> str:
+        return os.path.join(self.root, "repos", repo_id.replace("/", "__"))
+
+    def create_repo(self, repo_id: str):
+        os.makedirs(os.path.join(self._repo_dir(repo_id), "commits"), exist_ok=True)
+
+    def has_blob(self, sha256: str) -> bool:
+        return os.path.exists(os.path.join(self.root, "blobs", sha256))
+
+    def upload_blob(self, repo_id: str, path_in_repo: str, local_path: str, sha256: str) -> bool:
+        """Stores the file's content unless the hub already has it. Returns True if bytes were sent."""
+        if self.has_blob(sha256):
+            return False
+        with self._lock:
+            if self.fail_after is not None and self.blobs_uploaded >= self.fail_after:
+                raise ConnectionError(f"Simulated connection loss while uploading '{path_in_repo}'.")
+            self.blobs_uploaded += 1
+        size = os.path.getsize(local_path)
+        if self.bandwidth:
+            time.sleep(size / self.bandwidth)
+        blob_path = os.path.join(self.root, "blobs", sha256)
+        tmp_path = f"{blob_path}.{threading.get_ident()}.tmp"
+        digest = hashlib.sha256()
+        with open(local_path, "rb") as src, open(tmp_path, "wb") as dst:
+            for block in iter(lambda: src.read(1024 * 1024), b""):
+                digest.update(block)
+                dst.write(block)
+        if digest.hexdigest() != sha256:
+            os.remove(tmp_path)
+            raise ValueError(f"Content of '{local_path}' does not match sha256 {sha256}.")
+        os.replace(tmp_path, blob_path)
+        with self._lock:
+            self.bytes_uploaded += size
+        return True
+
+    def list_files(self, repo_id: str) -> dict[str, str]:
+        """Returns {path_in_repo: sha256} at the latest commit."""
+        head = os.path.join(self._repo_dir(repo_id), "HEAD")
+        if not os.path.exists(head):
+            return {}
+        with open(head, "r", encoding="utf-8") as f:
+            commit_id = f.read().strip()
+        with open(os.path.join(self._repo_dir(repo_id), "commits", f"{commit_id}.json"), "r", encoding="utf-8") as f:
+            return json.load(f)["files"]
+
+    def create_commit(self, repo_id: str, additions: dict[str, tuple[str, str]], deletions: list[str], message: str) -> str:
+        """
+        Atomically applies additions ({path_in_repo: (local_path, sha256)}) and deletions
+        on top of the latest commit. Additions whose blob is missing are uploaded first.
+        """
+        for path_in_repo, (local_path, sha256) in additions.items():
+            self.upload_blob(repo_id, path_in_repo, local_path, sha256)
+        with self._lock:
+            files = self.list_files(repo_id)
+            for path_in_repo in deletions:
+                files.pop(path_in_repo, None)
+            files.update({path_in_repo: sha256 for path_in_repo, (_, sha256) in additions.items()})
+            commit = {"message": message, "created_at": time.time(), "files": files}
+            commit_id = hashlib.sha1(json.dumps(commit, sort_keys=True).encode("utf-8")).hexdigest()
+            repo_dir = self._repo_dir(repo_id)
+            with open(os.path.join(repo_dir, "commits", f"{commit_id}.json"), "w", encoding="utf-8") as f:
+                json.dump(commit, f, indent=2)
+            with open(os.path.join(repo_dir, "HEAD.tmp"), "w", encoding="utf-8") as f:
+                f.write(commit_id)
+            os.replace(os.path.join(repo_dir, "HEAD.tmp"), os.path.join(repo_dir, "HEAD"))
+        return commit_id
+
+    def download(self, repo_id: str, path_in_repo: str, local_path: str):
+        """Copies a file of the latest commit to local_path."""
+        shutil.copyfile(os.path.join(self.root, "blobs", self.list_files(repo_id)[path_in_repo]), local_path)
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Local OpenAI-compatible chat completion server backed by MockBackend.
+
+Serves POST /v1/chat/completions with schema-valid persona JSON, as one
+response or, for "stream": true, as server-sent events, so the real Hugging
+Face client path can be exercised without paying for tokens:
+
+    python scripts/mock_server.py --port 8000 --latency lognormal:1.5,0.4 --error_rate 0.02
+    ./scripts/generate.uv.py --base_url http://127.0.0.1:8000
+"""
+
+import json
+import time
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from backends import BackendError, MockBackend, stream_chunks
+
+
+def make_handler(backend: MockBackend):
+    # The mock's RNG is not thread-safe, and sampling is cheap, so serialize it
+    lock = threading.Lock()
+
+    class MockHandler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass  # Keep the console quiet under load
+
+        def _send_json(self, status: int, body: dict):
+            payload = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def do_POST(self):
+            if not self.path.rstrip("/").endswith("/chat/completions"):
+                self._send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+                return
+            length = int(self.headers.get("Content-Length", 0))
+            request = json.loads(self.rfile.read(length) or b"{}")
+
+            stream = bool(request.get("stream"))
+            with lock:
+                body = backend.completion_body(
+                    request.get("messages", []),
+                    request.get("model", "mock"),
+                    request.get("response_format"),
+                    request.get("max_tokens"),
+                )
+                latency = backend.first_token_latency(body) if stream else backend.response_latency(body)
+            time.sleep(latency)  # Each request has its own thread
+            with lock:
+                try:
+                    backend.maybe_fail()
+                except BackendError as e:
+                    self._send_json(e.status_code, {"error": {"message": str(e)}})
+                    return
+            if stream:
+                self._send_stream(body, bool((request.get("stream_options") or {}).get("include_usage")))
+            else:
+                self._send_json(200, body)
+
+        def _send_stream(self, body: dict, include_usage: bool):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            self.close_connection = True
+            try:
+                for chunk in stream_chunks(body, backend.STREAM_CHUNK_CHARS):
+                    if chunk["choices"]:
+                        time.sleep(backend.token_latency * backend.count_tokens(chunk["choices"][0]["delta"]["content"]))
+                    elif not include_usage:
+                        continue
+                    self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+                    self.wfile.flush()
+                self.wfile.write(b"data: [DONE]\n\n")
+            except (BrokenPipeError, ConnectionResetError):
+                pass  # The client closed the stream early
+
+    return MockHandler
+
+
+class MockServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024  # The default backlog of 5 resets connections under concurrent load
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a local mock chat completion server for offline testing.")
+    parser.add_argument("--host", type=str, default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--latency", type=str, default="lognormal:1.5,0.4", help="Latency distribution, e.g. 'constant:0.5', 'uniform:0.5,3', 'exponential:1.5', 'lognormal:1.5,0.4'.")
+    parser.add_argument("--error_rate", type=float, default=0.0, help="Fraction of requests answered with a 429 or 503.")
+    parser.add_argument("--malformed_rate", type=float, default=0.0, help="Fraction of responses with truncated or schema-violating JSON.")
+    parser.add_argument("--token_latency", type=float, default=0.0, help="Extra seconds per completion token, so larger outputs take longer.")
+    parser.add_argument("--prefill_latency", type=float, default=0.0, help="Extra seconds per uncached prompt token, so prefix cache hits are faster.")
+    parser.add_argument("--ramble_rate", type=float, default=0.0, help="Fraction of personas whose background runs on far past its length limit.")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    backend = MockBackend(args.latency, args.error_rate, args.malformed_rate, args.seed, args.token_latency, args.prefill_latency, args.ramble_rate)
+    server = MockServer((args.host, args.port), make_handler(backend))
+    print(f"Mock chat completion server listening on http://{args.host}:{args.port} (latency {args.latency}, error rate {args.error_rate}, malformed rate {args.malformed_rate})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,438 @@
+#!/usr/bin/env -S uv run --script
+#
+# /// script
+# requires-python = ">=3.12"
+# dependencies = [
+#   "numpy"
+# ]
+# ///
+"""
+Indexed, memory-mapped access to a processed persona file.
+
+process.uv.py writes a sidecar index next to every processed JSONL file
+(`processed_personas_<ts>.jsonl` -> `processed_personas_<ts>.index/`):
+
+    meta.json          rows, covered bytes, trait and model vocabularies
+    offsets.npy        byte offset of every record, plus the end of the last one
+    id_keys.npy        128-bit hash of every record's id
+    id_table.npy       open-addressing hash table (linear probing) from id hash to row
+    ages.npy           age of every record (-1 if missing)
+    age_order.npy      rows sorted by age, for age range queries
+    trait_offsets.npy  inverted index on normalized traits (CSR: rows of trait t are
+    trait_rows.npy       trait_rows[trait_offsets[t]:trait_offsets[t + 1]], sorted)
+    model_offsets.npy  inverted index on model, same layout
+    model_rows.npy
+
+`PersonaBank` memory-maps the arrays and the JSONL, so opening a bank only
+reads meta.json, and records are decoded only when asked for: `bank[row]` and
+`bank.get(id)` (O(1) through the hash table), `bank.rows(...)` for filtered row
+sets, and `bank.sample(...)` for filtered, optionally weighted sampling:
+
+    bank = PersonaBank("data/processed/processed_personas.jsonl")
+    bank.sample(8, traits=["sarcastic"], age=(30, 45), seed=0)
+
+Indexes of older processed files are built with:
+
+    ./scripts/persona_bank.py data/processed/processed_personas_<ts>.jsonl --build
+"""
+
+import os
+import json
+import mmap
+import time
+import hashlib
+import argparse
+import functools
+from array import array
+
+import numpy as np
+
+ROW_DTYPE = np.uint32  # Row numbers in the index arrays (up to 4 billion personas)
+INDEX_VERSION = 1
+
+
+def index_dir(jsonl_path: str) -> str:
+    """Directory of the sidecar index of a processed JSONL file."""
+    return os.path.splitext(jsonl_path)[0] + ".index"
+
+
+def normalize_trait(trait: str) -> str:
+    return " ".join(trait.lower().split())
+
+
+def id_key(persona_id: str) -> tuple[int, int]:
+    """128-bit hash of a persona id as two unsigned 64-bit integers (works for any id format)."""
+    digest = hashlib.blake2b(persona_id.encode("utf-8"), digest_size=16).digest()
+    return int.from_bytes(digest[:8], "little"), int.from_bytes(digest[8:], "little")
+
+
+def build_id_table(keys: np.ndarray) -> np.ndarray:
+    """
+    Open-addressing hash table (linear probing, load factor <= 0.5) mapping the low
+    half of each id key to its row; -1 marks empty slots. Built in vectorized rounds:
+    round k places every pending row whose k-th probe slot is free (the lowest row
+    wins a contested slot), so every slot a lookup probes before finding a row is
+    occupied, as linear probing requires.
+    """
+    size = 1 << max(4, (2 * len(keys) - 1).bit_length())
+    mask = np.uint64(size - 1)
+    table = np.full(size, -1, dtype=np.int64)
+    home = (keys[:, 1] & mask).astype(np.int64)
+    pending = np.arange(len(keys), dtype=np.int64)
+    probe = 0
+    while len(pending):
+        slots = (home[pending] + probe) & (size - 1)
+        free = np.flatnonzero(table[slots] == -1)
+        taken, first = np.unique(slots[free], return_index=True)
+        table[taken] = pending[free[first]]
+        placed = np.zeros(len(pending), dtype=bool)
+        placed[free[first]] = True
+        pending = pending[~placed]
+        probe += 1
+    return table
+
+
+def build_inverted(codes: np.ndarray, rows: np.ndarray, vocabulary_size: int) -> tuple[np.ndarray, np.ndarray]:
+    """CSR inverted index from (code, row) pairs: the rows of code c, sorted, are rows[offsets[c]:offsets[c + 1]]."""
+    order = np.lexsort((rows, codes))
+    counts = np.bincount(codes, minlength=vocabulary_size)
+    offsets = np.zeros(vocabulary_size + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+    return offsets, rows[order].astype(ROW_DTYPE)
+
+
+def _save(directory: str, name: str, array_: np.ndarray):
+    # Written next to the final name and renamed, so readers never see a partial file
+    tmp_path = os.path.join(directory, f"{name}.tmp.npy")
+    np.save(tmp_path, array_)
+    os.replace(tmp_path, os.path.join(directory, f"{name}.npy"))
+
+
+class BankIndexBuilder:
+    """
+    Collects index entries while a processed file is written (one add() per record,
+    in file order) and writes the sidecar index. With `start_bytes`, the file already
+    holds that many bytes (incremental processing): their entries are taken from the
+    existing index if it covers exactly those bytes, and re-read from the file otherwise.
+    """
+
+    def __init__(self, jsonl_path: str, start_bytes: int = 0):
+        self.jsonl_path = jsonl_path
+        self.directory = index_dir(jsonl_path)
+        self.offsets = array("Q")
+        self.end = 0
+        self.key_parts = array("Q")   # hi, lo of every id key
+        self.ages = array("h")
+        self.trait_codes, self.trait_rows = array("I"), array("I")
+        self.model_codes, self.model_rows = array("I"), array("I")
+        self.traits: dict[str, int] = {}
+        self.models: dict[str, int] = {}
+        if start_bytes:
+            self._resume(start_bytes)
+
+    def __len__(self) -> int:
+        return len(self.offsets)
+
+    def _resume(self, start_bytes: int):
+        meta_path = os.path.join(self.directory, "meta.json")
+        if os.path.exists(meta_path):
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            if meta.get("version") == INDEX_VERSION and meta["bytes"] == start_bytes:
+                self._load_existing(meta)
+                return
+        print(f"Index of '{self.jsonl_path}' is missing or stale. Re-reading the first {start_bytes} bytes.")
+        self.scan(0, start_bytes)
+
+    def _load_existing(self, meta: dict):
+        load = lambda name: np.load(os.path.join(self.directory, f"{name}.npy"))
+        offsets = load("offsets")
+        self.offsets.frombytes(offsets[:-1].astype(np.uint64).tobytes())
+        self.end = int(offsets[-1])
+        self.key_parts.frombytes(load("id_keys").astype(np.uint64).tobytes())
+        self.ages.frombytes(load("ages").astype(np.int16).tobytes())
+        self.traits = {trait: code for code, trait in enumerate(meta["traits"])}
+        self.models = {model: code for code, model in enumerate(meta["models"])}
+        for name, codes, rows in (("trait", self.trait_codes, self.trait_rows), ("model", self.model_codes, self.model_rows)):
+            offsets = load(f"{name}_offsets")
+            codes.frombytes(np.repeat(np.arange(len(offsets) - 1, dtype=np.uint32), np.diff(offsets)).tobytes())
+            rows.frombytes(load(f"{name}_rows").astype(np.uint32).tobytes())
+
+    def scan(self, start: int = 0, end: int | None = None):
+        """Adds the records in bytes [start, end) of the JSONL file by reading them back."""
+        with open(self.jsonl_path, "rb") as f:
+            f.seek(start)
+            offset, end = start, os.path.getsize(self.jsonl_path) if end is None else end
+            while offset < end:
+                line = f.readline()
+                if not line:
+                    break
+                if line.strip():
+                    persona = json.loads(line)
+                    self.add(offset, len(line), persona.get("id") or "", persona.get("age"), persona.get("traits"), persona.get("model"))
+                offset += len(line)
+
+    def add(self, offset: int, length: int, persona_id: str, age, traits, model: str | None):
+        """Indexes the record at bytes [offset, offset + length) of the file."""
+        if offset != (self.end if len(self.offsets) else offset):
+            raise ValueError(f"Records must be indexed in file order (got offset {offset}, expected {self.end}).")
+        row = len(self.offsets)
+        self.offsets.append(offset)
+        self.end = offset + length
+        self.key_parts.extend(id_key(persona_id))
+        self.ages.append(age if isinstance(age, int) and 0 <= age < 32768 else -1)
+        for trait in {normalize_trait(t) for t in traits or () if isinstance(t, str)}:
+            self.trait_codes.append(self.traits.setdefault(trait, len(self.traits)))
+            self.trait_rows.append(row)
+        self.model_codes.append(self.models.setdefault(model or "", len(self.models)))
+        self.model_rows.append(row)
+
+    def write(self):
+        """Writes the index files, then meta.json (which readers check against the file)."""
+        os.makedirs(self.directory, exist_ok=True)
+        offsets = np.empty(len(self.offsets) + 1, dtype=np.uint64)
+        offsets[:-1] = np.frombuffer(self.offsets, dtype=np.uint64)
+        offsets[-1] = self.end
+        keys = np.frombuffer(self.key_parts, dtype=np.uint64).reshape(-1, 2)
+        ages = np.frombuffer(self.ages, dtype=np.int16)
+        _save(self.directory, "offsets", offsets)
+        _save(self.directory, "id_keys", keys)
+        _save(self.directory, "id_table", build_id_table(keys))
+        _save(self.directory, "ages", ages)
+        _save(self.directory, "age_order", np.argsort(ages, kind="stable").astype(ROW_DTYPE))
+        for name, codes, rows, vocabulary in (
+            ("trait", self.trait_codes, self.trait_rows, self.traits),
+            ("model", self.model_codes, self.model_rows, self.models),
+        ):
+            inverted_offsets, inverted_rows = build_inverted(np.frombuffer(codes, dtype=np.uint32), np.frombuffer(rows, dtype=np.uint32), len(vocabulary))
+            _save(self.directory, f"{name}_offsets", inverted_offsets)
+            _save(self.directory, f"{name}_rows", inverted_rows)
+
+        meta = {
+            "version": INDEX_VERSION,
+            "rows": len(self.offsets),
+            "bytes": self.end,
+            "traits": list(self.traits),
+            "models": list(self.models),
+            "updated_at": int(time.time()),
+        }
+        tmp_path = os.path.join(self.directory, "meta.json.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False)
+        os.replace(tmp_path, os.path.join(self.directory, "meta.json"))
+
+
+class PersonaBank:
+    """Read-only, memory-mapped persona file with its sidecar index (see the module docstring)."""
+
+    def __init__(self, jsonl_path: str):
+        self.jsonl_path = jsonl_path
+        self.directory = index_dir(jsonl_path)
+        meta_path = os.path.join(self.directory, "meta.json")
+        if not os.path.exists(meta_path):
+            raise FileNotFoundError(f"No index for '{jsonl_path}'. Build it with: ./scripts/persona_bank.py {jsonl_path} --build")
+        with open(meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        size = os.path.getsize(jsonl_path)
+        if meta.get("version") != INDEX_VERSION or meta["bytes"] != size:
+            raise ValueError(f"The index of '{jsonl_path}' covers {meta['bytes']} bytes of {size} (stale). Rebuild it with --build.")
+        self.meta = meta
+        load = lambda name: np.load(os.path.join(self.directory, f"{name}.npy"), mmap_mode="r")
+        self._offsets = load("offsets")
+        self._id_keys = load("id_keys")
+        self._id_table = load("id_table")
+        self._ages = load("ages")
+        self._age_order = load("age_order")
+        self._trait_offsets, self._trait_rows = load("trait_offsets"), load("trait_rows")
+        self._model_offsets, self._model_rows = load("model_offsets"), load("model_rows")
+        self._file = open(jsonl_path, "rb")
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+        if size and hasattr(mmap, "MADV_RANDOM"):
+            self._mmap.madvise(mmap.MADV_RANDOM)  # Records are read at random: no readahead
+
+    def close(self):
+        if isinstance(self._mmap, mmap.mmap):
+            self._mmap.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self) -> int:
+        return self.meta["rows"]
+
+    def __getitem__(self, row: int) -> dict:
+        row = int(row)
+        if not 0 <= row < len(self):
+            raise IndexError(row)
+        return json.loads(self._mmap[int(self._offsets[row]):int(self._offsets[row + 1])])
+
+    @functools.cached_property
+    def _trait_codes(self) -> dict[str, int]:
+        return {trait: code for code, trait in enumerate(self.meta["traits"])}
+
+    @functools.cached_property
+    def _model_codes(self) -> dict[str, int]:
+        return {model: code for code, model in enumerate(self.meta["models"])}
+
+    @property
+    def models(self) -> list[str]:
+        return list(self.meta["models"])
+
+    @property
+    def ages(self) -> np.ndarray:
+        """Age of every row (-1 if missing), memory-mapped; e.g. to build sampling weights."""
+        return self._ages
+
+    def trait_counts(self) -> dict[str, int]:
+        """Number of personas per normalized trait, most common first."""
+        counts = np.diff(self._trait_offsets)
+        return {self.meta["traits"][code]: int(counts[code]) for code in np.argsort(-counts, kind="stable")}
+
+    # --- Lookup by id ---
+
+    def row_of(self, persona_id: str) -> int | None:
+        hi, lo = id_key(persona_id)
+        mask = len(self._id_table) - 1
+        slot = lo & mask
+        while True:
+            row = int(self._id_table[slot])
+            if row < 0:
+                return None
+            key = self._id_keys[row]
+            if int(key[0]) == hi and int(key[1]) == lo:
+                return row
+            slot = (slot + 1) & mask
+
+    def get(self, persona_id: str) -> dict | None:
+        row = self.row_of(persona_id)
+        return None if row is None else self[row]
+
+    # --- Filtering and sampling ---
+
+    def _postings(self, offsets: np.ndarray, rows: np.ndarray, code: int | None) -> np.ndarray:
+        if code is None:
+            return np.empty(0, dtype=ROW_DTYPE)
+        return rows[offsets[code]:offsets[code + 1]]
+
+    def _any_of(self, offsets, rows, codes: dict, values) -> np.ndarray:
+        """Sorted rows holding any of the values."""
+        lists = [self._postings(offsets, rows, codes.get(value)) for value in values]
+        return lists[0] if len(lists) == 1 else np.unique(np.concatenate(lists)) if lists else np.empty(0, dtype=ROW_DTYPE)
+
+    def rows(self, traits=None, any_traits=None, age: tuple[int, int] | None = None, model=None) -> np.ndarray:
+        """
+        Sorted rows matching every given filter: all of `traits`, at least one of
+        `any_traits`, `age` in the inclusive (min, max) range, and `model` (a name or a
+        list of names). Without filters, all rows. The smallest posting list is the
+        starting set; the other filters only test its members.
+        """
+        sets = [self._postings(self._trait_offsets, self._trait_rows, self._trait_codes.get(normalize_trait(trait))) for trait in traits or ()]
+        if any_traits:
+            sets.append(self._any_of(self._trait_offsets, self._trait_rows, self._trait_codes, [normalize_trait(t) for t in any_traits]))
+        if model is not None:
+            sets.append(self._any_of(self._model_offsets, self._model_rows, self._model_codes, [model] if isinstance(model, str) else model))
+
+        if sets:
+            sets.sort(key=len)
+            candidates = np.asarray(sets[0])
+            for other in sets[1:]:
+                if not len(candidates):
+                    break
+                candidates = candidates[np.isin(candidates, other, assume_unique=True)]
+            if age is not None and len(candidates):
+                ages = self._ages[candidates]
+                candidates = candidates[(ages >= age[0]) & (ages <= age[1])]
+            return candidates
+        if age is not None:
+            lo, hi = self._age_range(age)
+            return np.sort(self._age_order[lo:hi])
+        return np.arange(len(self), dtype=ROW_DTYPE)
+
+    def _age_range(self, age: tuple[int, int]) -> tuple[int, int]:
+        """Slice of age_order holding the ages in the inclusive range (binary search over the sorted ages)."""
+        ages, order = self._ages, self._age_order
+        bound = lambda value: self._search(lambda i: ages[order[i]] < value)
+        return bound(age[0]), bound(age[1] + 1)
+
+    def _search(self, before) -> int:
+        """First index i of age_order for which before(i) is false."""
+        lo, hi = 0, len(self._age_order)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if before(mid):
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def sample_rows(self, k: int, weights: np.ndarray | None = None, replace: bool = False, seed=None, **filters) -> np.ndarray:
+        """
+        Draws k rows among those matching the filters (see rows()). `weights` is an
+        array of per-row weights over the whole bank (e.g. to favor rare traits);
+        without replacement, rows are drawn by weighted random keys (Efraimidis-Spirakis),
+        so a draw costs one pass over the candidates. Returns fewer than k rows if
+        fewer match.
+        """
+        rng = seed if isinstance(seed, np.random.Generator) else np.random.default_rng(seed)
+        candidates = self.rows(**filters)
+        if not len(candidates) or k <= 0:
+            return np.empty(0, dtype=ROW_DTYPE)
+        if weights is None:
+            if replace:
+                return candidates[rng.integers(0, len(candidates), size=k)]
+            return candidates[rng.choice(len(candidates), size=min(k, len(candidates)), replace=False)]
+
+        w = np.asarray(weights[candidates], dtype=np.float64)
+        if replace:
+            cumulative = np.cumsum(w)
+            if cumulative[-1] <= 0:
+                return np.empty(0, dtype=ROW_DTYPE)
+            return candidates[np.searchsorted(cumulative, rng.random(k) * cumulative[-1], side="right")]
+        positive = np.flatnonzero(w > 0)
+        candidates, w = candidates[positive], w[positive]
+        if k >= len(candidates):
+            return rng.permutation(candidates)
+        keys = np.log(rng.random(len(candidates))) / w
+        top = np.argpartition(-keys, k - 1)[:k]
+        return candidates[top[np.argsort(-keys[top])]]
+
+    def sample(self, k: int, weights: np.ndarray | None = None, replace: bool = False, seed=None, **filters) -> list[dict]:
+        """Like sample_rows(), but returns the decoded personas."""
+        return [self[row] for row in self.sample_rows(k, weights, replace, seed, **filters)]
+
+
+def build_index(jsonl_path: str) -> BankIndexBuilder:
+    """(Re)builds the sidecar index of a processed JSONL file by reading it once."""
+    builder = BankIndexBuilder(jsonl_path)
+    builder.scan()
+    builder.write()
+    return builder
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build or query the sidecar index of a processed persona file.")
+    parser.add_argument("path", help="Processed persona JSONL file.")
+    parser.add_argument("--build", action="store_true", help="(Re)build the index from the file.")
+    parser.add_argument("--sample", type=int, default=0, help="Print this many personas sampled with the filters below.")
+    parser.add_argument("--traits", nargs="+", default=None, help="Personas must have all of these traits.")
+    parser.add_argument("--any_traits", nargs="+", default=None, help="Personas must have at least one of these traits.")
+    parser.add_argument("--age", type=int, nargs=2, default=None, metavar=("MIN", "MAX"))
+    parser.add_argument("--model", type=str, default=None)
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    if args.build:
+        start = time.perf_counter()
+        builder = build_index(args.path)
+        print(f"Indexed {len(builder)} personas ({len(builder.traits)} distinct traits, {len(builder.models)} models) in {time.perf_counter() - start:.1f}s: {builder.directory}")
+
+    with PersonaBank(args.path) as bank:
+        filters = dict(traits=args.traits, any_traits=args.any_traits, age=tuple(args.age) if args.age else None, model=args.model)
+        matching = bank.rows(**filters)
+        print(f"{len(bank)} personas, {len(matching)} matching the filters. Most common traits: {', '.join(list(bank.trait_counts())[:10])}")
+        for persona in bank.sample(args.sample, seed=args.seed, **filters):
+            print(json.dumps(persona, ensure_ascii=False))
@@ -2,6 +2,9 @@
 #
 # /// script
 # requires-python = ">=3.12"
+# dependencies = [
+#   "numpy"
+# ]
 # ///
 
 import os
@@ -9,11 +12,40 @@ import json
 import glob
 import time
 import uuid
+import argparse
+import hashlib
+import functools
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from similarity import LSHIndex, MinHasher, SignatureStore
+from persona_bank import BankIndexBuilder, index_dir
 
 # Define paths
 RAW_DATA_DIR = "data/raw"
 PROCESSED_DATA_DIR = "data/processed"
-WHITELIST = ["data_Qwen3-235B-A22B-Instruct-2507_1754475189.jsonl", "data_Qwen3-235B-A22B-Instruct-2507_1754475804.jsonl", "data_Qwen3-235B-A22B-Instruct-2507_1754481467.jsonl"]  # If not empty, only process files in this list
+SHARD_PATTERN = "shard-*.jsonl"  # Output files of sharded generation runs, one directory per run under RAW_DATA_DIR
+WHITELIST = ["data_Qwen3-235B-A22B-Instruct-2507_1754475189.jsonl", "data_Qwen3-235B-A22B-Instruct-2507_1754475804.jsonl", "data_Qwen3-235B-A22B-Instruct-2507_1754481467.jsonl"]  # If not empty, only process the single raw files in this list (sharded run directories are always processed)
+
+# Near-duplicate detection (MinHash + LSH over background/chatting_style)
+NEAR_DUP_THRESHOLD = 0.8  # Estimated Jaccard similarity above which two personas are near-duplicates. Set to None to disable.
+MINHASH_NUM_PERM = 128    # Signature length; more permutations give a more precise similarity estimate
+SHINGLE_SIZE = 5          # Character shingle length
+
+# Parallel streaming
+NUM_WORKERS = os.cpu_count() or 1  # Processes parsing and hashing raw chunks
+CHUNK_BYTES = 8 * 1024 * 1024      # Raw bytes per work item (split on line boundaries)
+BUILD_INDEX = True                 # Write the sidecar index read by scripts/persona_bank.py next to the processed file
+
+# Incremental processing (--incremental)
+STATE_DIR = os.path.join(PROCESSED_DATA_DIR, "state")                           # Manifest and dedupe state
+INCREMENTAL_OUTPUT = os.path.join(PROCESSED_DATA_DIR, "processed_personas.jsonl")  # Output that new personas are appended to
+MANIFEST_TAIL_BYTES = 64 * 1024  # Bytes before the ingested offset that are hashed to detect rewritten raw files
+
+# Persona ids are uuid5 over the dedupe digest, so the same persona keeps its id across runs
+PERSONA_ID_NAMESPACE = uuid.uuid5(uuid.NAMESPACE_URL, "https://huggingface.co/datasets/marcodsn/SPB-2508")
 
 def extract_model_name_from_filename(filename):
     """
@@ -37,6 +69,28 @@ def extract_model_name_from_filename(filename):
             return model_name
     return None # Fallback if pattern doesn't match
 
+def find_raw_files():
+    """
+    Returns the raw JSONL files in a stable order: plain files in RAW_DATA_DIR and
+    the shard files of every sharded run directory (see work_queue.py), so the
+    shards of a run are merged like one file.
+    """
+    return sorted(
+        glob.glob(os.path.join(RAW_DATA_DIR, "*.jsonl"))
+        + glob.glob(os.path.join(RAW_DATA_DIR, "*", SHARD_PATTERN))
+    )
+
+def raw_run_name(file_path):
+    """Name of the generation run a raw file belongs to: its own name, or its run directory's for a shard."""
+    parent = os.path.dirname(os.path.abspath(file_path))
+    if parent != os.path.abspath(RAW_DATA_DIR):
+        return os.path.basename(parent)
+    return os.path.basename(file_path)
+
+def raw_file_key(file_path):
+    """Name of a raw file relative to RAW_DATA_DIR, e.g. 'data_x_1.jsonl' or 'data_x_2/shard-00003.jsonl'."""
+    return os.path.relpath(file_path, RAW_DATA_DIR)
+
 def get_persona_dedupe_key(persona):
     """
     Creates a unique key for a persona to identify duplicates.
@@ -54,88 +108,404 @@ def get_persona_dedupe_key(persona):
         persona.get('chatting_style')
     )
 
-def process_raw_data():
+def check_persona(persona):
     """
-    Reads all JSON files from the raw directory, merges them,
-    adds a 'model' field, removes duplicates, and saves to a processed file.
+    Raises ValueError unless the persona has the fields and types of the Persona
+    schema in generate.uv.py, so every processed line can be exported as-is.
     """
-    # Ensure the processed data directory exists
-    os.makedirs(PROCESSED_DATA_DIR, exist_ok=True)
+    if not isinstance(persona, dict):
+        raise ValueError(f"expected a JSON object, got {type(persona).__name__}")
+    for field in ("name", "background", "chatting_style"):
+        if not isinstance(persona.get(field), str):
+            raise ValueError(f"'{field}' must be a string, got {type(persona.get(field)).__name__}")
+    if persona.get("username") is not None and not isinstance(persona["username"], str):
+        raise ValueError(f"'username' must be a string or null, got {type(persona['username']).__name__}")
+    age = persona.get("age")
+    if not isinstance(age, int) or isinstance(age, bool) or not 0 <= age < 2 ** 15:  # The export stores ages as int16
+        raise ValueError(f"'age' must be a non-negative integer, got {age!r}")
+    traits = persona.get("traits")
+    if not isinstance(traits, list) or not all(isinstance(trait, str) for trait in traits):
+        raise ValueError("'traits' must be a list of strings")
 
-    all_personas = []
-    seen_keys = set()
-    total_files_processed = 0
-    total_personas_loaded = 0
+def dedupe_digest(persona):
+    """Hashes the dedupe key into a compact 16-byte digest."""
+    key = json.dumps(get_persona_dedupe_key(persona), ensure_ascii=False, separators=(',', ':'))
+    return hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
 
-    # Get all JSON files in the raw data directory
-    jsonl_files = glob.glob(os.path.join(RAW_DATA_DIR, "*.jsonl"))
+def persona_id(digest):
+    """Deterministic persona id derived from the dedupe digest."""
+    return uuid.uuid5(PERSONA_ID_NAMESPACE, digest.hex()).hex
 
-    if not jsonl_files:
-        print(f"No JSONL files found in '{RAW_DATA_DIR}'. Exiting.")
-        return
+def complete_size(file_path):
+    """
+    Returns the size of the file up to and including its last newline, so a
+    trailing line that is still being written is left for the next run.
+    """
+    size = os.path.getsize(file_path)
+    with open(file_path, 'rb') as f:
+        end = size
+        while end > 0:
+            start = max(0, end - 64 * 1024)
+            f.seek(start)
+            block = f.read(end - start)
+            newline = block.rfind(b'\n')
+            if newline != -1:
+                return start + newline + 1
+            end = start
+    return 0
 
-    print(f"Found {len(jsonl_files)} JSONL files to process in '{RAW_DATA_DIR}'.")
+def tail_hash(file_path, offset):
+    """Hashes the MANIFEST_TAIL_BYTES before `offset`, to detect raw files rewritten since they were ingested."""
+    start = max(0, offset - MANIFEST_TAIL_BYTES)
+    with open(file_path, 'rb') as f:
+        f.seek(start)
+        return hashlib.blake2b(f.read(offset - start), digest_size=16).hexdigest()
 
-    for file_path in jsonl_files:
+def iter_chunks(file_path, chunk_bytes, start=0, size=None):
+    """Yields (start, end) byte ranges of roughly chunk_bytes that end on a line boundary."""
+    size = os.path.getsize(file_path) if size is None else size
+    with open(file_path, 'rb') as f:
+        while start < size:
+            f.seek(min(start + chunk_bytes, size))
+            f.readline()
+            end = min(f.tell(), size)
+            yield start, end
+            start = end
+
+@functools.cache
+def _get_hasher(num_perm, shingle_size):
+    # One hasher per worker process, reused across chunks
+    return MinHasher(num_perm=num_perm, shingle_size=shingle_size)
+
+def parse_chunk(file_path, start, end, model_name, with_signatures=True):
+    """
+    Worker: parses the lines in [start, end) of a raw file. Returns the file path, the
+    number of lines read, the malformed or schema-violating lines as (byte offset, error), one
+    (dedupe digest, id, name, age, traits, output line) row per valid persona, with
+    'model' and 'id' added to the line, and, if requested, their MinHash signatures as a matrix.
+    """
+    with open(file_path, 'rb') as f:
+        f.seek(start)
+        data = f.read(end - start)
 
-        if len(WHITELIST) > 0 and os.path.basename(file_path) not in WHITELIST:
-            print(f"Skipping '{os.path.basename(file_path)}' as it is not in the whitelist.")
+    hasher = _get_hasher(MINHASH_NUM_PERM, SHINGLE_SIZE) if with_signatures else None
+    rows, signatures, bad_lines = [], [], []
+    offset, loaded = start, 0
+    for raw_line in data.splitlines(keepends=True):
+        line_offset, offset = offset, offset + len(raw_line)
+        if not raw_line.strip():
+            continue
+        loaded += 1
+        try:
+            persona = json.loads(raw_line)
+            check_persona(persona)
+            digest = dedupe_digest(persona)
+        except (ValueError, TypeError) as e:
+            bad_lines.append((line_offset, str(e)))
             continue
+        # Add the 'model' and 'id' fields
+        persona['model'] = model_name
+        persona['id'] = persona_id(digest)
+        line = (json.dumps(persona, ensure_ascii=False) + '\n').encode('utf-8')
+        rows.append((digest, persona['id'], persona.get('name'), persona.get('age'), persona.get('traits'), line))
+        if hasher is not None:
+            signatures.append(hasher.persona_signature(persona))
 
-        total_files_processed += 1
-        model_name = extract_model_name_from_filename(file_path)
+    signature_matrix = np.vstack(signatures) if signatures else None
+    return file_path, loaded, bad_lines, rows, signature_matrix
 
-        if not model_name:
-            print(f"Warning: Could not extract model name from '{os.path.basename(file_path)}'. Skipping this file.")
+def imap_bounded(pool, fn, tasks, window):
+    """Like pool.map over argument tuples, in order, but with at most `window` tasks in flight."""
+    pending = deque()
+    for task in tasks:
+        pending.append(pool.submit(fn, *task))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+class NearDuplicateFilter:
+    """
+    Streaming near-duplicate filter: a persona is dropped when its shingled
+    background/chatting_style text is a near-duplicate of one already kept.
+    Kept personas are indexed by their byte offset in the output file, so the
+    report can read them back instead of holding them in memory. With a
+    SignatureStore, personas kept by earlier runs are checked as well.
+    """
+
+    def __init__(self, threshold=NEAR_DUP_THRESHOLD, store=None):
+        self.threshold = threshold
+        self.index = LSHIndex(num_perm=MINHASH_NUM_PERM, threshold=threshold)
+        self.store = store
+        self.clusters = {}  # Output offset of the kept persona -> its dropped near-duplicates
+        self.removed = 0
+
+    def query_store(self, signatures):
+        """Returns the matches of each signature among the personas kept by earlier runs."""
+        if self.store is None:
+            return [[] for _ in range(len(signatures))]
+        return self.store.query_many(signatures)
+
+    def check(self, offset, signature, persona_id, name, stored_matches=()):
+        """Returns True if the persona is novel (and indexes it under `offset`), False if it is a near-duplicate."""
+        matches = self.index.query(signature) + list(stored_matches)
+        if matches:
+            representative, similarity = max(matches, key=lambda item: item[1])
+            self.clusters.setdefault(representative, []).append({
+                "id": persona_id,
+                "name": name,
+                "similarity": round(similarity, 4),
+            })
+            self.removed += 1
+            return False
+        self.index.insert(offset, signature)
+        return True
+
+    def report(self, output_filename):
+        """Builds the cluster report, reading each kept persona back from the output file."""
+        report = []
+        with open(output_filename, 'rb') as f:
+            for representative, duplicates in sorted(self.clusters.items(), key=lambda item: -len(item[1])):
+                f.seek(representative)
+                persona = json.loads(f.readline())
+                report.append({
+                    "kept": {"id": persona.get('id'), "name": persona.get('name')},
+                    "background": persona.get('background'),
+                    "duplicates": duplicates,
+                })
+        return report
+
+class IncrementalState:
+    """
+    Manifest and dedupe state behind the incremental processed output.
+
+    manifest.json records, for every raw file, the byte offset ingested so far and
+    a hash of the bytes just before it, plus the sizes of the output and state
+    files after the last successful run. It is replaced atomically at the end of
+    a run, so anything an interrupted run appended past those sizes is truncated
+    on the next load. Seen dedupe digests live in digests.bin (16 bytes each) and
+    the signatures of kept personas in a SignatureStore.
+    """
+
+    def __init__(self, state_dir, output_filename, near_dup_threshold):
+        os.makedirs(state_dir, exist_ok=True)
+        self.manifest_path = os.path.join(state_dir, "manifest.json")
+        self.digests_path = os.path.join(state_dir, "digests.bin")
+        self.output_filename = output_filename
+        self.settings = {"near_dup_threshold": near_dup_threshold, "minhash_num_perm": MINHASH_NUM_PERM, "shingle_size": SHINGLE_SIZE}
+
+        manifest = {"settings": self.settings, "files": {}, "output_bytes": 0, "digests": 0, "signatures": 0}
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+            if manifest["settings"] != self.settings:
+                raise ValueError(f"State in '{state_dir}' was built with {manifest['settings']}, not {self.settings}. Run with --rebuild.")
+        self.files = manifest["files"]
+
+        # Drop whatever an interrupted run appended after the last manifest
+        for path, size in ((output_filename, manifest["output_bytes"]), (self.digests_path, 16 * manifest["digests"])):
+            if not os.path.exists(path):
+                open(path, 'wb').close()
+            if os.path.getsize(path) > size:
+                os.truncate(path, size)
+        self.output_bytes = os.path.getsize(output_filename)
+        if self.output_bytes != manifest["output_bytes"]:
+            raise ValueError(f"'{output_filename}' is shorter than recorded in the manifest. Run with --rebuild.")
+
+        with open(self.digests_path, 'rb') as f:
+            data = f.read()
+        self.seen_keys = {data[i:i + 16] for i in range(0, len(data), 16)}
+        self.num_digests = len(self.seen_keys)
+
+        self.store = None
+        if near_dup_threshold is not None:
+            self.store = SignatureStore(os.path.join(state_dir, "signatures"), MINHASH_NUM_PERM, near_dup_threshold, length=manifest["signatures"])
+        self.num_signatures = len(self.store) if self.store is not None else 0
+
+    def start_offset(self, file_path):
+        """Returns the byte offset to resume a raw file from: 0 if it is new or was rewritten."""
+        entry = self.files.get(raw_file_key(file_path))
+        if entry is None:
+            return 0
+        offset = entry["offset"]
+        if os.path.getsize(file_path) < offset or tail_hash(file_path, offset) != entry["tail_hash"]:
+            print(f"Warning: '{raw_file_key(file_path)}' changed since it was ingested. Reprocessing it from the start.")
+            return 0
+        return offset
+
+    def record_file(self, file_path, offset):
+        self.files[raw_file_key(file_path)] = {"offset": offset, "tail_hash": tail_hash(file_path, offset)}
+
+    def append(self, digests, keys, signatures):
+        """Appends a chunk's new dedupe digests and the signatures of its kept personas."""
+        with open(self.digests_path, 'ab') as f:
+            f.write(b''.join(digests))
+        self.num_digests += len(digests)
+        if self.store is not None and len(keys):
+            self.store.append(keys, signatures)
+            self.num_signatures += len(keys)
+
+    def save(self, output_bytes):
+        """Flushes the state files and atomically replaces the manifest."""
+        for path in (self.output_filename, self.digests_path):
+            with open(path, 'rb+') as f:
+                os.fsync(f.fileno())
+        manifest = {
+            "settings": self.settings,
+            "files": self.files,
+            "output_bytes": output_bytes,
+            "digests": self.num_digests,
+            "signatures": self.num_signatures,
+            "updated_at": int(time.time()),
+        }
+        tmp_path = self.manifest_path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.manifest_path)
+
+def iter_tasks(jsonl_files, with_signatures, state=None):
+    """
+    Yields one parse_chunk argument tuple per chunk of every file that should be
+    processed. With an IncrementalState, only the complete lines added since the
+    last run are read, and the new offsets are recorded in the state.
+    """
+    for file_path in jsonl_files:
+        in_run_dir = raw_run_name(file_path) != os.path.basename(file_path)
+        if len(WHITELIST) > 0 and not in_run_dir and raw_run_name(file_path) not in WHITELIST:
+            print(f"Skipping '{raw_file_key(file_path)}' as it is not in the whitelist.")
             continue
 
-        try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                personas_from_file = [json.loads(line) for line in f]
+        model_name = extract_model_name_from_filename(raw_run_name(file_path))
+        if not model_name:
+            print(f"Warning: Could not extract model name from '{raw_file_key(file_path)}'. Skipping this file.")
+            continue
 
-            if not isinstance(personas_from_file, list):
-                print(f"Warning: File '{os.path.basename(file_path)}' does not contain a JSON list. Skipping.")
+        start, size = 0, None
+        if state is not None:
+            start, size = state.start_offset(file_path), complete_size(file_path)
+            state.record_file(file_path, size)
+            if start >= size:
                 continue
 
-            print(f"Processing '{os.path.basename(file_path)}' (Model: {model_name}) with {len(personas_from_file)} personas.")
-            total_personas_loaded += len(personas_from_file)
+        for chunk_start, chunk_end in iter_chunks(file_path, CHUNK_BYTES, start, size):
+            yield file_path, chunk_start, chunk_end, model_name, with_signatures
 
-            for persona in personas_from_file:
-                # Add the 'model' field
-                persona['model'] = model_name
-                # Add an 'id' field
-                persona['id'] = uuid.uuid4().hex
-                all_personas.append(persona)
+def process_raw_data(incremental=False):
+    """
+    Streams all JSONL files from the raw directory through a process pool,
+    adds 'model' and 'id' fields, removes exact and near-duplicates, and
+    writes the processed file as it goes. Memory stays bounded by a few
+    chunks plus a 16-byte digest (and a MinHash signature) per unique persona.
 
-        except json.JSONDecodeError as e:
-            print(f"Error decoding JSON from '{os.path.basename(file_path)}': {e}. Skipping file.")
-        except Exception as e:
-            print(f"An unexpected error occurred with '{os.path.basename(file_path)}': {e}. Skipping file.")
+    By default every run writes a new timestamped file. With `incremental`,
+    only raw lines added since the last run are processed, deduplicated
+    against the saved state and appended to INCREMENTAL_OUTPUT.
+    """
+    # Ensure the processed data directory exists
+    os.makedirs(PROCESSED_DATA_DIR, exist_ok=True)
 
-    print("\n--- Merging and Deduplicating ---")
-    print(f"Total personas loaded across all files: {total_personas_loaded}")
+    # Get all JSON files in the raw data directory and its sharded run directories
+    jsonl_files = find_raw_files()
 
-    unique_personas = []
-    for persona in all_personas:
-        key = get_persona_dedupe_key(persona)
-        if key not in seen_keys:
-            seen_keys.add(key)
-            unique_personas.append(persona)
+    if not jsonl_files:
+        print(f"No JSONL files found in '{RAW_DATA_DIR}'. Exiting.")
+        return
 
-    print(f"Total unique personas after deduplication: {len(unique_personas)}")
-    print(f"Removed {total_personas_loaded - len(unique_personas)} duplicate(s).")
+    print(f"Found {len(jsonl_files)} JSONL files to process in '{RAW_DATA_DIR}' ({NUM_WORKERS} worker(s)).")
 
-    # Define the output filename
     timestamp = int(time.time())
-    output_filename = os.path.join(PROCESSED_DATA_DIR, f"processed_personas_{timestamp}.jsonl")
+    start_time = time.perf_counter()
+    state = None
+    if incremental:
+        state = IncrementalState(STATE_DIR, INCREMENTAL_OUTPUT, NEAR_DUP_THRESHOLD)
+        output_filename, output_mode, offset, seen_keys = INCREMENTAL_OUTPUT, 'ab', state.output_bytes, state.seen_keys
+        print(f"Loaded incremental state: {len(seen_keys)} seen persona(s), {offset} output bytes ({time.perf_counter() - start_time:.1f}s).")
+    else:
+        output_filename = os.path.join(PROCESSED_DATA_DIR, f"processed_personas_{timestamp}.jsonl")
+        output_mode, offset, seen_keys = 'wb', 0, set()
+    near_dups = None
+    if NEAR_DUP_THRESHOLD is not None:
+        near_dups = NearDuplicateFilter(NEAR_DUP_THRESHOLD, store=state.store if state is not None else None)
+    index = BankIndexBuilder(output_filename, start_bytes=offset) if BUILD_INDEX else None
+
+    files_seen = set()
+    total_personas_loaded = 0
+    total_bad_lines = 0
+    exact_duplicates = 0
+    written = 0
+
+    tasks = iter_tasks(jsonl_files, with_signatures=near_dups is not None, state=state)
+    with ProcessPoolExecutor(max_workers=NUM_WORKERS) as pool, open(output_filename, output_mode) as out:
+        for file_path, loaded, bad_lines, rows, signatures in imap_bounded(pool, parse_chunk, tasks, 2 * NUM_WORKERS):
+            model_name = extract_model_name_from_filename(raw_run_name(file_path))
+            if file_path not in files_seen:
+                files_seen.add(file_path)
+                print(f"Processing '{raw_file_key(file_path)}' (Model: {model_name})")
+            total_personas_loaded += loaded
+            for line_offset, error in bad_lines:
+                print(f"Warning: Skipping malformed line at byte {line_offset} of '{raw_file_key(file_path)}': {error}")
+            total_bad_lines += len(bad_lines)
 
-    try:
-        with open(output_filename, 'w', encoding='utf-8') as f:
-            for persona in unique_personas:
-                f.write(json.dumps(persona, ensure_ascii=False) + '\n')
-        print(f"\nSuccessfully saved processed data to '{output_filename}'")
-    except Exception as e:
-        print(f"Error saving processed data to '{output_filename}': {e}")
+            stored_matches = near_dups.query_store(signatures) if near_dups is not None and rows else None
+            new_digests, kept_offsets, kept_rows = [], [], []
+            for i, (digest, persona_id, name, age, traits, line) in enumerate(rows):
+                if digest in seen_keys:
+                    exact_duplicates += 1
+                    continue
+                seen_keys.add(digest)
+                new_digests.append(digest)
+                if near_dups is not None:
+                    if not near_dups.check(offset, signatures[i], persona_id, name, stored_matches[i]):
+                        continue
+                    kept_offsets.append(offset)
+                    kept_rows.append(i)
+                out.write(line)
+                if index is not None:
+                    index.add(offset, len(line), persona_id, age, traits, model_name)
+                offset += len(line)
+                written += 1
+
+            if state is not None:
+                state.append(new_digests, kept_offsets, signatures[kept_rows] if kept_rows else None)
+
+    if state is not None:
+        state.save(offset)
+    if index is not None:
+        index.write()
+
+    print("\n--- Merging and Deduplicating ---")
+    print(f"Total personas loaded across {len(files_seen)} file(s): {total_personas_loaded} in {time.perf_counter() - start_time:.1f}s")
+    if total_bad_lines:
+        print(f"Skipped {total_bad_lines} malformed line(s).")
+    print(f"Removed {exact_duplicates} duplicate(s).")
+
+    if near_dups is not None:
+        clusters = near_dups.report(output_filename)
+        print(f"Removed {near_dups.removed} near-duplicate(s) (Jaccard >= {NEAR_DUP_THRESHOLD}) in {len(clusters)} cluster(s).")
+
+        report_filename = os.path.join(PROCESSED_DATA_DIR, f"near_duplicates_{timestamp}.json")
+        with open(report_filename, 'w', encoding='utf-8') as f:
+            json.dump({"threshold": NEAR_DUP_THRESHOLD, "clusters": clusters}, f, ensure_ascii=False, indent=2)
+        print(f"Near-duplicate cluster report saved to '{report_filename}'")
+
+    print(f"{'New' if incremental else 'Total'} unique personas: {written}")
+    print(f"\nSuccessfully saved processed data to '{output_filename}'")
+    if index is not None:
+        print(f"Index for random access and filtered sampling (scripts/persona_bank.py) saved to '{index.directory}'")
 
 if __name__ == "__main__":
-    process_raw_data()
+    parser = argparse.ArgumentParser(description="Merge, deduplicate and tag raw persona files.")
+    parser.add_argument("--incremental", action="store_true", help=f"Only process raw lines added since the last run and append them to '{INCREMENTAL_OUTPUT}'.")
+    parser.add_argument("--rebuild", action="store_true", help="With --incremental, discard the saved state and output and start over.")
+    args = parser.parse_args()
+    if args.rebuild and not args.incremental:
+        parser.error("--rebuild only applies with --incremental.")
+
+    if args.rebuild:
+        for path in glob.glob(os.path.join(STATE_DIR, "**", "*"), recursive=True) + glob.glob(os.path.join(index_dir(INCREMENTAL_OUTPUT), "*")) + [INCREMENTAL_OUTPUT]:
+            if os.path.isfile(path):
+                os.remove(path)
+
+    process_raw_data(incremental=args.incremental)
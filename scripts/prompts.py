@@ -0,0 +1,149 @@
+"""
+Prompt construction for persona generation.
+
+Providers cache the KV state of prompt prefixes they have already seen, so the
+order of the prompt decides how much of it is paid for (and prefilled) again.
+The "prefix" layout puts the longest stable content first:
+
+    system:  system prompt + rules and schema guidance      (identical for the whole run)
+    user:    reference personas                            (shared across a RESET_EVERY window)
+             task + per-persona building blocks            (different for every request)
+
+The "legacy" layout reproduces the original prompt, where random references come
+first and the per-persona building blocks sit in the middle of the rules. It is
+kept so cost and latency can be compared before and after.
+"""
+
+import json
+from dataclasses import dataclass
+
+SYSTEM_PROMPT = "You are a creative persona generator. You will create and output only a single, structured persona JSON object, following the provided schema strictly. Do not add any extra text or explanation."
+BATCH_SYSTEM_PROMPT = "You are a creative persona generator. You will create and output only a single JSON object holding an array of structured personas, following the provided schema strictly. Do not add any extra text or explanation."
+
+RULES = (
+    "Each request gives you the building blocks of a NEW persona. You must creatively synthesize them into a single, coherent character. Don't just list the components; make them feel like a real person.\n\n"
+    "**JSON OUTPUT RULES:**\n"
+    "- **name:** Use exactly the name given in the request.\n"
+    "- **traits:** Choose 3-6 adjectives from the persona's trait list that best fit the final, integrated character you imagined.\n"
+    "- **background:** A short, specific 1-2 sentence story (≤300 chars) that **synthesizes** the profession, age, and life context into a believable narrative.\n"
+    "- **chatting_style:** A brief description (≤120 chars) of their texting style. **Crucially, explain HOW someone of that age and profession would adapt or interpret their Chat Style Challenge**. For example, would they use it ironically, incorrectly, or perfectly? Make it fit their character.\n"
+    "- Avoid repeating the themes of the example personas, or being too similar to them.\n"
+    "The final output must be only the strict JSON object, with no extra text."
+)
+BATCH_RULES = RULES.replace(
+    "The final output must be only the strict JSON object",
+    "When asked for several personas, return them in a 'personas' array in the same order as their building blocks, each clearly different from the others. The final output must be only the strict JSON object",
+)
+
+REFERENCES_HEADER = "Here are some examples of personas we have already generated. AVOID repeating their themes or being too similar:\n"
+
+
+@dataclass
+class Prompt:
+    messages: list[dict]
+    shared_prefix_chars: int  # Characters before the first per-request variable
+    total_chars: int
+
+    @property
+    def shared_fraction(self) -> float:
+        return self.shared_prefix_chars / self.total_chars if self.total_chars else 0.0
+
+
+def format_references(reference_personas: list[dict]) -> str:
+    return REFERENCES_HEADER + "\n".join(json.dumps(p, ensure_ascii=False) for p in reference_personas)
+
+
+def format_building_blocks(blocks: dict) -> str:
+    return (
+        f"- **Profession:** {blocks['profession']}\n"
+        f"- **Core Demographics:** They are {blocks['age']} years old.\n"
+        f"- **Life Context:** They are currently {blocks['life_context']}.\n"
+        f"- **Personality Profile:** Their character should reflect these traits: {', '.join(blocks['traits'])}.\n"
+        f"- **Chat Style Challenge:** Their base communication style is: \"{blocks['chat_quirk']}\""
+    )
+
+
+class PromptBuilder:
+    """Builds the chat messages for a request in the configured layout."""
+
+    def __init__(self, layout: str = "prefix"):
+        if layout not in ("prefix", "legacy"):
+            raise ValueError(f"Unknown prompt layout '{layout}'.")
+        self.layout = layout
+
+    def build(self, reference_personas: list[dict], batch_blocks: list[dict]) -> Prompt:
+        if self.layout == "legacy":
+            return self._build_legacy(reference_personas, batch_blocks)
+        return self._build_prefix(reference_personas, batch_blocks)
+
+    def _build_prefix(self, reference_personas: list[dict], batch_blocks: list[dict]) -> Prompt:
+        batch = len(batch_blocks) > 1
+        system = (BATCH_SYSTEM_PROMPT if batch else SYSTEM_PROMPT) + "\n\n" + (BATCH_RULES if batch else RULES)
+        shared = format_references(reference_personas) + "\n\n---\n"
+        if batch:
+            task = f"Generate {len(batch_blocks)} personas, one for each set of building blocks below.\n\n" + "\n\n".join(
+                f"**PERSONA {i} — named '{blocks['name']}':**\n{format_building_blocks(blocks)}"
+                for i, blocks in enumerate(batch_blocks, start=1)
+            )
+        else:
+            blocks = batch_blocks[0]
+            task = f"**BUILDING BLOCKS TO SYNTHESIZE** for a persona named '{blocks['name']}':\n{format_building_blocks(blocks)}"
+        user = shared + task
+        return Prompt(
+            messages=[{"role": "system", "content": system}, {"role": "user", "content": user}],
+            shared_prefix_chars=len(system) + len(shared),
+            total_chars=len(system) + len(user),
+        )
+
+    def _build_legacy(self, reference_personas: list[dict], batch_blocks: list[dict]) -> Prompt:
+        if len(batch_blocks) > 1:
+            system, user = BATCH_SYSTEM_PROMPT, self._legacy_batch_instruction(reference_personas, batch_blocks)
+        else:
+            system, user = SYSTEM_PROMPT, self._legacy_instruction(reference_personas, batch_blocks[0])
+        # Only the system prompt is stable: the references are re-sampled for every request
+        return Prompt(
+            messages=[{"role": "system", "content": system}, {"role": "user", "content": user}],
+            shared_prefix_chars=len(system),
+            total_chars=len(system) + len(user),
+        )
+
+    @staticmethod
+    def _legacy_instruction(reference_personas: list[dict], blocks: dict) -> str:
+        profession, age, chat_quirk = blocks['profession'], blocks['age'], blocks['chat_quirk']
+        return (
+            format_references(reference_personas) +
+            f"\n\n---\n"
+            f"Your task is to generate a NEW, unique, and believable persona. You must creatively synthesize the following building blocks into a single, coherent character. Don't just list the components; make them feel like a real person.\n\n"
+            f"**BUILDING BLOCKS TO SYNTHESIZE:**\n"
+            f"{format_building_blocks(blocks)}\n\n"
+            f"---"
+            f"**JSON OUTPUT TASK:**\n"
+            f"Create a single JSON object for a persona named '{blocks['name']}'. "
+            f"Follow these rules for the JSON fields:\n"
+            f"- **traits:** Choose 3-6 adjectives from the list above that best fit the final, integrated character you imagined.\n"
+            f"- **background:** A short, specific 1-2 sentence story (≤300 chars) that **synthesizes** the profession, age, and life context into a believable narrative.\n"
+            f"- **chatting_style:** A brief description (≤120 chars) of their texting style. **Crucially, explain HOW a {age}-year-old {profession} would adapt or interpret the '{chat_quirk}'**. For example, would they use it ironically, incorrectly, or perfectly? Make it fit their character.\n"
+            f"The final output must be only the strict JSON object, with no extra text."
+        )
+
+    @staticmethod
+    def _legacy_batch_instruction(reference_personas: list[dict], batch_blocks: list[dict]) -> str:
+        k = len(batch_blocks)
+        block_sections = "\n\n".join(
+            f"**PERSONA {i} — named '{blocks['name']}':**\n{format_building_blocks(blocks)}"
+            for i, blocks in enumerate(batch_blocks, start=1)
+        )
+        return (
+            format_references(reference_personas) +
+            f"\n\n---\n"
+            f"Your task is to generate {k} NEW, unique, and believable personas, one for each set of building blocks below. For each one, you must creatively synthesize its building blocks into a single, coherent character. Don't just list the components; make them feel like real people, clearly different from the examples and from each other.\n\n"
+            f"{block_sections}\n\n"
+            f"---"
+            f"**JSON OUTPUT TASK:**\n"
+            f"Create a JSON object whose 'personas' array holds exactly {k} persona objects, in the same order as the building blocks and with the given names. "
+            f"Follow these rules for the JSON fields of each persona:\n"
+            f"- **traits:** Choose 3-6 adjectives from that persona's list that best fit the final, integrated character you imagined.\n"
+            f"- **background:** A short, specific 1-2 sentence story (≤300 chars) that **synthesizes** the profession, age, and life context into a believable narrative.\n"
+            f"- **chatting_style:** A brief description (≤120 chars) of their texting style. **Crucially, explain HOW someone of that age and profession would adapt or interpret their Chat Style Challenge**. For example, would they use it ironically, incorrectly, or perfectly? Make it fit their character.\n"
+            f"The final output must be only the strict JSON object, with no extra text."
+        )
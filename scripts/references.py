@@ -0,0 +1,118 @@
+"""
+Bounded-memory pool of reference personas for few-shot prompting.
+
+Only recent personas are ever shown to the model, so the pool keeps the seed
+personas plus a fixed-size ring buffer of the latest generated ones, each with
+a small MinHash sketch of its background/chatting_style text. Memory stays
+constant however long the run is.
+
+`diverse()` picks references by farthest-point selection over the sketches:
+starting from a seed anchor, it repeatedly adds the buffered persona least
+similar to everything picked so far, so the examples cover different themes
+instead of several near-copies of the same one. Its cost depends only on the
+buffer size and the number of references, not on the number of personas
+generated.
+"""
+
+import random
+
+import numpy as np
+
+from similarity import MinHasher
+
+
+class ReferencePool:
+    def __init__(self, seed_personas: list[dict], capacity: int = 64, num_perm: int = 64, shingle_size: int = 5):
+        if capacity < 1:
+            raise ValueError("capacity must be at least 1.")
+        self.seeds = list(seed_personas)
+        self.capacity = capacity
+        self.hasher = MinHasher(num_perm=num_perm, shingle_size=shingle_size)
+        self.total_added = 0
+        self._personas: list[dict | None] = [None] * capacity
+        self._signatures = np.zeros((capacity, num_perm), dtype=np.uint32)
+        self._seed_signatures = (
+            np.vstack([self.hasher.persona_signature(p) for p in self.seeds])
+            if self.seeds else np.zeros((0, num_perm), dtype=np.uint32)
+        )
+
+    def __len__(self) -> int:
+        """Number of personas currently held (seeds plus buffered generated ones)."""
+        return len(self.seeds) + self.num_generated
+
+    @property
+    def num_generated(self) -> int:
+        return min(self.total_added, self.capacity)
+
+    def add(self, persona: dict):
+        """Adds a generated persona, overwriting the oldest one once the buffer is full."""
+        slot = self.total_added % self.capacity
+        self._personas[slot] = persona
+        self._signatures[slot] = self.hasher.persona_signature(persona)
+        self.total_added += 1
+
+    def extend(self, personas: list[dict]):
+        # Only the last `capacity` personas would survive anyway
+        for persona in personas[-self.capacity:]:
+            self.add(persona)
+
+    def _slots(self, n: int) -> list[int]:
+        """Buffer slots of the n most recent generated personas, oldest first."""
+        n = min(n, self.num_generated)
+        return [(self.total_added - n + i) % self.capacity for i in range(n)]
+
+    def recent(self, n: int, include_seeds: bool = False) -> list[dict]:
+        """
+        Returns the n most recent generated personas, oldest first. With include_seeds,
+        the seeds count as the oldest entries (like the end of the original, unbounded pool).
+        """
+        generated = [self._personas[slot] for slot in self._slots(n)]
+        if include_seeds and len(generated) < n and self.seeds:
+            generated = self.seeds[-(n - len(generated)):] + generated
+        return generated
+
+    def diverse(self, k: int, lookback: int | None = None, rng: random.Random | None = None) -> list[dict]:
+        """
+        Returns one random seed persona as an anti-drift anchor plus up to k - 1 of the
+        `lookback` most recent generated personas (default: the whole buffer), chosen
+        greedily to minimize the highest estimated Jaccard similarity to those already
+        picked. Falls back to a random sample of seeds while nothing was generated.
+        """
+        rng = rng or random
+        if not self.num_generated:
+            return rng.sample(self.seeds, min(len(self.seeds), k))
+        slots = self._slots(lookback or self.capacity)
+        candidates = self._signatures[slots]
+
+        picked_personas, picked_signatures = [], []
+        if self.seeds:
+            anchor = rng.randrange(len(self.seeds))
+            picked_personas.append(self.seeds[anchor])
+            picked_signatures.append(self._seed_signatures[anchor])
+        else:
+            first = rng.randrange(len(slots))
+            picked_personas.append(self._personas[slots[first]])
+            picked_signatures.append(candidates[first])
+
+        # Highest similarity of each candidate to the picked set, updated one pick at a time
+        closest = np.zeros(len(slots))
+        available = np.ones(len(slots), dtype=bool)
+        while len(picked_personas) < k and available.any():
+            closest = np.maximum(closest, (candidates == picked_signatures[-1]).mean(axis=1))
+            # Small random jitter breaks ties between equally distant candidates
+            scores = np.where(available, closest + 1e-6 * np.array([rng.random() for _ in slots]), np.inf)
+            best = int(np.argmin(scores))
+            available[best] = False
+            picked_personas.append(self._personas[slots[best]])
+            picked_signatures.append(candidates[best])
+        return picked_personas
+
+
+def mean_pairwise_similarity(hasher: MinHasher, personas: list[dict]) -> float:
+    """Mean estimated Jaccard similarity over all pairs of a reference set (lower is more diverse)."""
+    if len(personas) < 2:
+        return 0.0
+    signatures = np.vstack([hasher.persona_signature(p) for p in personas])
+    similarities = (signatures[:, None, :] == signatures[None, :, :]).mean(axis=2)
+    upper = np.triu_indices(len(personas), k=1)
+    return float(similarities[upper].mean())
@@ -0,0 +1,183 @@
+"""
+Content-addressed on-disk cache of chat completion responses.
+
+`CachedBackend` wraps any backend. A request is keyed by the SHA-256 of the
+canonical JSON of its keyword arguments (model, messages, response_format,
+sampling parameters and seed), and responses are stored as OpenAI-style JSON
+bodies in a SQLite file. Modes:
+  - "record":       always call the backend and store (or overwrite) the response,
+  - "replay":       only serve from the cache; a miss raises CacheMiss,
+  - "read_through": serve hits from the cache, call the backend on misses and store them.
+Errors are never cached. When the stored bodies exceed max_bytes, the least
+recently used ones are evicted down to 90% of the limit.
+
+Streamed requests are keyed apart from plain ones (the key includes the stream
+flag), and a hit is replayed as a single chunk. In record mode, a stream the
+caller closed early (invalid output) is stored with what was received and
+finish_reason "abort", so replaying it aborts at the same point; in
+read_through mode it is not stored, so the request is sent again next time.
+
+Replaying a run only reproduces it if the run sends the same requests, which
+generate.uv.py guarantees with --deterministic (implied by record and replay).
+"""
+
+import os
+import json
+import time
+import sqlite3
+import hashlib
+from contextlib import aclosing
+
+from backends import ChatChoice, ChatCompletion, ChatCompletionChunk, ChatMessage, ChatUsage, completion_to_dict, stream_chunks
+
+CACHE_MODES = ("record", "replay", "read_through")
+
+
+class CacheMiss(Exception):
+    """Raised in replay mode for a request that is not in the cache."""
+
+
+def request_key(kwargs: dict, stream: bool = False) -> bytes:
+    """SHA-256 of the canonical JSON of a request's keyword arguments (and whether it is streamed)."""
+    canonical = json.dumps({**kwargs, "stream": True} if stream else kwargs, sort_keys=True, ensure_ascii=False, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).digest()
+
+
+def stream_body(model: str, content: str, finish_reason: str, usage=None) -> dict:
+    """OpenAI-style body of a streamed response, so it is stored like a plain one."""
+    choice = ChatChoice(ChatMessage(content), finish_reason=finish_reason)
+    return completion_to_dict(ChatCompletion([choice], usage or ChatUsage(0, 0, 0), model=model))
+
+
+class ResponseCache:
+    def __init__(self, path: str, max_bytes: int | None = None):
+        self.path = path
+        self.max_bytes = max_bytes  # Total size of stored bodies before LRU eviction (None for unbounded)
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._db = sqlite3.connect(path, timeout=30.0, isolation_level=None)
+        # WAL lets sharded workers share one cache; NORMAL skips the fsync per write
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key BLOB PRIMARY KEY, body BLOB NOT NULL, size INTEGER NOT NULL, created_at REAL NOT NULL, used_at REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS responses_used_at ON responses (used_at)")
+        self.total_bytes = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        self.evicted = 0
+
+    def __len__(self) -> int:
+        return self._db.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def close(self):
+        self._db.close()
+
+    def get(self, key: bytes) -> dict | None:
+        row = self._db.execute("SELECT body FROM responses WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        self._db.execute("UPDATE responses SET used_at = ? WHERE key = ?", (time.time(), key))
+        return json.loads(row[0])
+
+    def put(self, key: bytes, body: dict):
+        data = json.dumps(body, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        now = time.time()
+        self._db.execute("BEGIN IMMEDIATE")
+        try:
+            old = self._db.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses (key, body, size, created_at, used_at) VALUES (?, ?, ?, ?, ?)",
+                (key, data, len(data), now, now),
+            )
+            self.total_bytes += len(data) - (old[0] if old else 0)
+            if self.max_bytes is not None and self.total_bytes > self.max_bytes:
+                self._evict(int(0.9 * self.max_bytes))
+            self._db.execute("COMMIT")
+        except BaseException:
+            self._db.execute("ROLLBACK")
+            raise
+
+    def _evict(self, target_bytes: int):
+        """Deletes the least recently used responses until the total size is at most target_bytes."""
+        keys = []
+        for key, size in self._db.execute("SELECT key, size FROM responses ORDER BY used_at"):
+            if self.total_bytes <= target_bytes:
+                break
+            keys.append((key,))
+            self.total_bytes -= size
+        self._db.executemany("DELETE FROM responses WHERE key = ?", keys)
+        self.evicted += len(keys)
+
+
+class CachedBackend:
+    """Backend wrapper serving and recording responses through a ResponseCache."""
+
+    def __init__(self, backend, cache: ResponseCache, mode: str = "read_through"):
+        if mode not in CACHE_MODES:
+            raise ValueError(f"Unknown cache mode '{mode}', expected one of {CACHE_MODES}.")
+        self.backend = backend
+        self.cache = cache
+        self.mode = mode
+        self.name = f"cached({getattr(backend, 'name', 'backend')}, {mode})"
+        self.hits = 0
+        self.misses = 0
+        self.stored = 0
+        self.consecutive_misses = 0  # In replay mode, a long run of misses means the run diverged from the recording
+
+    def _lookup(self, key: bytes) -> dict | None:
+        """Returns the cached body (None in record mode or on a miss), or raises CacheMiss in replay mode."""
+        if self.mode == "record":
+            return None
+        body = self.cache.get(key)
+        if body is not None:
+            self.hits += 1
+            self.consecutive_misses = 0
+            return body
+        self.misses += 1
+        self.consecutive_misses += 1
+        if self.mode == "replay":
+            raise CacheMiss(f"No cached response for request {key.hex()[:16]}.")
+        return None
+
+    def _store(self, key: bytes, body: dict):
+        self.cache.put(key, body)
+        self.stored += 1
+
+    async def chat_completion(self, **kwargs):
+        key = request_key(kwargs)
+        body = self._lookup(key)
+        if body is not None:
+            return ChatCompletion.from_dict(body)
+        response = await self.backend.chat_completion(**kwargs)
+        self._store(key, completion_to_dict(response))
+        return response
+
+    async def chat_completion_stream(self, **kwargs):
+        key = request_key(kwargs, stream=True)
+        body = self._lookup(key)
+        if body is not None:
+            for chunk in stream_chunks(body):
+                yield ChatCompletionChunk.from_dict(chunk)
+            return
+
+        parts, usage, finish_reason = [], None, "stop"
+        try:
+            async with aclosing(self.backend.chat_completion_stream(**kwargs)) as stream:
+                async for chunk in stream:
+                    if chunk.choices:
+                        parts.append(chunk.choices[0].delta.content or "")
+                        finish_reason = chunk.choices[0].finish_reason or finish_reason
+                    usage = getattr(chunk, "usage", None) or usage
+                    yield chunk
+        except GeneratorExit:
+            # Closed early by the caller: when recording, keep what was received, so a replay aborts at the same point
+            if self.mode == "record":
+                self._store(key, stream_body(kwargs.get("model", ""), "".join(parts), "abort", usage))
+            raise
+        self._store(key, stream_body(kwargs.get("model", ""), "".join(parts), finish_reason, usage))
+
+    def summary(self) -> str:
+        return (
+            f"Response cache ({self.mode}, {self.cache.path}): {self.hits} hits, {self.misses} misses, "
+            f"{self.stored} stored, {self.cache.evicted} evicted, {self.cache.total_bytes / 1024 ** 2:.1f} MiB of responses"
+        )
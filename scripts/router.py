@@ -0,0 +1,259 @@
+"""
+Multi-provider routing with optional hedged requests.
+
+`Router` is a backend (async `chat_completion`) spreading calls over several
+provider backends, each optionally with its own model id. Every call goes to a
+provider drawn at random with weight (1 - error rate)^2 / mean latency, both
+measured live, so slow or failing providers get less traffic; a small
+exploration floor keeps probing them so they can win traffic back.
+
+With hedging, if the chosen provider has not answered by its own p95 latency,
+a duplicate request goes to another provider, the first response wins and the
+loser is cancelled. Hedges are capped to a fraction of all requests so an
+overloaded provider cannot double the load. Per-provider accounting shows what
+hedging costs: calls, hedges, cancellations and tokens, including an estimate
+of the input tokens of cancelled calls (billed by most providers, but never
+reported back to us).
+
+Streamed requests (`chat_completion_stream`) are routed the same way but never
+hedged: once a stream has been read from, it cannot be raced by another.
+"""
+
+import random
+import asyncio
+from contextlib import aclosing
+from collections import deque
+
+from concurrency import percentile
+
+
+class ProviderRoute:
+    """One provider behind the router, with its live latency, error and usage accounting."""
+
+    def __init__(self, name: str, backend, model: str | None = None, window: int = 200, error_decay: float = 0.05):
+        self.name = name
+        self.backend = backend
+        self.model = model  # Model id on this provider (None: use the model of the request)
+        self.latencies: deque[float] = deque(maxlen=window)  # Of successful calls
+        self.error_decay = error_decay
+        self.error_rate = 0.0  # Exponentially weighted share of failed calls
+        self.in_flight = 0
+        self.calls = 0
+        self.hedges = 0            # Calls made as a hedge for a slow primary
+        self.failures = 0
+        self.used = 0              # Responses returned to the caller
+        self.hedge_wins = 0        # ...of which came from a hedge
+        self.unused = 0            # Completed responses that lost the race
+        self.cancelled = 0         # Calls cancelled because another provider answered first
+        self.prompt_tokens = 0     # Reported by completed calls, used or not
+        self.completion_tokens = 0
+        self.unused_prompt_tokens = 0
+        self.unused_completion_tokens = 0
+        self.cancelled_prompt_tokens = 0  # Estimated from the winning response of the same request
+
+    def latency_quantile(self, q: float) -> float:
+        return percentile(self.latencies, q)
+
+    def mean_latency(self) -> float | None:
+        return sum(self.latencies) / len(self.latencies) if self.latencies else None
+
+    def weight(self, default_latency: float) -> float:
+        # The mean (unlike the median) reflects a heavy tail
+        latency = self.mean_latency() or default_latency
+        return (1 - self.error_rate) ** 2 / max(latency, 1e-3)
+
+    def _record(self, failed: bool):
+        self.error_rate += self.error_decay * (float(failed) - self.error_rate)
+
+    async def call(self, kwargs: dict, hedge: bool = False):
+        self.calls += 1
+        self.hedges += hedge
+        self.in_flight += 1
+        start = asyncio.get_running_loop().time()
+        try:
+            if self.model:
+                kwargs = {**kwargs, "model": self.model}
+            response = await self.backend.chat_completion(**kwargs)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        except Exception:
+            self.failures += 1
+            self._record(failed=True)
+            raise
+        finally:
+            self.in_flight -= 1
+        self.latencies.append(asyncio.get_running_loop().time() - start)
+        self._record(failed=False)
+        self._count_usage(getattr(response, "usage", None))
+        return response
+
+    async def stream(self, kwargs: dict):
+        """Streams a completion. A stream closed early by the caller (e.g. on invalid output) is not a provider failure."""
+        self.calls += 1
+        self.in_flight += 1
+        start = asyncio.get_running_loop().time()
+        try:
+            if self.model:
+                kwargs = {**kwargs, "model": self.model}
+            async with aclosing(self.backend.chat_completion_stream(**kwargs)) as stream:
+                async for chunk in stream:
+                    self._count_usage(getattr(chunk, "usage", None))
+                    yield chunk
+        except GeneratorExit:
+            self.used += 1
+            raise
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        except Exception:
+            self.failures += 1
+            self._record(failed=True)
+            raise
+        finally:
+            self.in_flight -= 1
+        self.used += 1
+        self.latencies.append(asyncio.get_running_loop().time() - start)
+        self._record(failed=False)
+
+    def _count_usage(self, usage):
+        if usage is not None:
+            self.prompt_tokens += usage.prompt_tokens or 0
+            self.completion_tokens += usage.completion_tokens or 0
+
+
+class Router:
+    def __init__(
+        self,
+        routes: list[ProviderRoute],
+        hedge: bool = False,
+        hedge_quantile: float = 95,
+        hedge_budget: float = 0.1,
+        min_samples: int = 20,
+        explore: float = 0.05,
+        seed: int | None = None,
+    ):
+        if not routes:
+            raise ValueError("The router needs at least one provider.")
+        self.routes = routes
+        self.hedge = hedge
+        self.hedge_quantile = hedge_quantile  # Hedge once the primary is slower than this percentile of its latencies
+        self.hedge_budget = hedge_budget      # At most this fraction of requests is hedged
+        self.min_samples = min_samples        # Latencies needed before a provider's percentile is trusted
+        self.explore = explore                # Minimum weight of any provider, relative to the best one
+        self.rng = random.Random(seed)
+        self.requests = 0
+        self.hedged = 0
+
+    @property
+    def name(self) -> str:
+        return "router(" + ", ".join(route.name for route in self.routes) + ")"
+
+    def pick(self, exclude: tuple[ProviderRoute, ...] = ()) -> ProviderRoute | None:
+        """Draws a provider at random, weighted by live latency and error rate."""
+        candidates = [route for route in self.routes if route not in exclude]
+        if not candidates:
+            return None
+        # Providers without measurements yet are assumed to be typical
+        known = [route.mean_latency() for route in self.routes if route.latencies]
+        default_latency = percentile(known, 50) if known else 1.0
+        weights = [route.weight(default_latency) for route in candidates]
+        floor = self.explore * max(weights)
+        return self.rng.choices(candidates, weights=[max(weight, floor) for weight in weights])[0]
+
+    def hedge_delay(self, route: ProviderRoute) -> float | None:
+        """Seconds to wait for `route` before hedging, or None if its requests are not hedged."""
+        if not self.hedge or len(self.routes) < 2 or len(route.latencies) < self.min_samples:
+            return None
+        return route.latency_quantile(self.hedge_quantile)
+
+    async def chat_completion(self, **kwargs):
+        self.requests += 1
+        primary = self.pick()
+        tasks = {asyncio.create_task(primary.call(kwargs)): primary}
+        try:
+            delay = self.hedge_delay(primary)
+            if delay is not None:
+                done, _ = await asyncio.wait(tasks, timeout=delay)
+                within_budget = self.hedged < self.hedge_budget * self.requests
+                second = self.pick(exclude=(primary,)) if not done and within_budget else None
+                if second is not None:
+                    self.hedged += 1
+                    tasks[asyncio.create_task(second.call(kwargs, hedge=True))] = second
+
+            error = None
+            while tasks:
+                done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                winner = None
+                for task in done:
+                    route = tasks.pop(task)
+                    if task.exception() is not None:
+                        error = task.exception()
+                    elif winner is None:
+                        winner, response = route, task.result()
+                    else:
+                        # Both answered in the same tick: the second response is paid for but unused
+                        self._record_unused(route, task.result())
+                if winner is not None:
+                    winner.used += 1
+                    winner.hedge_wins += winner is not primary
+                    for route in tasks.values():
+                        route.cancelled_prompt_tokens += getattr(getattr(response, "usage", None), "prompt_tokens", 0) or 0
+                    return response
+            raise error
+        finally:
+            # Cancels the loser (or everything, if our caller was cancelled)
+            for task in tasks:
+                task.cancel()
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def chat_completion_stream(self, **kwargs):
+        """Streams a completion from one provider (streams are not hedged)."""
+        self.requests += 1
+        async with aclosing(self.pick().stream(kwargs)) as stream:
+            async for chunk in stream:
+                yield chunk
+
+    @staticmethod
+    def _record_unused(route: ProviderRoute, response):
+        route.unused += 1
+        usage = getattr(response, "usage", None)
+        if usage is not None:
+            route.unused_prompt_tokens += usage.prompt_tokens or 0
+            route.unused_completion_tokens += usage.completion_tokens or 0
+
+    def summary(self) -> str:
+        calls = sum(route.calls for route in self.routes)
+        extra = (calls - self.requests) / self.requests if self.requests else 0.0
+        shares = ", ".join(f"{route.name} {route.used / max(self.requests, 1):.0%}" for route in self.routes)
+        return f"router: {self.requests} requests, {self.hedged} hedged, {calls} provider calls (+{extra:.1%}); served by {shares}"
+
+    def report(self, input_price: float | None = None, output_price: float | None = None) -> str:
+        """
+        Per-provider table. Prices are USD per million tokens; the waste column is what
+        the unused and cancelled calls cost (cancelled calls counted for input tokens only).
+        """
+        lines = [
+            self.summary(),
+            f"{'provider':<20} {'calls':>6} {'hedges':>6} {'used':>6} {'hedge wins':>10} {'cancelled':>9} {'errors':>6} "
+            f"{'err rate':>8} {'p50':>7} {'p95':>7} {'in tok':>9} {'out tok':>8} {'waste':>8}",
+        ]
+        for route in self.routes:
+            wasted_input = route.unused_prompt_tokens + route.cancelled_prompt_tokens
+            if input_price is not None and output_price is not None:
+                waste = f"${(wasted_input * input_price + route.unused_completion_tokens * output_price) / 1e6:.4f}"
+            else:
+                waste = f"{wasted_input + route.unused_completion_tokens} tok"
+            lines.append(
+                f"{route.name:<20} {route.calls:>6} {route.hedges:>6} {route.used:>6} {route.hedge_wins:>10} {route.cancelled:>9} "
+                f"{route.failures:>6} {route.error_rate:>8.1%} {route.latency_quantile(50):>6.2f}s {route.latency_quantile(95):>6.2f}s "
+                f"{route.prompt_tokens:>9} {route.completion_tokens:>8} {waste:>8}"
+            )
+        return "\n".join(lines)
+
+
+def parse_route_spec(spec: str) -> tuple[str, str | None]:
+    """Splits 'NAME=VALUE' into (NAME, VALUE), or returns (NAME, None)."""
+    name, sep, value = spec.partition("=")
+    return name, (value if sep else None)
@@ -0,0 +1,147 @@
+"""
+Vectorized sampling of persona building blocks from persona_components.json.
+
+The weighted component lists are compiled once into alias tables (O(1) per draw),
+and a BlueprintPlanner pre-generates the (profession, age, life context, chat
+quirk, traits, name) tuples for many personas at a time in one seeded NumPy pass.
+Traits are drawn truly without replacement, with probabilities proportional to
+their weights (Gumbel top-k), and professions, life contexts and quirks can
+optionally be stratified so every chunk matches the target weights exactly.
+"""
+
+import numpy as np
+
+
+class AliasTable:
+    """Walker/Vose alias table over a list of {'value': ..., 'weight': ...} items."""
+
+    def __init__(self, items: list[dict]):
+        if not items:
+            raise ValueError("Cannot build an alias table from an empty list.")
+        self.items = items
+        self.values = [item['value'] for item in items]
+        weights = np.asarray([item['weight'] for item in items], dtype=np.float64)
+        if (weights < 0).any() or weights.sum() <= 0:
+            raise ValueError("Weights must be non-negative and not all zero.")
+        self.weights = weights
+        self.probabilities = weights / weights.sum()
+
+        n = len(weights)
+        scaled = self.probabilities * n
+        self._accept = np.ones(n, dtype=np.float64)
+        self._alias = np.arange(n, dtype=np.int64)
+        small = [i for i in range(n) if scaled[i] < 1.0]
+        large = [i for i in range(n) if scaled[i] >= 1.0]
+        while small and large:
+            s, l = small.pop(), large.pop()
+            self._accept[s] = scaled[s]
+            self._alias[s] = l
+            scaled[l] -= 1.0 - scaled[s]
+            (small if scaled[l] < 1.0 else large).append(l)
+        # Whatever is left is 1.0 up to rounding error and keeps accept = 1
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def sample(self, rng: np.random.Generator, size: int) -> np.ndarray:
+        """Draws `size` indices with replacement, proportional to the weights."""
+        columns = rng.integers(0, len(self.items), size=size)
+        coins = rng.random(size)
+        return np.where(coins < self._accept[columns], columns, self._alias[columns])
+
+    def stratified(self, rng: np.random.Generator, size: int) -> np.ndarray:
+        """
+        Draws `size` indices whose counts match the weights as closely as possible
+        (largest-remainder rounding), in random order.
+        """
+        expected = self.probabilities * size
+        counts = np.floor(expected).astype(np.int64)
+        shortfall = size - counts.sum()
+        if shortfall:
+            # Break ties between equal remainders randomly
+            remainders = expected - counts + rng.random(len(counts)) * 1e-9
+            counts[np.argsort(-remainders)[:shortfall]] += 1
+        return rng.permutation(np.repeat(np.arange(len(counts)), counts))
+
+    def sample_without_replacement(self, rng: np.random.Generator, size: int, k: int) -> np.ndarray:
+        """
+        Draws `size` rows of k distinct indices. Taking the top k of log(weight) plus
+        Gumbel noise is equivalent to drawing k items one after another, each
+        proportional to the weights of the items not yet drawn.
+        """
+        if k > np.count_nonzero(self.weights):
+            raise ValueError(f"Cannot draw {k} distinct items from {np.count_nonzero(self.weights)} with non-zero weight.")
+        with np.errstate(divide="ignore"):
+            log_weights = np.log(self.weights)
+        keys = log_weights + rng.gumbel(size=(size, len(self.items)))
+        top = np.argpartition(-keys, k - 1, axis=1)[:, :k]
+        # Order each row by key so the first trait is the "strongest" draw
+        order = np.argsort(-np.take_along_axis(keys, top, axis=1), axis=1)
+        return np.take_along_axis(top, order, axis=1)
+
+
+class BlueprintPlanner:
+    """
+    Deterministic, chunked generator of persona blueprints.
+
+    Blueprint i depends only on (seed, i // chunk_size), so a run with a fixed seed is
+    reproducible and memory stays bounded by one chunk however large the run is.
+    """
+
+    def __init__(
+        self,
+        components: dict,
+        first_names: list[str],
+        last_names: list[str],
+        seed: int | None = None,
+        num_traits: int = 6,
+        stratify: bool = False,
+        chunk_size: int = 10_000,
+    ):
+        self.professions = AliasTable(components['professions'])
+        self.life_contexts = AliasTable(components['life_contexts'])
+        self.chatting_quirks = AliasTable(components['chatting_quirks'])
+        self.traits = AliasTable(components['traits'])
+        self.first_names = first_names
+        self.last_names = last_names
+        self.min_ages = np.asarray([item.get('min_age', 19) for item in components['professions']], dtype=np.int64)
+        self.max_ages = np.asarray([item.get('max_age', 75) for item in components['professions']], dtype=np.int64)
+        self.seed = seed if seed is not None else int(np.random.SeedSequence().entropy % (1 << 63))
+        self.num_traits = num_traits
+        self.stratify = stratify
+        self.chunk_size = chunk_size
+        self._chunk_index = -1
+        self._chunk: dict[str, np.ndarray] = {}
+
+    def plan_chunk(self, chunk_index: int) -> dict[str, np.ndarray]:
+        """Generates the index arrays for one chunk of blueprints in a single vectorized pass."""
+        rng = np.random.default_rng([self.seed, chunk_index])
+        n = self.chunk_size
+        draw = (lambda table: table.stratified(rng, n)) if self.stratify else (lambda table: table.sample(rng, n))
+        professions = draw(self.professions)
+        min_ages, max_ages = self.min_ages[professions], self.max_ages[professions]
+        return {
+            "profession": professions,
+            "age": min_ages + (rng.random(n) * (max_ages - min_ages + 1)).astype(np.int64),
+            "life_context": draw(self.life_contexts),
+            "chat_quirk": draw(self.chatting_quirks),
+            "traits": self.traits.sample_without_replacement(rng, n, self.num_traits),
+            "first_name": rng.integers(0, len(self.first_names), size=n),
+            "last_name": rng.integers(0, len(self.last_names), size=n),
+        }
+
+    def __getitem__(self, i: int) -> dict:
+        """Returns blueprint i as the building-block dict used to build prompts."""
+        chunk_index, offset = divmod(i, self.chunk_size)
+        if chunk_index != self._chunk_index:
+            self._chunk = self.plan_chunk(chunk_index)
+            self._chunk_index = chunk_index
+        c = self._chunk
+        return {
+            "name": f"{self.first_names[c['first_name'][offset]]} {self.last_names[c['last_name'][offset]]}",
+            "profession": self.professions.values[c['profession'][offset]],
+            "age": int(c['age'][offset]),
+            "life_context": self.life_contexts.values[c['life_context'][offset]],
+            "chat_quirk": self.chatting_quirks.values[c['chat_quirk'][offset]],
+            "traits": [self.traits.values[t] for t in c['traits'][offset]],
+        }
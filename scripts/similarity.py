@@ -0,0 +1,365 @@
+"""
+Near-duplicate detection helpers shared by the generation and processing scripts.
+
+Personas are compared on their shingled `background` and `chatting_style` text.
+Each text is reduced to a fixed-size MinHash signature, and signatures are
+bucketed with LSH banding so that candidate pairs are found in roughly linear
+time instead of comparing every persona against every other one.
+"""
+
+import os
+import re
+import time
+
+import numpy as np
+
+_NON_WORD = re.compile(r"[^\w\s]+")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_text(text: str) -> str:
+    """Lowercases text and strips punctuation and repeated whitespace."""
+    text = _NON_WORD.sub(" ", text.lower())
+    return _WHITESPACE.sub(" ", text).strip()
+
+
+def persona_text(persona: dict) -> str:
+    """Returns the free-text part of a persona used for similarity checks."""
+    return f"{persona.get('background') or ''} | {persona.get('chatting_style') or ''}"
+
+
+def shingle_hashes(text: str, k: int = 5) -> np.ndarray:
+    """
+    Returns the distinct k-byte shingles of the normalized text, each packed
+    into a single uint64 (so k can be at most 8).
+    """
+    data = np.frombuffer(normalize_text(text).encode("utf-8"), dtype=np.uint8)
+    if len(data) == 0:
+        return np.empty(0, dtype=np.uint64)
+    if len(data) <= k:
+        data = np.pad(data, (0, k - len(data)))
+    windows = np.lib.stride_tricks.sliding_window_view(data, k).astype(np.uint64)
+    packed = windows @ (np.uint64(256) ** np.arange(k, dtype=np.uint64))
+    return np.unique(packed)
+
+
+def optimal_bands(num_perm: int, threshold: float) -> tuple[int, int]:
+    """
+    Picks the (bands, rows) split of a signature for a target similarity.
+
+    The LSH threshold of a split is roughly (1 / bands) ** (1 / rows). We take the
+    highest one that does not exceed the target: a lower threshold only adds
+    candidates, which are filtered out afterwards, while a higher one would
+    silently miss true near-duplicates.
+    """
+    best = (num_perm, 1)
+    best_threshold = 0.0
+    for rows in range(1, num_perm + 1):
+        if num_perm % rows:
+            continue
+        bands = num_perm // rows
+        approx = (1 / bands) ** (1 / rows)
+        if best_threshold < approx <= threshold:
+            best, best_threshold = (bands, rows), approx
+    return best
+
+
+class MinHasher:
+    """
+    Computes MinHash signatures with a seeded family of multiply-shift hashes,
+    h(x) = (a * x + b) >> 32 over uint64, evaluated for all shingles at once.
+    """
+
+    def __init__(self, num_perm: int = 128, shingle_size: int = 5, seed: int = 1):
+        if not 1 <= shingle_size <= 8:
+            raise ValueError("shingle_size must be between 1 and 8.")
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(1, 1 << 63, size=num_perm, dtype=np.uint64) | np.uint64(1)
+        self._b = rng.integers(0, 1 << 63, size=num_perm, dtype=np.uint64)
+
+    def signature(self, text: str) -> np.ndarray:
+        """Returns the MinHash signature of a text as a uint32 array."""
+        hashes = shingle_hashes(text, self.shingle_size)
+        if len(hashes) == 0:
+            return np.full(self.num_perm, np.iinfo(np.uint32).max, dtype=np.uint32)
+        # uint64 arithmetic wraps modulo 2**64, which is exactly what multiply-shift needs.
+        # The shift is monotonic, so it can be applied after taking the minimum.
+        permuted = np.multiply.outer(hashes, self._a)
+        permuted += self._b
+        return (permuted.min(axis=0) >> np.uint64(32)).astype(np.uint32)
+
+    def persona_signature(self, persona: dict) -> np.ndarray:
+        return self.signature(persona_text(persona))
+
+
+def estimate_jaccard(sig_a: np.ndarray, sig_b: np.ndarray) -> float:
+    """Estimates Jaccard similarity as the fraction of agreeing signature slots."""
+    return float(np.count_nonzero(sig_a == sig_b)) / len(sig_a)
+
+
+class LSHIndex:
+    """
+    Incremental LSH banding index over MinHash signatures.
+
+    Each signature is cut into `bands` slices of `rows` values; two items become
+    candidates when any slice matches exactly. Candidates are then verified
+    against the estimated Jaccard similarity, so a query costs O(bands) dict
+    lookups plus the (usually tiny) number of candidates.
+
+    Signatures live in one contiguous uint32 matrix and every band is reduced to
+    a single 64-bit key, which keeps the per-item overhead low for large corpora.
+    """
+
+    def __init__(self, num_perm: int = 128, threshold: float = 0.8):
+        self.num_perm = num_perm
+        self.threshold = threshold
+        self.bands, self.rows = optimal_bands(num_perm, threshold)
+        self._buckets: list[dict[int, list[int]]] = [{} for _ in range(self.bands)]
+        self._matrix = np.empty((1024, num_perm), dtype=np.uint32)
+        self._keys: list = []  # Slot -> key (None once removed)
+        self._slots: dict = {}  # Key -> slot
+        self._free: list[int] = []  # Slots of removed items, reused by the next inserts
+        # Fixed odd multipliers: band keys are stable across processes and runs
+        rng = np.random.default_rng(0x5EED)
+        self._band_multipliers = rng.integers(1, 1 << 63, size=self.rows, dtype=np.uint64) | np.uint64(1)
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+    def __contains__(self, key) -> bool:
+        return key in self._slots
+
+    def band_key_matrix(self, signatures: np.ndarray) -> np.ndarray:
+        """Returns an (n, bands) uint64 matrix of band keys for an (n, num_perm) signature matrix."""
+        bands = signatures[:, :self.bands * self.rows].reshape(len(signatures), self.bands, self.rows).astype(np.uint64)
+        # uint64 arithmetic wraps modulo 2**64
+        return (bands * self._band_multipliers).sum(axis=2, dtype=np.uint64)
+
+    def band_keys(self, signature: np.ndarray) -> list[int]:
+        """Returns one 64-bit key per band of a single signature."""
+        return self.band_key_matrix(signature[np.newaxis])[0].tolist()
+
+    def insert(self, key, signature: np.ndarray):
+        """Adds a signature to the index under the given key."""
+        if key in self._slots:
+            raise KeyError(f"Key {key!r} is already in the index.")
+        if self._free:
+            slot = self._free.pop()
+            self._keys[slot] = key
+        else:
+            slot = len(self._keys)
+            if slot == len(self._matrix):
+                self._matrix = np.concatenate([self._matrix, np.empty_like(self._matrix)])
+            self._keys.append(key)
+        self._matrix[slot] = signature
+        self._slots[key] = slot
+        for bucket, band_key in zip(self._buckets, self.band_keys(signature)):
+            bucket.setdefault(band_key, []).append(slot)
+
+    def remove(self, key):
+        """Drops a key from the index; its slot is reused, so a sliding window of items takes constant memory."""
+        slot = self._slots.pop(key)
+        self._keys[slot] = None
+        self._free.append(slot)
+        for bucket, band_key in zip(self._buckets, self.band_keys(self._matrix[slot])):
+            slots = bucket.get(band_key)
+            if slots is None:
+                continue
+            slots.remove(slot)
+            if not slots:
+                del bucket[band_key]
+
+    def candidates(self, signature: np.ndarray) -> set[int]:
+        """Returns the slots of every item sharing at least one band with the signature."""
+        found = set()
+        for bucket, band_key in zip(self._buckets, self.band_keys(signature)):
+            found.update(bucket.get(band_key, ()))
+        return found
+
+    def query(self, signature: np.ndarray) -> list[tuple]:
+        """
+        Returns (key, estimated_jaccard) for every indexed item whose estimated
+        similarity reaches the threshold, most similar first.
+        """
+        slots = self.candidates(signature)
+        if not slots:
+            return []
+        slots = np.fromiter(slots, dtype=np.int64, count=len(slots))
+        similarities = (self._matrix[slots] == signature).mean(axis=1)
+        matches = [
+            (self._keys[slot], float(similarity))
+            for slot, similarity in zip(slots.tolist(), similarities.tolist())
+            if similarity >= self.threshold
+        ]
+        matches.sort(key=lambda item: item[1], reverse=True)
+        return matches
+
+
+class SignatureStore:
+    """
+    Append-only on-disk store of MinHash signatures, for near-duplicate checks
+    against a large existing corpus without rebuilding an LSHIndex.
+
+    Signatures are memory-mapped and only read for verified candidates; band
+    keys are loaded once and sorted per band, so a batch query is a binary
+    search per band instead of a dict lookup per indexed item. Items appended
+    during a run are not searchable until the store is reopened; callers keep
+    those in an in-memory LSHIndex.
+    """
+
+    def __init__(self, directory: str, num_perm: int = 128, threshold: float = 0.8, length: int | None = None):
+        self.directory = directory
+        self.num_perm = num_perm
+        self.threshold = threshold
+        self._lsh = LSHIndex(num_perm=num_perm, threshold=threshold)  # Shares the band layout and band keys
+        self._paths = {
+            name: os.path.join(directory, f"{name}.bin") for name in ("keys", "signatures", "band_keys")
+        }
+        os.makedirs(directory, exist_ok=True)
+        if length is not None:
+            self._truncate(length)
+        self._keys = self._load("keys", np.int64, 1)
+        self._band_keys = self._load("band_keys", np.uint64, self._lsh.bands)
+        self._signatures = (
+            np.memmap(self._paths["signatures"], dtype=np.uint32, mode="r", shape=(len(self._keys), num_perm))
+            if len(self._keys) else np.empty((0, num_perm), dtype=np.uint32)
+        )
+        self._order = np.argsort(self._band_keys, axis=0, kind="stable")
+        self._sorted = np.take_along_axis(self._band_keys, self._order, axis=0)
+
+    def _load(self, name: str, dtype, width: int) -> np.ndarray:
+        path = self._paths[name]
+        data = np.fromfile(path, dtype=dtype) if os.path.exists(path) else np.empty(0, dtype=dtype)
+        return data if width == 1 else data.reshape(-1, width)
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def _truncate(self, length: int):
+        """Drops everything after the first `length` items (e.g. appends from an interrupted run)."""
+        for name, row_bytes in (("keys", 8), ("signatures", 4 * self.num_perm), ("band_keys", 8 * self._lsh.bands)):
+            path = self._paths[name]
+            if os.path.exists(path) and os.path.getsize(path) > length * row_bytes:
+                os.truncate(path, length * row_bytes)
+
+    def append(self, keys: list[int], signatures: np.ndarray):
+        """Appends items to the files on disk."""
+        if not len(keys):
+            return
+        signatures = np.ascontiguousarray(signatures, dtype=np.uint32)
+        for name, array in (
+            ("keys", np.asarray(keys, dtype=np.int64)),
+            ("signatures", signatures),
+            ("band_keys", self._lsh.band_key_matrix(signatures)),
+        ):
+            with open(self._paths[name], "ab") as f:
+                array.tofile(f)
+                f.flush()
+                os.fsync(f.fileno())
+
+    def query_many(self, signatures: np.ndarray) -> list[list[tuple]]:
+        """
+        For each row of an (n, num_perm) signature matrix, returns (key, estimated_jaccard)
+        for every stored item reaching the threshold, most similar first.
+        """
+        results = [[] for _ in range(len(signatures))]
+        if not len(self._keys) or not len(signatures):
+            return results
+        query_keys = self._lsh.band_key_matrix(signatures)
+        candidates: dict[int, set] = {}
+        for band in range(self._lsh.bands):
+            column = self._sorted[:, band]
+            lo = np.searchsorted(column, query_keys[:, band], side="left")
+            hi = np.searchsorted(column, query_keys[:, band], side="right")
+            for row in np.flatnonzero(hi > lo).tolist():
+                candidates.setdefault(row, set()).update(self._order[lo[row]:hi[row], band].tolist())
+        for row, slots in candidates.items():
+            slots = np.sort(np.fromiter(slots, dtype=np.int64, count=len(slots)))
+            similarities = (self._signatures[slots] == signatures[row]).mean(axis=1)
+            matches = [
+                (int(self._keys[slot]), float(similarity))
+                for slot, similarity in zip(slots.tolist(), similarities.tolist())
+                if similarity >= self.threshold
+            ]
+            matches.sort(key=lambda item: item[1], reverse=True)
+            results[row] = matches
+        return results
+
+
+class NoveltyGate:
+    """
+    Incremental novelty check used while generating.
+
+    Every accepted persona is added to an LSH index; a new persona is rejected
+    when its estimated similarity to any accepted one reaches the threshold.
+    Checks run in well under a millisecond, so duplicates can be dropped (and
+    regenerated) before they count toward the target.
+
+    Each indexed persona costs about 3.5 KB (its signature, band buckets and name).
+    With `window`, only the most recent `window` personas are kept, so memory
+    stays flat on long runs; near-duplicates of older ones are left to
+    process.uv.py, which checks the whole corpus.
+    """
+
+    def __init__(self, threshold: float = 0.8, num_perm: int = 128, shingle_size: int = 5, window: int | None = None):
+        self.hasher = MinHasher(num_perm=num_perm, shingle_size=shingle_size)
+        self.index = LSHIndex(num_perm=num_perm, threshold=threshold)
+        self.window = window
+        self._labels: dict[int, str] = {}  # Key -> name, oldest first
+        self._next_key = 0
+        self.evicted = 0
+        self.accepted = 0
+        self.rejected = 0
+        self.check_seconds = 0.0
+
+    def _add(self, persona: dict, signature: np.ndarray):
+        if self.window is not None and len(self._labels) >= self.window:
+            oldest = next(iter(self._labels))
+            self.index.remove(oldest)
+            del self._labels[oldest]
+            self.evicted += 1
+        self.index.insert(self._next_key, signature)
+        self._labels[self._next_key] = persona.get("name") or "?"
+        self._next_key += 1
+
+    def seed(self, personas):
+        """Adds personas to the index without counting them as accepted."""
+        for persona in personas:
+            self._add(persona, self.hasher.persona_signature(persona))
+
+    def check(self, persona: dict) -> tuple[str, float] | None:
+        """
+        Returns (name, similarity) of the closest known persona if the new one is a
+        near-duplicate. Otherwise the persona is added to the index and None is returned.
+        """
+        start = time.perf_counter()
+        signature = self.hasher.persona_signature(persona)
+        matches = self.index.query(signature)
+        if matches:
+            self.rejected += 1
+            key, similarity = matches[0]
+            result = (self._labels[key], similarity)
+        else:
+            self.accepted += 1
+            self._add(persona, signature)
+            result = None
+        self.check_seconds += time.perf_counter() - start
+        return result
+
+    @property
+    def checked(self) -> int:
+        return self.accepted + self.rejected
+
+    @property
+    def rejection_rate(self) -> float:
+        return self.rejected / self.checked if self.checked else 0.0
+
+    def summary(self) -> str:
+        mean_ms = 1000 * self.check_seconds / self.checked if self.checked else 0.0
+        return (
+            f"Novelty gate: {self.accepted} accepted, {self.rejected} rejected "
+            f"({self.rejection_rate:.1%} rejection rate, {mean_ms:.3f} ms/check)"
+            + (f", window of {self.window} ({self.evicted} evicted)" if self.window is not None else "")
+        )
@@ -0,0 +1,367 @@
+"""
+Incremental validation of streamed persona JSON.
+
+With --stream, generate_personas reads each completion as it is generated and
+feeds the text to a PersonaStreamParser. The parser checks the output against
+the response schema while it arrives: the overall shape (a single persona, or
+{"personas": [...]} for a batch), the keys and value types of every persona,
+the item count, and the length limits of string fields, counted as the string
+grows. The first violation raises StreamViolation, so the caller can close the
+stream and stop paying for output that would be thrown away, instead of finding
+out after max_tokens. Each persona object is decoded (json.loads on its slice of
+the text) as soon as it closes, so the items before a violation are kept.
+
+The parser only tracks structure and a few counters per string; it never builds
+values itself, and runs of plain string characters are consumed with one regex
+match, so feeding it costs little more than receiving the text.
+"""
+
+import re
+import json
+from dataclasses import dataclass
+
+_WHITESPACE = " \t\n\r"
+_STRING_RUN = re.compile(r'[^"\\\x00-\x1f]*')
+_NUMBER_CHARS = frozenset("0123456789+-.eE")
+_NUMBER = re.compile(r"-?(?:0|[1-9][0-9]*)(?:\.[0-9]+)?(?:[eE][+-]?[0-9]+)?")
+_ESCAPES = frozenset('"\\/bfnrtu')
+_HEX = frozenset("0123456789abcdefABCDEF")
+_LITERALS = {"t": ("true", "boolean"), "f": ("false", "boolean"), "n": ("null", "null")}
+
+# Parser states
+_VALUE, _VALUE_OR_END, _KEY, _KEY_OR_END, _COLON, _COMMA_OR_END, _STRING, _NUMBER_TOKEN, _LITERAL, _DONE = range(10)
+
+
+class StreamViolation(ValueError):
+    """Streamed output that can no longer become a valid response. `code` is a short label for telemetry."""
+
+    def __init__(self, message: str, code: str):
+        super().__init__(message)
+        self.code = code
+
+
+@dataclass(frozen=True)
+class FieldSpec:
+    types: frozenset[str]                  # Allowed JSON types ("integer" also accepts integral numbers); empty allows any
+    item_types: frozenset[str] = frozenset()  # For arrays: allowed types of the elements
+    max_length: int | None = None          # For strings: maximum number of characters
+
+
+def json_types(schema: dict) -> frozenset[str]:
+    """JSON types allowed by a (pydantic-generated) property schema."""
+    if "anyOf" in schema:
+        return frozenset().union(*(json_types(option) for option in schema["anyOf"]))
+    kind = schema.get("type")
+    if kind is None:
+        return frozenset()
+    return frozenset([kind] if isinstance(kind, str) else kind)
+
+
+def item_fields(schema: dict, max_lengths: dict[str, int] | None = None) -> dict[str, FieldSpec]:
+    """Field specs of an object schema's properties, with optional string length limits."""
+    max_lengths = max_lengths or {}
+    return {
+        name: FieldSpec(json_types(prop), json_types(prop.get("items", {})), max_lengths.get(name))
+        for name, prop in schema.get("properties", {}).items()
+    }
+
+
+class _Frame:
+    """An open container. role: 'root' (not known yet), 'wrapper', 'items', 'item', 'array' or 'any'."""
+
+    __slots__ = ("role", "is_object", "key", "seen", "spec")
+
+    def __init__(self, role: str, is_object: bool, spec: FieldSpec | None = None):
+        self.role = role
+        self.is_object = is_object
+        self.key = None     # Objects: key of the value being parsed
+        self.seen = set()   # Items: keys seen so far
+        self.spec = spec    # Arrays: spec of the field holding them
+
+
+class PersonaStreamParser:
+    """
+    Validates streamed JSON holding persona objects (see the module docstring).
+    feed() returns the items completed by each chunk and raises StreamViolation
+    on the first violation; finish() checks that the output ended complete.
+    """
+
+    def __init__(self, item_schema: dict, batch_size: int = 1, max_lengths: dict[str, int] | None = None):
+        self.fields = item_fields(item_schema, max_lengths)
+        self.required = frozenset(item_schema.get("required", ()))
+        self.batch_size = batch_size
+        self.items: list[dict] = []
+        self.chars = 0           # Characters received
+        self.items_end = 0       # Characters up to the end of the last completed item
+        self._stack: list[_Frame] = []
+        self._state = _VALUE
+        self._item_parts: list[str] | None = None  # Text of the item being received (before the current chunk)
+        self._item_from = 0                        # Offset in the current chunk where that item continues
+        # The token being received
+        self._key_parts: list[str] | None = None   # Raw characters of an object key (None for a value string)
+        self._string_field = None                  # Field whose value is being received, for length limits
+        self._string_limit = None
+        self._string_length = 0
+        self._escape = None                        # None, "" right after a backslash, or the \\u hex digits so far
+        self._token: list[str] = []                # Number or literal characters so far
+        self._token_kind = None                    # Expected literal, or the allowed types of a number
+
+    @property
+    def done(self) -> bool:
+        return self._state == _DONE
+
+    def feed(self, text: str) -> list[dict]:
+        completed = []
+        i, n = 0, len(text)
+        base = self.chars
+        self.chars += n
+        self._item_from = 0
+        while i < n:
+            state = self._state
+            if state == _STRING:
+                i = self._scan_string(text, i)
+                continue
+            c = text[i]
+            if state == _NUMBER_TOKEN:
+                if c in _NUMBER_CHARS:
+                    self._token.append(c)
+                    i += 1
+                    continue
+                self._end_number()
+                continue  # The delimiter is handled in the new state
+            if state == _LITERAL:
+                self._token.append(c)
+                word = self._token_kind
+                if not word.startswith("".join(self._token)):
+                    raise StreamViolation(f"Invalid JSON literal at character {base + i}.", "invalid_json")
+                if len(self._token) == len(word):
+                    self._end_value()
+                i += 1
+                continue
+            if c in _WHITESPACE:
+                i += 1
+                continue
+            if state == _DONE:
+                raise StreamViolation("Unexpected text after the JSON value.", "trailing_text")
+            if state in (_VALUE, _VALUE_OR_END):
+                if c == "]" and state == _VALUE_OR_END:
+                    self._close(text, i, completed, base)
+                else:
+                    self._begin_value(c, text, i)
+            elif state in (_KEY, _KEY_OR_END):
+                if c == "}" and state == _KEY_OR_END:
+                    self._close(text, i, completed, base)
+                elif c == '"':
+                    self._key_parts, self._escape = [], None
+                    self._state = _STRING
+                else:
+                    raise StreamViolation(f"Expected an object key at character {base + i}.", "invalid_json")
+            elif state == _COLON:
+                if c != ":":
+                    raise StreamViolation(f"Expected ':' at character {base + i}.", "invalid_json")
+                self._state = _VALUE
+            elif state == _COMMA_OR_END:
+                is_object = self._stack[-1].is_object
+                if c == ",":
+                    self._state = _KEY if is_object else _VALUE
+                elif c == ("}" if is_object else "]"):
+                    self._close(text, i, completed, base)
+                else:
+                    raise StreamViolation(f"Expected ',' at character {base + i}.", "invalid_json")
+            i += 1
+        if self._item_parts is not None:
+            self._item_parts.append(text[self._item_from:])
+        return completed
+
+    def finish(self):
+        """Raises StreamViolation unless the received text is a complete JSON value."""
+        if self._state != _DONE:
+            raise StreamViolation("The output ended before the JSON was complete.", "truncated")
+
+    # --- Values ---
+
+    def _slot(self) -> tuple[str, FieldSpec | None]:
+        """Role of the value about to start, and the spec of the field it belongs to (for item fields)."""
+        if not self._stack:
+            return "root", None
+        frame = self._stack[-1]
+        if frame.role == "items":
+            return "item", None
+        if frame.role == "wrapper":
+            return "items", None
+        if frame.role == "item":
+            return "field", self.fields.get(frame.key)
+        if frame.role == "array":
+            return "element", frame.spec
+        return "any", None
+
+    @staticmethod
+    def _allowed(role: str, spec: FieldSpec | None) -> frozenset[str]:
+        if spec is None:
+            return frozenset()
+        return spec.types if role == "field" else spec.item_types if role == "element" else frozenset()
+
+    def _check_type(self, kind: str, role: str, spec: FieldSpec | None):
+        if role == "root" and kind not in ("object", "array"):
+            raise StreamViolation("Expected a JSON object.", "schema")
+        if role == "items" and kind != "array":
+            raise StreamViolation("'personas' must be an array.", "schema")
+        if role == "item" and kind != "object":
+            raise StreamViolation("Expected a persona object in the array.", "schema")
+        allowed = self._allowed(role, spec)
+        if kind == "number" and "integer" in allowed:
+            return  # Checked when the number ends
+        if allowed and kind not in allowed:
+            where = f"'{self._stack[-1].key}'" if role == "field" else f"an element of '{self._stack[-2].key}'"
+            raise StreamViolation(f"{where} must be {' or '.join(sorted(allowed))}, not {kind}.", "schema")
+
+    def _begin_value(self, c: str, text: str, i: int):
+        role, spec = self._slot()
+        if c == "{":
+            self._check_type("object", role, spec)
+            if role == "item" and len(self.items) >= self.batch_size:
+                raise StreamViolation(f"More than {self.batch_size} personas in the output.", "too_many_items")
+            if role in ("root", "item"):
+                # Both may turn out to be a persona (a root object, unless its first key is 'personas')
+                self._item_parts, self._item_from = [], i
+            self._stack.append(_Frame(role if role in ("root", "item") else "any", True))
+            self._state = _KEY_OR_END
+        elif c == "[":
+            self._check_type("array", role, spec)
+            self._stack.append(_Frame({"root": "items", "items": "items", "field": "array"}.get(role, "any"), False, spec))
+            self._state = _VALUE_OR_END
+        elif c == '"':
+            self._check_type("string", role, spec)
+            self._key_parts, self._escape, self._string_length = None, None, 0
+            self._string_field = self._stack[-1].key if role == "field" else None
+            self._string_limit = spec.max_length if role == "field" and spec is not None else None
+            self._state = _STRING
+        elif c in _LITERALS:
+            word, kind = _LITERALS[c]
+            self._check_type(kind, role, spec)
+            self._token, self._token_kind = [c], word
+            self._state = _LITERAL
+        elif c == "-" or c.isdigit():
+            self._check_type("number", role, spec)
+            self._token, self._token_kind = [c], self._allowed(role, spec)
+            self._state = _NUMBER_TOKEN
+        else:
+            raise StreamViolation(f"Unexpected character {c!r} at character {self.chars - len(text) + i}.", "invalid_json")
+
+    def _end_number(self):
+        token = "".join(self._token)
+        if not _NUMBER.fullmatch(token):
+            raise StreamViolation(f"Invalid JSON number '{token}'.", "invalid_json")
+        allowed = self._token_kind
+        if allowed and "integer" in allowed and "number" not in allowed and not float(token).is_integer():
+            raise StreamViolation(f"'{self._stack[-1].key}' must be an integer, not {token}.", "schema")
+        self._end_value()
+
+    def _end_value(self):
+        """A scalar value ended: the enclosing container expects a comma or its end."""
+        self._state = _COMMA_OR_END if self._stack else _DONE
+
+    # --- Strings ---
+
+    def _scan_string(self, text: str, i: int) -> int:
+        n = len(text)
+        while i < n:
+            if self._escape is not None:
+                i = self._scan_escape(text, i)
+                continue
+            run = _STRING_RUN.match(text, i).end()
+            if run > i:
+                if self._key_parts is not None:
+                    self._key_parts.append(text[i:run])
+                else:
+                    self._count(run - i)
+                i = run
+                if i == n:
+                    break
+            c = text[i]
+            if c == '"':
+                if self._key_parts is not None:
+                    self._end_key("".join(self._key_parts))
+                else:
+                    self._end_value()
+                return i + 1
+            if c == "\\":
+                self._escape = ""
+                if self._key_parts is not None:
+                    self._key_parts.append(c)
+                i += 1
+                continue
+            raise StreamViolation("Unescaped control character in a string.", "invalid_json")
+        return i
+
+    def _scan_escape(self, text: str, i: int) -> int:
+        c = text[i]
+        if self._key_parts is not None:
+            self._key_parts.append(c)
+        if self._escape == "":
+            if c not in _ESCAPES:
+                raise StreamViolation(f"Invalid escape '\\{c}' in a string.", "invalid_json")
+            if c == "u":
+                self._escape = "u"
+            else:
+                self._escape = None
+                if self._key_parts is None:
+                    self._count(1)
+            return i + 1
+        if c not in _HEX:
+            raise StreamViolation("Invalid \\u escape in a string.", "invalid_json")
+        self._escape += c
+        if len(self._escape) == 5:
+            # The low half of a surrogate pair completes a character counted with the high half
+            if self._key_parts is None and not 0xDC00 <= int(self._escape[1:], 16) <= 0xDFFF:
+                self._count(1)
+            self._escape = None
+        return i + 1
+
+    def _count(self, characters: int):
+        self._string_length += characters
+        if self._string_limit is not None and self._string_length > self._string_limit:
+            raise StreamViolation(f"'{self._string_field}' is longer than {self._string_limit} characters.", f"{self._string_field}_too_long")
+
+    def _end_key(self, raw: str):
+        key = json.loads(f'"{raw}"') if "\\" in raw else raw
+        self._key_parts = None
+        frame = self._stack[-1]
+        if frame.role == "root":
+            if key == "personas":
+                frame.role, self._item_parts = "wrapper", None
+            elif self.batch_size == 1:
+                frame.role = "item"
+            else:
+                raise StreamViolation(f"Expected a 'personas' array, got '{key}'.", "schema")
+        if frame.role == "wrapper" and key != "personas":
+            raise StreamViolation(f"Unexpected field '{key}' next to 'personas'.", "schema")
+        if frame.role == "item":
+            if key not in self.fields:
+                raise StreamViolation(f"Unexpected field '{key}' in a persona.", "schema")
+            if key in frame.seen:
+                raise StreamViolation(f"Duplicate field '{key}' in a persona.", "schema")
+            frame.seen.add(key)
+        frame.key = key
+        self._state = _COLON
+
+    # --- Containers ---
+
+    def _close(self, text: str, i: int, completed: list, base: int):
+        frame = self._stack.pop()
+        if frame.role == "item":
+            missing = self.required - frame.seen
+            if missing:
+                raise StreamViolation(f"Persona is missing {', '.join(sorted(missing))}.", "missing_field")
+            self._item_parts.append(text[self._item_from:i + 1])
+            try:
+                item = json.loads("".join(self._item_parts))
+            except json.JSONDecodeError as e:
+                raise StreamViolation(f"Invalid persona JSON: {e}", "invalid_json") from e
+            self._item_parts = None
+            self.items.append(item)
+            self.items_end = base + i + 1
+            completed.append(item)
+        elif frame.role == "root":
+            raise StreamViolation("Expected a persona object, got an empty object.", "schema")
+        self._end_value()
@@ -0,0 +1,307 @@
+"""
+Per-request telemetry for the generation loop.
+
+`generate_personas` fills one RequestMetrics per API request (queue wait for a
+concurrency slot, API latency, tokens, JSON parse and pydantic validation time,
+the cause of every retry or failure, and for rejected output the tokens it
+wasted and how long it took to reject). The commit loop in main() adds how many
+of its personas were accepted, rejected as near-duplicates or dropped past the
+target, and hands it to Telemetry, which
+  - appends it as one compact line to a metrics JSONL file,
+  - folds it into counters and fixed-bucket histograms, so memory does not grow
+    with the length of the run,
+  - optionally serves those in the Prometheus text format on a local port,
+  - and renders the end-of-run report.
+The scheduler loop in main() adds periodic snapshots of the concurrency limiter.
+"""
+
+import time
+import math
+import asyncio
+from bisect import bisect_left
+from collections import Counter
+from dataclasses import dataclass, field
+
+from jsonl_writer import AsyncJsonlWriter
+
+# Log-spaced bucket bounds (about 19% apart), precise enough for percentiles in the report
+LATENCY_BUCKETS = tuple(round(0.01 * 1.19 ** i, 4) for i in range(48))  # 10ms .. ~35s
+FAST_BUCKETS = tuple(round(1e-5 * 1.5 ** i, 7) for i in range(30))      # 10us .. ~1.3s, for parsing and validation
+WAIT_BUCKETS = tuple(round(1e-5 * 1.4 ** i, 7) for i in range(46))       # 10us .. ~38s, for waits that are usually instant but can stall
+
+
+class Histogram:
+    """Fixed-bucket histogram (Prometheus style: a value lands in the first bucket whose bound is >= it)."""
+
+    def __init__(self, bounds: tuple[float, ...]):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # The last bucket is +Inf
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket holding the q-th quantile (q in [0, 1])."""
+        if not self.count:
+            return 0.0
+        rank, seen = max(1, math.ceil(q * self.count)), 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return self.bounds[i] if i < len(self.bounds) else math.inf
+        return math.inf
+
+    @property
+    def mean(self) -> float:
+        return self.sum / self.count if self.count else 0.0
+
+    def prometheus(self, name: str) -> list[str]:
+        lines, cumulative = [f"# TYPE {name} histogram"], 0
+        for bound, count in zip(self.bounds, self.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{le="{bound}"}} {cumulative}')
+        lines.append(f'{name}_bucket{{le="+Inf"}} {self.count}')
+        lines.append(f"{name}_sum {self.sum:.6f}")
+        lines.append(f"{name}_count {self.count}")
+        return lines
+
+    def render(self, width: int = 40, unit: str = "s") -> list[str]:
+        """ASCII bars for the non-empty range of buckets."""
+        used = [i for i, count in enumerate(self.counts) if count]
+        if not used:
+            return []
+        peak = max(self.counts)
+        lines = []
+        for i in range(used[0], used[-1] + 1):
+            label = f"<= {self.bounds[i]:g}{unit}" if i < len(self.bounds) else "> max"
+            bar = "█" * max(1 if self.counts[i] else 0, round(width * self.counts[i] / peak))
+            lines.append(f"  {label:>12} {bar} {self.counts[i] / self.count:.1%}")
+        return lines
+
+
+@dataclass
+class RequestMetrics:
+    """Everything measured about one API request, retries included."""
+    batch_size: int
+    started: float = field(default_factory=time.monotonic)
+    attempts: int = 0
+    queue_wait: float = 0.0   # Seconds waiting for a concurrency slot, summed over attempts
+    api_latency: float = 0.0  # Seconds of the successful call
+    backoff: float = 0.0      # Seconds sleeping between retries
+    prompt_tokens: int = 0
+    cached_tokens: int = 0
+    completion_tokens: int = 0
+    parse_seconds: float = 0.0
+    validate_seconds: float = 0.0
+    returned: int = 0
+    invalid: int = 0
+    rejected: int = 0
+    dropped: int = 0          # Valid personas not written because the target was reached (or the shard lease lost)
+    accepted: int = 0
+    wasted_tokens: int = 0    # Completion tokens of output thrown away whole (aborted streams, unparseable responses)
+    rejection_seconds: float = 0.0  # Seconds from sending the request to rejecting its output
+    outcome: str = "ok"       # "ok", "parse_error", "aborted" (stream closed on invalid output), "gave_up" or "cache_miss"
+    errors: list[str] = field(default_factory=list)  # Cause of every failed attempt
+
+    def record_error(self, error: Exception, overload: bool):
+        status = getattr(getattr(error, "response", None), "status_code", None) or getattr(error, "status_code", None)
+        cause = "overload" if overload else "error"
+        self.errors.append(f"{cause}:{status or type(error).__name__}")
+
+    def to_record(self, run_start: float) -> dict:
+        """Compact JSON record (short keys, rounded seconds, empty fields omitted)."""
+        record = {
+            "t": round(self.started - run_start, 3),
+            "k": self.batch_size,
+            "att": self.attempts,
+            "wait": round(self.queue_wait, 4),
+            "lat": round(self.api_latency, 4),
+            "pt": self.prompt_tokens,
+            "ct": self.completion_tokens,
+            "cached": self.cached_tokens,
+            "parse": round(self.parse_seconds, 6),
+            "val": round(self.validate_seconds, 6),
+            "ok": self.accepted,
+            "out": self.outcome,
+        }
+        for key, value in (
+            ("backoff", round(self.backoff, 3)), ("inv", self.invalid), ("rej", self.rejected), ("drop", self.dropped), ("err", self.errors),
+            ("waste", self.wasted_tokens), ("ttr", round(self.rejection_seconds, 3)),
+        ):
+            if value:
+                record[key] = value
+        return record
+
+
+class Telemetry:
+    """Collects RequestMetrics and scheduler snapshots; see the module docstring."""
+
+    def __init__(self, metrics_path: str | None = None, prometheus_port: int | None = None, prometheus_host: str = "127.0.0.1"):
+        self.metrics_path = metrics_path
+        self.prometheus_port = prometheus_port
+        self.prometheus_host = prometheus_host
+        self.run_start = time.monotonic()
+        self.api_latency = Histogram(LATENCY_BUCKETS)
+        self.queue_wait = Histogram(WAIT_BUCKETS)
+        self.parse_seconds = Histogram(FAST_BUCKETS)
+        self.validate_seconds = Histogram(FAST_BUCKETS)
+        self.rejection_seconds = Histogram(LATENCY_BUCKETS)
+        self.outcomes: Counter = Counter()
+        self.errors: Counter = Counter()
+        self.personas: Counter = Counter()  # returned / invalid / rejected / dropped / accepted
+        self.tokens: Counter = Counter()    # prompt / cached / completion / wasted (part of completion)
+        self.attempts = 0
+        self.backoff_seconds = 0.0
+        self.scheduler_seconds = 0.0  # Time spent in the scheduler loop body (not waiting)
+        self.gauges: dict[str, float] = {}
+        self._writer = AsyncJsonlWriter(metrics_path, fsync_every=1000, fsync_interval=30.0) if metrics_path else None
+        self._server: asyncio.AbstractServer | None = None
+
+    async def start(self):
+        self.run_start = time.monotonic()
+        if self._writer is not None:
+            await self._writer.start()
+        if self.prometheus_port is not None:
+            self._server = await asyncio.start_server(self._serve_metrics, self.prometheus_host, self.prometheus_port)
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+        if self._writer is not None:
+            await self._writer.close()
+
+    def record(self, metrics: RequestMetrics):
+        self.outcomes[metrics.outcome] += 1
+        self.errors.update(metrics.errors)
+        self.attempts += metrics.attempts
+        self.backoff_seconds += metrics.backoff
+        self.queue_wait.observe(metrics.queue_wait)
+        if metrics.outcome not in ("gave_up", "aborted"):
+            self.api_latency.observe(metrics.api_latency)
+        if metrics.outcome != "gave_up":
+            self.parse_seconds.observe(metrics.parse_seconds)
+            self.validate_seconds.observe(metrics.validate_seconds)
+        if metrics.outcome in ("parse_error", "aborted"):
+            self.rejection_seconds.observe(metrics.rejection_seconds)
+        self.personas.update(returned=metrics.returned, invalid=metrics.invalid, rejected=metrics.rejected, dropped=metrics.dropped, accepted=metrics.accepted)
+        self.tokens.update(prompt=metrics.prompt_tokens, cached=metrics.cached_tokens, completion=metrics.completion_tokens, wasted=metrics.wasted_tokens)
+        if self._writer is not None:
+            self._writer.write(metrics.to_record(self.run_start))
+
+    def record_scheduler(self, limiter, tasks: int, accepted: int, loop_seconds: float, snapshot: bool = False):
+        """Updates the scheduler gauges; with `snapshot`, also writes them to the metrics file."""
+        self.scheduler_seconds += loop_seconds
+        self.gauges = {
+            "concurrency_limit": limiter.current_limit,
+            "in_flight": limiter.in_flight,
+            "backing_off": limiter.backing_off,
+            "tasks": tasks,
+            "accepted": accepted,
+        }
+        if snapshot and self._writer is not None:
+            self._writer.write({"t": round(time.monotonic() - self.run_start, 3), "sched": self.gauges, "loop_s": round(self.scheduler_seconds, 4)})
+
+    # --- Prometheus text endpoint ---
+
+    def prometheus_text(self) -> str:
+        lines = ["# TYPE spb_requests_total counter"]
+        lines += [f'spb_requests_total{{outcome="{outcome}"}} {count}' for outcome, count in sorted(self.outcomes.items())]
+        lines.append("# TYPE spb_request_errors_total counter")
+        lines += [f'spb_request_errors_total{{cause="{cause}"}} {count}' for cause, count in sorted(self.errors.items())]
+        lines.append("# TYPE spb_personas_total counter")
+        lines += [f'spb_personas_total{{result="{result}"}} {count}' for result, count in sorted(self.personas.items())]
+        lines.append("# TYPE spb_tokens_total counter")
+        lines += [f'spb_tokens_total{{kind="{kind}"}} {count}' for kind, count in sorted(self.tokens.items())]
+        lines.append("# TYPE spb_scheduler_seconds_total counter")
+        lines.append(f"spb_scheduler_seconds_total {self.scheduler_seconds:.6f}")
+        for name, value in self.gauges.items():
+            lines += [f"# TYPE spb_{name} gauge", f"spb_{name} {value}"]
+        lines += self.api_latency.prometheus("spb_api_latency_seconds")
+        lines += self.queue_wait.prometheus("spb_queue_wait_seconds")
+        lines += self.parse_seconds.prometheus("spb_parse_seconds")
+        lines += self.validate_seconds.prometheus("spb_validate_seconds")
+        lines += self.rejection_seconds.prometheus("spb_rejection_seconds")
+        return "\n".join(lines) + "\n"
+
+    async def _serve_metrics(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            request_line = await reader.readline()
+            while (await reader.readline()).strip():
+                pass  # Skip the headers
+            path = request_line.split()[1] if len(request_line.split()) > 1 else b"/"
+            if path.rstrip(b"/") in (b"", b"/metrics"):
+                status, body = "200 OK", self.prometheus_text().encode("utf-8")
+            else:
+                status, body = "404 Not Found", b"Not found\n"
+            writer.write(
+                f"HTTP/1.1 {status}\r\nContent-Type: text/plain; version=0.0.4\r\nContent-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode("ascii") + body
+            )
+            await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    # --- End-of-run report ---
+
+    def report(self, accepted: int, input_price: float | None = None, output_price: float | None = None, cached_price: float | None = None) -> str:
+        """
+        Summarizes throughput, latency, token cost per accepted persona and failures.
+        Prices are in USD per million tokens; cached input tokens use `cached_price`
+        (or the input price) when given.
+        """
+        elapsed = time.monotonic() - self.run_start
+        requests = sum(self.outcomes.values())
+        per_persona = lambda value: value / accepted if accepted else 0.0
+        share = lambda part, whole: part / whole if whole else 0.0
+        lines = [
+            "--- Run report ---",
+            f"Throughput: {share(accepted, elapsed):.2f} personas/sec, {share(requests, elapsed):.2f} requests/sec "
+            f"({accepted} accepted in {elapsed:.1f}s; scheduler busy {share(self.scheduler_seconds, elapsed):.1%} of the time)",
+            f"Requests: {requests} ({', '.join(f'{count} {outcome}' for outcome, count in self.outcomes.most_common()) or 'none'}), "
+            f"{self.attempts} attempts, {self.backoff_seconds:.1f}s in retry backoff",
+            f"Personas: {self.personas['returned']} returned, {self.personas['invalid']} invalid, "
+            f"{self.personas['rejected']} rejected as near-duplicates, "
+            + (f"{self.personas['dropped']} dropped past the target, " if self.personas['dropped'] else "")
+            + f"{self.personas['accepted']} accepted "
+            f"({share(self.personas['accepted'], self.personas['accepted'] + self.personas['invalid'] + self.personas['rejected']):.1%} yield)",
+            f"Tokens per accepted persona: {per_persona(self.tokens['prompt']):.0f} input ({share(self.tokens['cached'], self.tokens['prompt']):.0%} cached), "
+            f"{per_persona(self.tokens['completion']):.0f} output",
+        ]
+        if self.rejection_seconds.count:
+            rejection = self.rejection_seconds
+            lines.append(
+                f"Rejected output: {self.outcomes['aborted']} streams aborted, {self.outcomes['parse_error']} unparseable responses; "
+                f"{self.tokens['wasted']} output tokens wasted ({share(self.tokens['wasted'], self.tokens['completion']):.1%} of all output), "
+                f"time to rejection p50 <= {rejection.quantile(0.5):.3g}s, p90 <= {rejection.quantile(0.9):.3g}s"
+            )
+        if input_price is not None and output_price is not None:
+            cached = cached_price if cached_price is not None else input_price
+            cost = (
+                (self.tokens['prompt'] - self.tokens['cached']) * input_price
+                + self.tokens['cached'] * cached
+                + self.tokens['completion'] * output_price
+            ) / 1e6
+            lines.append(f"Cost: ${cost:.4f} total, ${per_persona(cost) * 1000:.4f} per 1000 accepted personas")
+        if self.errors:
+            lines.append("Failures by cause: " + ", ".join(f"{cause} x{count}" for cause, count in self.errors.most_common()))
+        for name, histogram, unit, scale in (
+            ("API latency", self.api_latency, "s", 1),
+            ("Queue wait", self.queue_wait, "ms", 1000),
+            ("JSON parse", self.parse_seconds, "ms", 1000),
+            ("Validation", self.validate_seconds, "ms", 1000),
+        ):
+            lines.append(
+                f"{name}: mean {histogram.mean * scale:.3g}{unit}, p50 <= {histogram.quantile(0.5) * scale:.3g}{unit}, "
+                f"p90 <= {histogram.quantile(0.9) * scale:.3g}{unit}, p99 <= {histogram.quantile(0.99) * scale:.3g}{unit}"
+            )
+        if self.api_latency.count:
+            lines.append("API latency histogram:")
+            lines += self.api_latency.render()
+        return "\n".join(lines)
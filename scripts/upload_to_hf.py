@@ -1,9 +1,19 @@
 #!/usr/bin/env python3
 
 import os
+import json
 import glob
+import time
+import hashlib
 import argparse
-from huggingface_hub import HfApi, HfFolder, login
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from huggingface_hub import CommitOperationAdd, CommitOperationDelete, HfApi, HfFolder, login
+
+from local_hub import LocalHub
+
+MANIFEST_NAME = ".upload_manifest.json"  # Written inside the shard directory, never uploaded
 
 def get_latest_processed_file(processed_dir="data/processed"):
     """Finds the most recently created .jsonl file in the processed directory."""
@@ -13,6 +23,136 @@ def get_latest_processed_file(processed_dir="data/processed"):
     latest_file = max(list_of_files, key=os.path.getctime)
     return latest_file
 
+def sha256_file(path):
+    """Hashes a file in 1 MiB blocks (the sha256 is also the LFS object id on the Hub)."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def hash_shards(shard_dir, path_in_repo, max_workers):
+    """Returns {path_in_repo: (local_path, sha256)} for every file under shard_dir, hashed in parallel."""
+    local_paths = {}
+    for root, _, names in os.walk(shard_dir):
+        for name in names:
+            if name == MANIFEST_NAME or name.endswith(".tmp"):
+                continue
+            local_path = os.path.join(root, name)
+            relative = os.path.relpath(local_path, shard_dir).replace(os.sep, '/')
+            local_paths[f"{path_in_repo.strip('/')}/{relative}" if path_in_repo else relative] = local_path
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        hashes = dict(zip(local_paths, pool.map(sha256_file, local_paths.values())))
+    return {remote: (local_paths[remote], hashes[remote]) for remote in sorted(local_paths)}
+
+class UploadManifest:
+    """
+    Local record of what was last pushed from a shard directory to a repo:
+    the committed files with their sha256, plus the blobs already uploaded
+    for a commit that has not been made yet (so an interrupted upload resumes).
+    """
+
+    def __init__(self, path, repo_id):
+        self.path = path
+        self.repo_id = repo_id
+        self.files, self.pending, self.commit = {}, {}, None
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get("repo_id") == repo_id:
+                self.files, self.pending, self.commit = data["files"], data["pending"], data.get("commit")
+
+    def mark_uploaded(self, path_in_repo, sha256):
+        with self._lock:
+            self.pending[path_in_repo] = sha256
+            self.save()
+
+    def mark_committed(self, files, commit):
+        with self._lock:
+            self.files, self.pending, self.commit = files, {}, commit
+            self.save()
+
+    def save(self):
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"repo_id": self.repo_id, "commit": self.commit, "files": self.files, "pending": self.pending}, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+class HFHubClient:
+    """Hub operations used by upload_shards, on top of HfApi (preupload first, then one commit)."""
+
+    def __init__(self, api, repo_type="dataset"):
+        self.api = api
+        self.repo_type = repo_type
+        self._operations = {}  # path_in_repo -> preuploaded CommitOperationAdd
+
+    def create_repo(self, repo_id):
+        self.api.create_repo(repo_id=repo_id, repo_type=self.repo_type, exist_ok=True)
+
+    def upload_blob(self, repo_id, path_in_repo, local_path, sha256):
+        operation = CommitOperationAdd(path_in_repo=path_in_repo, path_or_fileobj=local_path)
+        # LFS content the Hub already has (e.g. from an interrupted run) is not sent again
+        self.api.preupload_lfs_files(repo_id, additions=[operation], repo_type=self.repo_type)
+        self._operations[path_in_repo] = operation
+        return True
+
+    def create_commit(self, repo_id, additions, deletions, message):
+        operations = [
+            self._operations.get(path_in_repo) or CommitOperationAdd(path_in_repo=path_in_repo, path_or_fileobj=local_path)
+            for path_in_repo, (local_path, _) in additions.items()
+        ]
+        operations += [CommitOperationDelete(path_in_repo=path_in_repo) for path_in_repo in deletions]
+        return self.api.create_commit(repo_id, operations=operations, commit_message=message, repo_type=self.repo_type).oid
+
+def upload_shards(client, repo_id, shard_dir, path_in_repo="data", max_workers=4, message=None):
+    """
+    Pushes a shard directory as a single commit, sending only the files whose
+    content changed since the last push recorded in the shard directory's
+    manifest. Blobs are uploaded with bounded parallelism and recorded as they
+    finish, so re-running after an interruption skips them.
+    """
+    manifest = UploadManifest(os.path.join(shard_dir, MANIFEST_NAME), repo_id)
+    start = time.perf_counter()
+    local = hash_shards(shard_dir, path_in_repo, max_workers)
+    print(f"Hashed {len(local)} file(s) in {time.perf_counter() - start:.1f}s.")
+
+    changed = {remote: entry for remote, entry in local.items() if manifest.files.get(remote) != entry[1]}
+    deleted = sorted(remote for remote in manifest.files if remote not in local)
+    if not changed and not deleted:
+        print("✅ Nothing to upload: the repository already matches the shard directory.")
+        return None
+
+    total_bytes = sum(os.path.getsize(local_path) for local_path, _ in local.values())
+    delta_bytes = sum(os.path.getsize(local_path) for local_path, _ in changed.values())
+    to_upload = {remote: entry for remote, entry in changed.items() if manifest.pending.get(remote) != entry[1]}
+    print(
+        f"{len(changed)} changed and {len(deleted)} deleted file(s): {delta_bytes / 1e6:.1f} MB of {total_bytes / 1e6:.1f} MB"
+        + (f" ({len(changed) - len(to_upload)} already uploaded by an interrupted run)" if len(to_upload) < len(changed) else "")
+    )
+
+    client.create_repo(repo_id)
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = {
+            pool.submit(client.upload_blob, repo_id, remote, local_path, sha256): (remote, sha256)
+            for remote, (local_path, sha256) in to_upload.items()
+        }
+        for done, future in enumerate(as_completed(futures), start=1):
+            remote, sha256 = futures[future]
+            future.result()
+            manifest.mark_uploaded(remote, sha256)
+            print(f"   ⬆️ [{done}/{len(futures)}] {remote}")
+
+    commit = client.create_commit(
+        repo_id,
+        changed,
+        deleted,
+        message or f"Update {len(changed)} file(s), delete {len(deleted)} file(s)",
+    )
+    manifest.mark_committed({remote: sha256 for remote, (_, sha256) in local.items()}, commit)
+    print(f"✅ Committed {len(changed) + len(deleted)} change(s) in {time.perf_counter() - start:.1f}s (commit {commit}).")
+    return commit
+
 def main():
     parser = argparse.ArgumentParser(description="Upload a dataset to the Hugging Face Hub.")
     parser.add_argument(
@@ -38,9 +178,33 @@ def main():
         default=None,
         help="Your Hugging Face API token. If not provided, it will try to use the cached token or prompt for login."
     )
+    parser.add_argument(
+        "--shard_dir",
+        type=str,
+        default=None,
+        help="Directory of shards to push (e.g. from export.uv.py). Only files changed since the last push are uploaded, in a single commit."
+    )
+    parser.add_argument("--path_in_repo", type=str, default="data", help="Folder of the repository the shard directory is uploaded to.")
+    parser.add_argument("--max_workers", type=int, default=4, help="Parallel hashing and upload workers.")
+    parser.add_argument("--commit_message", type=str, default=None)
+    parser.add_argument(
+        "--local_hub",
+        type=str,
+        default=None,
+        help="Push --shard_dir to a local stand-in for the Hub in this directory instead (for testing; no login needed)."
+    )
 
     args = parser.parse_args()
 
+    if args.local_hub:
+        if not args.shard_dir:
+            print("❌ Error: --local_hub requires --shard_dir.")
+            return
+        repo_id = f"{args.hf_username or 'local'}/{args.repo_name}"
+        print(f"Preparing to upload to local hub repository: {repo_id} in '{args.local_hub}'")
+        upload_shards(LocalHub(args.local_hub), repo_id, args.shard_dir, args.path_in_repo, args.max_workers, args.commit_message)
+        return
+
     # --- 1. Authenticate ---
     # You can either pass the token as an argument or log in via the CLI: `huggingface-cli login`
     if args.token:
@@ -73,6 +237,17 @@ def main():
 
     print(f"Preparing to upload to repository: {repo_id}")
 
+    if args.shard_dir:
+        if not os.path.isdir(args.shard_dir):
+            print(f"❌ Error: The specified shard directory does not exist: {args.shard_dir}")
+            return
+        try:
+            upload_shards(HFHubClient(api), repo_id, args.shard_dir, args.path_in_repo, args.max_workers, args.commit_message)
+            print(f"Check out your dataset at: https://huggingface.co/datasets/{repo_id}")
+        except Exception as e:
+            print(f"❌ An error occurred during upload: {e}. Re-run the same command to resume.")
+        return
+
     # --- 3. Find the file to upload ---
     file_to_upload = args.file_path
     if not file_to_upload:
@@ -0,0 +1,227 @@
+"""
+SQLite work queue for sharded generation runs.
+
+A sharded run splits its target into shards, each with its own persona count,
+seed and output file. Workers (processes on one machine, or on several machines
+sharing the run directory) claim one shard at a time under a lease that they
+renew while generating. A worker that crashes stops renewing, and once its
+lease expires the shard is handed to the next worker that asks, which resumes
+the shard's output file where it stopped. All state changes run in
+`BEGIN IMMEDIATE` transactions, so two workers never hold the same shard.
+
+The queue lives next to the shard files:
+
+    data/raw/data_<model>_<timestamp>/queue.sqlite
+    data/raw/data_<model>_<timestamp>/shard-00000.jsonl
+    ...
+
+Across machines, the run directory must be on a filesystem with working POSIX
+locks (SQLite over NFS often lacks them); see the SQLite FAQ on network files.
+"""
+
+import os
+import time
+import asyncio
+import socket
+import sqlite3
+import hashlib
+from dataclasses import dataclass
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS shards (
+    shard_id INTEGER PRIMARY KEY,
+    target INTEGER NOT NULL,
+    seed INTEGER NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',  -- pending, leased or done
+    worker TEXT,
+    lease_expires REAL,
+    generated INTEGER NOT NULL DEFAULT 0,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    updated_at REAL
+);
+"""
+
+
+def default_worker_id() -> str:
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+def shard_seed(base_seed: int, shard_id: int) -> int:
+    """Seed of one shard, derived from the run seed so shards draw independent streams."""
+    digest = hashlib.blake2b(f"{base_seed}:{shard_id}".encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "big") >> 1
+
+
+@dataclass
+class Shard:
+    shard_id: int
+    target: int      # Personas this shard must contribute
+    seed: int
+    generated: int   # Personas recorded at the last renewal (the output file is authoritative)
+    attempts: int    # Number of times the shard was claimed, including this one
+    path: str        # Output JSONL of the shard
+
+
+class WorkQueue:
+    def __init__(self, run_dir: str, lease_seconds: float = 120.0, busy_timeout: float = 30.0):
+        self.run_dir = run_dir
+        self.lease_seconds = lease_seconds  # A shard not renewed for this long can be reclaimed
+        os.makedirs(run_dir, exist_ok=True)
+        self.path = os.path.join(run_dir, "queue.sqlite")
+        # Autocommit mode: transactions are opened explicitly with BEGIN IMMEDIATE
+        self._db = sqlite3.connect(self.path, timeout=busy_timeout, isolation_level=None, check_same_thread=False)
+        self._db.executescript(SCHEMA)
+
+    def close(self):
+        self._db.close()
+
+    def _transaction(self):
+        self._db.execute("BEGIN IMMEDIATE")
+        return self._db
+
+    def shard_path(self, shard_id: int) -> str:
+        return os.path.join(self.run_dir, f"shard-{shard_id:05d}.jsonl")
+
+    def create(self, target_n: int, num_shards: int, seed: int | None = None) -> int:
+        """
+        Splits target_n personas into num_shards shards, unless the queue already holds
+        a run (then its settings must match). Returns the run's base seed.
+        """
+        if num_shards < 1 or target_n < num_shards:
+            raise ValueError("Need at least one shard and at least one persona per shard.")
+        db = self._transaction()
+        try:
+            meta = dict(db.execute("SELECT key, value FROM meta").fetchall())
+            if meta:
+                if int(meta["target_n"]) != target_n or int(meta["num_shards"]) != num_shards:
+                    raise ValueError(
+                        f"'{self.path}' holds a run of {meta['target_n']} personas in {meta['num_shards']} shards, "
+                        f"not {target_n} in {num_shards}."
+                    )
+                db.execute("COMMIT")
+                return int(meta["seed"])
+            if seed is None:
+                seed = int.from_bytes(os.urandom(8), "big") >> 1
+            db.executemany(
+                "INSERT INTO meta (key, value) VALUES (?, ?)",
+                [("target_n", str(target_n)), ("num_shards", str(num_shards)), ("seed", str(seed)), ("created_at", str(time.time()))],
+            )
+            base, extra = divmod(target_n, num_shards)
+            db.executemany(
+                "INSERT INTO shards (shard_id, target, seed, updated_at) VALUES (?, ?, ?, ?)",
+                [(i, base + (i < extra), shard_seed(seed, i), time.time()) for i in range(num_shards)],
+            )
+            db.execute("COMMIT")
+            return seed
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+
+    def claim(self, worker: str) -> Shard | None:
+        """Leases the first pending shard, or one whose lease expired. Returns None if there is none."""
+        db = self._transaction()
+        try:
+            now = time.time()
+            row = db.execute(
+                "SELECT shard_id, target, seed, generated, attempts, worker FROM shards "
+                "WHERE status = 'pending' OR (status = 'leased' AND lease_expires < ?) "
+                "ORDER BY status = 'leased', shard_id LIMIT 1",
+                (now,),
+            ).fetchone()
+            if row is None:
+                db.execute("COMMIT")
+                return None
+            shard_id, target, seed, generated, attempts, previous = row
+            db.execute(
+                "UPDATE shards SET status = 'leased', worker = ?, lease_expires = ?, attempts = attempts + 1, updated_at = ? "
+                "WHERE shard_id = ?",
+                (worker, now + self.lease_seconds, now, shard_id),
+            )
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        if previous and previous != worker:
+            print(f"♻️ Reclaimed shard {shard_id} from '{previous}' (lease expired).")
+        return Shard(shard_id, target, seed, generated, attempts + 1, self.shard_path(shard_id))
+
+    def _update(self, shard_id: int, worker: str, assignments: str, params: tuple) -> bool:
+        db = self._transaction()
+        try:
+            cursor = db.execute(
+                f"UPDATE shards SET {assignments}, updated_at = ? WHERE shard_id = ? AND worker = ? AND status = 'leased'",
+                params + (time.time(), shard_id, worker),
+            )
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        return cursor.rowcount == 1
+
+    def renew(self, shard_id: int, worker: str, generated: int) -> bool:
+        """Extends the lease. Returns False if the worker no longer holds it (it expired and was reclaimed)."""
+        return self._update(shard_id, worker, "lease_expires = ?, generated = ?", (time.time() + self.lease_seconds, generated))
+
+    def complete(self, shard_id: int, worker: str, generated: int) -> bool:
+        return self._update(shard_id, worker, "status = 'done', lease_expires = NULL, generated = ?", (generated,))
+
+    def release(self, shard_id: int, worker: str, generated: int) -> bool:
+        """Hands an unfinished shard back right away (e.g. on Ctrl-C) instead of waiting for the lease to expire."""
+        return self._update(shard_id, worker, "status = 'pending', worker = NULL, lease_expires = NULL, generated = ?", (generated,))
+
+    def next_expiry(self) -> float | None:
+        """Seconds until the next active lease expires (0 if one already has), or None once every shard is done."""
+        pending, expiry = self._db.execute(
+            "SELECT SUM(status = 'pending'), MIN(CASE WHEN status = 'leased' THEN lease_expires END) FROM shards"
+        ).fetchone()
+        if pending:
+            return 0.0
+        if expiry is None:
+            return None
+        return max(0.0, expiry - time.time())
+
+    def summary(self) -> str:
+        counts = dict(self._db.execute("SELECT status, COUNT(*) FROM shards GROUP BY status").fetchall())
+        generated, target = self._db.execute("SELECT SUM(generated), SUM(target) FROM shards").fetchone()
+        return (
+            f"shards: {counts.get('done', 0)} done, {counts.get('leased', 0)} leased, {counts.get('pending', 0)} pending; "
+            f"{generated or 0}/{target or 0} personas recorded"
+        )
+
+
+class Lease:
+    """A claimed shard, renewed from the generation loop while it runs."""
+
+    def __init__(self, queue: WorkQueue, shard: Shard, worker: str, renew_every: float | None = None):
+        self.queue = queue
+        self.shard = shard
+        self.worker = worker
+        self.renew_every = renew_every or queue.lease_seconds / 4
+        self.generated = shard.generated
+        self.lost = False
+        self._renewed = time.monotonic()
+
+    async def keep_alive(self, generated: int) -> bool:
+        """
+        Renews the lease when due, in a thread so a locked database does not stall the
+        event loop. Returns False once it was lost to another worker. Called before each
+        batch of results is written, so a worker that stalled past its lease stops
+        instead of appending to a shard another worker has reclaimed.
+        """
+        self.generated = generated
+        if not self.lost and time.monotonic() - self._renewed >= self.renew_every:
+            started = time.monotonic()  # The new expiry counts from no earlier than this
+            self.lost = not await asyncio.to_thread(self.queue.renew, self.shard.shard_id, self.worker, generated)
+            self._renewed = started
+        return not self.lost
+
+    def finish(self, generated: int):
+        """Marks the shard done if it reached its target, otherwise hands it back to the queue."""
+        self.generated = max(self.generated, generated)
+        if self.lost:
+            return
+        if self.generated >= self.shard.target:
+            self.queue.complete(self.shard.shard_id, self.worker, self.generated)
+        else:
+            self.queue.release(self.shard.shard_id, self.worker, self.generated)